@@ -1,14 +1,14 @@
 from strands import tool
-from database.general import general_engine
-from gateway.models import Module
-from sqlmodel import Session, select
+from gateway.module_registry import module_registry
 
 
 @tool(name="available_modules", description="List all available modules in the system.")
-def available_modules() -> list:
+async def available_modules() -> list:
     """
     List all available modules in the system.
 
+    Modules are served from the in-memory module registry, disabled modules are not listed.
+
     Args:
         (no inputs required) - tool input can be empty
 
@@ -24,12 +24,8 @@ def available_modules() -> list:
         Error: Returns information about what went wrong.
     """
     try:
-        with Session(general_engine) as session:
-            modules = session.exec(select(Module)).unique()
-            modules_json = [module.to_json() for module in modules]
-
         # Return only the 'content' value as requested by the new contract
-        return [{"json": modules_json}]
+        return [{"json": await module_registry.modules()}]
     except Exception as e:
         return [{"text": str(e)}]
 
@@ -0,0 +1,12 @@
+# Declares the enums used by the agent tools
+
+from enum import Enum
+
+
+class ExecutorKind(str, Enum):
+    """
+    Enum representing the kind of worker pool that runs CPU-bound image work.
+    """
+
+    THREAD = "thread"  # NumPy, OpenCV and Pillow release the GIL in their hot loops
+    PROCESS = "process"  # Full isolation, at the cost of pickling images across processes
@@ -0,0 +1,78 @@
+"""
+Frame Cache for RPA Recovery Framework
+
+Serves repeated screenshot requests of a recovery session from memory.
+
+The screen of a robot only changes when it runs an action, so every channel
+counts its action epochs: the epoch increments whenever code is sent to the robot.
+A screenshot is reused by any request made in the same epoch, as long as it is
+younger than `SCREENSHOT_CACHE_MAX_AGE` seconds (the UI may still be settling
+after the last action). Concurrent requests in the same epoch share one capture.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+import metrics
+from settings import SCREENSHOT_CACHE_MAX_AGE
+
+lookups = metrics.counter(
+    "screenshot_cache.lookups", "Screenshot requests, by result (hit or miss)"
+)
+time_saved = metrics.histogram(
+    "screenshot_cache.time_saved",
+    "Capture round trip avoided by a screenshot served from the cache",
+    "s",
+)
+
+
+class FrameCache:
+    """
+    Last screenshot of a robot channel, with the action epoch it was taken in.
+    """
+
+    def __init__(self, max_age: float = SCREENSHOT_CACHE_MAX_AGE):
+        self.max_age = max_age
+        self._frame: Optional[bytes] = None
+        self._epoch = -1
+        self._captured_at = 0.0
+        self._capture_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get_or_capture(
+        self, epoch: int, capture: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        """
+        Return the screenshot of an action epoch, capturing it if needed.
+
+        Args:
+            epoch (int): Current action epoch of the channel
+            capture (Callable): Takes a new screenshot
+
+        Returns:
+            bytes: The screenshot
+        """
+        if self.max_age <= 0:
+            return await capture()
+        async with self._lock:
+            if self._fresh(epoch):
+                lookups.add(result="hit")
+                time_saved.record(self._capture_seconds)
+                return self._frame
+
+            lookups.add(result="miss")
+            started = time.monotonic()
+            frame = await capture()
+            self._frame = frame
+            self._epoch = epoch
+            self._captured_at = time.monotonic()
+            self._capture_seconds = self._captured_at - started
+            return frame
+
+    def _fresh(self, epoch: int) -> bool:
+        return (
+            self._frame is not None
+            and self._epoch == epoch
+            and time.monotonic() - self._captured_at <= self.max_age
+        )
@@ -6,16 +6,58 @@ import numpy as np
 from skimage.metrics import structural_similarity as ssim
 import cv2
 from io import BytesIO
-from pyautogui import screenshot
 import asyncio
 import json
+import logging
+import random
+import time
+from functools import partial
+
+import metrics
+from agent_tools.image_prep import prepare_screenshot
+from agent_tools.image_service import image_service
+from agent_tools.screenshot_store import Screenshot, screenshot_store
+from gateway.budget import budget_stage
+from providers.enums import ModelRole
+from settings import (
+    IMAGE_COMPARE_MAD_CHANGED,
+    IMAGE_COMPARE_MAD_UNCHANGED,
+    IMAGE_COMPARE_SHADOW_RATE,
+    IMAGE_COMPARE_SSIM_REDUCTION,
+    IMAGE_SIMILARITY_THRESHOLD,
+    SCREENSHOT_PUSH_WAIT,
+)
+
+logger = logging.getLogger(__name__)
 
+MAD_THUMBNAIL = (160, 90)  # Size of the thumbnails compared by mean absolute difference
 
-IMAGE_SIMILARITY_THRESHOLD = 0.95  # Threshold for image similarity (0 to 1)
+IMREAD_REDUCED_GRAYSCALE = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+comparisons = metrics.counter(
+    "image_compare.comparisons",
+    "Screenshot comparisons, by the tier that decided them (exact, mad or ssim)",
+)
+comparison_latency = metrics.histogram(
+    "image_compare.latency", "Time to compare two screenshots, by deciding tier", "s"
+)
+comparison_mismatches = metrics.counter(
+    "image_compare.mismatches",
+    "Sampled comparisons decided differently by full resolution SSIM, by deciding tier",
+)
+screenshot_latency = metrics.histogram(
+    "robot.screenshot_latency",
+    "Time to get a new screenshot, by source (push, pull or local)",
+    "s",
+)
 
 
 @tool(description="Convert an image file to a base64-encoded string.")
-def image_to_base64(image_path: str) -> list:
+async def image_to_base64(image_path: str) -> list:
     """
     Convert an image file to a base64-encoded string.
 
@@ -37,23 +79,29 @@ def image_to_base64(image_path: str) -> list:
         return [{"text": "image_path is required"}]
 
     try:
-        with open(image_path, "rb") as image_file:
-            # convert to jpeg format
-            pil_image = Image.open(image_file)
-            if pil_image.mode != "RGB":
-                pil_image = pil_image.convert("RGB")
-
-            # Save the image to a bytes buffer
-            buffer = BytesIO()
-            pil_image.save(buffer, format="JPEG")
-
-            encoded_string = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
+        encoded_string = await image_service.run(
+            "to_base64", file_to_base64_jpeg, image_path
+        )
         return [{"text": encoded_string}]
     except Exception as e:
         return [{"text": f"Error reading/converting image: {str(e)}"}]
 
 
+def file_to_base64_jpeg(image_path: str) -> str:
+    """Read an image file and return it as a base64-encoded JPEG. Blocking."""
+    with open(image_path, "rb") as image_file:
+        # convert to jpeg format
+        pil_image = Image.open(image_file)
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+
+        # Save the image to a bytes buffer
+        buffer = BytesIO()
+        pil_image.save(buffer, format="JPEG")
+
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
 @tool(
     description="Take a screenshot and return it as a base64-encoded string.",
     context=True,
@@ -80,17 +128,16 @@ async def take_screenshot(tool_context: ToolContext) -> list:
     assert "websocket" in tool_context.invocation_state, (
         "WebSocket connection is required in tool context for taking screenshot."
     )
-    websocket = tool_context.invocation_state["websocket"]
 
     try:
-        return [
-            {
-                "image": {
-                    "format": "JPEG",
-                    "source": {"bytes": await screenshot_bytes(websocket)},
-                }
-            }
+        image = await session_screenshot(tool_context.invocation_state)
+        # Taken by the vision tool agents
+        content = [
+            (await prepare_screenshot(image, ModelRole.VISION_TOOL)).content_block()
         ]
+        if image.ref:
+            content.append({"text": f"Screenshot reference: {image.ref}"})
+        return content
     except Exception as e:
         return [{"text": f"Error taking screenshot: {str(e)}"}]
 
@@ -99,7 +146,7 @@ async def compare_images(
     before_image: bytes, expected_change: bool, websocket: WebSocket
 ) -> bool:
     """
-    Compare two images and determine if they are identical.
+    Take a screenshot and compare it with an earlier one to check whether the UI changed.
 
     Args:
         before_image (bytes): The image bytes taken before the robot action. This one should be present in the chat history.
@@ -109,26 +156,39 @@ async def compare_images(
         bool: True if the comparison matches the expectation, False otherwise.
     """
     try:
-        after_image_cv2 = cv2.imdecode(
-            np.frombuffer(await screenshot_bytes(websocket), np.uint8),
-            cv2.IMREAD_GRAYSCALE,
-        )
-        before_image_cv2 = cv2.imdecode(
-            np.frombuffer(before_image, np.uint8), cv2.IMREAD_GRAYSCALE
-        )
-        # assert before_image.shape == after_image_cv2.shape, (
-        #     "Images must be the same size."
-        # )
-
-        # Compute SSIM between two images
-        ssim_index, _ = ssim(
-            before_image_cv2,
-            after_image_cv2,
-            full=True,
-            multichannel=True,
-        )
-
-        return (ssim_index < IMAGE_SIMILARITY_THRESHOLD) == expected_change
+        after_image = await screenshot_bytes(websocket)
+        started = time.perf_counter()
+        if before_image == after_image:
+            changed, tier = False, "exact"
+        else:
+            # Optional work: when overloaded, the agent judges the screenshot itself
+            changed, tier = await image_service.run(
+                "compare", detect_change, before_image, after_image, required=False
+            )
+        comparisons.add(tier=tier, changed=changed)
+        comparison_latency.record(time.perf_counter() - started, tier=tier)
+
+        # Check the cheaper tiers against the full resolution SSIM they replace
+        if (
+            tier != "exact"
+            and IMAGE_COMPARE_SHADOW_RATE
+            and random.random() < IMAGE_COMPARE_SHADOW_RATE
+        ):
+            started = time.perf_counter()
+            reference = await image_service.run(
+                "compare", detect_change_full, before_image, after_image, required=False
+            )
+            comparison_latency.record(time.perf_counter() - started, tier="reference")
+            if reference != changed:
+                comparison_mismatches.add(tier=tier)
+                logger.warning(
+                    "Screenshot change decided by %s tier (%s) differs from full SSIM (%s)",
+                    tier,
+                    changed,
+                    reference,
+                )
+
+        return changed == expected_change
 
     except Exception as _:
         raise ValueError(
@@ -136,6 +196,82 @@ async def compare_images(
         )
 
 
+def detect_change(before_image: bytes, after_image: bytes) -> tuple[bool, str]:
+    """
+    Check whether two screenshots show a different UI, with the cheapest conclusive test.
+
+    1. Identical bytes: no change.
+    2. Mean absolute difference of small grayscale thumbnails: no change below
+       `IMAGE_COMPARE_MAD_UNCHANGED`, change above `IMAGE_COMPARE_MAD_CHANGED`.
+    3. SSIM of the images decoded at 1/`IMAGE_COMPARE_SSIM_REDUCTION` of their size,
+       against `IMAGE_SIMILARITY_THRESHOLD`.
+
+    Blocking (JPEG decoding and SSIM), run it through the image service.
+
+    Args:
+        before_image (bytes): Encoded screenshot taken before the robot action
+        after_image (bytes): Encoded screenshot taken after the robot action
+
+    Returns:
+        tuple[bool, str]: Whether the UI changed, and the tier that decided it
+    """
+    tier, changed = "exact", False
+    if before_image != after_image:
+        before = _decode_reduced(before_image)
+        after = _decode_reduced(after_image)
+        tier, changed = "mad", None
+        if before.shape == after.shape:
+            mad = float(
+                np.mean(
+                    cv2.absdiff(
+                        cv2.resize(before, MAD_THUMBNAIL, interpolation=cv2.INTER_AREA),
+                        cv2.resize(after, MAD_THUMBNAIL, interpolation=cv2.INTER_AREA),
+                    )
+                )
+            )
+            if mad <= IMAGE_COMPARE_MAD_UNCHANGED:
+                changed = False
+            elif mad >= IMAGE_COMPARE_MAD_CHANGED:
+                changed = True
+        else:
+            # A resized screen is a change, and SSIM needs images of the same size
+            changed = True
+
+        if changed is None:
+            tier = "ssim"
+            ssim_index = ssim(before, after, data_range=255)
+            changed = bool(ssim_index < IMAGE_SIMILARITY_THRESHOLD)
+
+    return changed, tier
+
+
+def detect_change_full(before_image: bytes, after_image: bytes) -> bool:
+    """
+    Check whether two screenshots show a different UI with the SSIM of the full
+    resolution images, the reference for the tiers of `detect_change`. Blocking.
+
+    Args:
+        before_image (bytes): Encoded screenshot taken before the robot action
+        after_image (bytes): Encoded screenshot taken after the robot action
+
+    Returns:
+        bool: Whether the UI changed
+    """
+    before = cv2.imdecode(np.frombuffer(before_image, np.uint8), cv2.IMREAD_GRAYSCALE)
+    after = cv2.imdecode(np.frombuffer(after_image, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if before.shape != after.shape:
+        return True
+    return bool(ssim(before, after, data_range=255) < IMAGE_SIMILARITY_THRESHOLD)
+
+
+def _decode_reduced(image: bytes) -> np.ndarray:
+    """Decode an image in grayscale, letting the JPEG decoder downscale it."""
+    return cv2.imdecode(
+        np.frombuffer(image, np.uint8),
+        IMREAD_REDUCED_GRAYSCALE.get(IMAGE_COMPARE_SSIM_REDUCTION, cv2.IMREAD_GRAYSCALE),
+    )
+
+
 async def request_remote_screenshot(
     websocket: WebSocket, timeout: float = 15.0
 ) -> bytes:
@@ -160,9 +296,11 @@ async def request_remote_screenshot(
         RuntimeError: For unexpected message formats or disconnections.
     """
 
-    await websocket.send_json({"type": "request_screenshot", "content": ""})
-
     try:
+        request_screenshot = getattr(websocket, "request_screenshot", None)
+        if request_screenshot is not None:
+            return await request_screenshot(timeout)
+        await websocket.send_json({"type": "request_screenshot", "content": ""})
         data = await asyncio.wait_for(websocket.receive_bytes(), timeout=timeout)
         return data
     except TimeoutError:
@@ -171,20 +309,76 @@ async def request_remote_screenshot(
         raise RuntimeError(f"Unable to interpret client response as image: {e}")
 
 
-async def screenshot_bytes(websocket: WebSocket) -> bytes:
+async def screenshot_bytes(websocket: WebSocket) -> Screenshot:
     """
-    Take a screenshot and return it as bytes.
+    Take a screenshot, keep it in the screenshot store and return it as bytes.
+
+    Screenshots requested again before the robot runs another action are served
+    from the frame cache of the robot channel, if any.
 
     Args:
         websocket (WebSocket): WebSocket connection to RPA robot
 
     Returns:
-        bytes: Screenshot image data in bytes.
+        Screenshot: Screenshot image data in bytes, with its reference in the store.
 
     Usage:
         screenshot_data = await screenshot_bytes(websocket)
     """
+    frames = getattr(websocket, "frames", None)
+    if frames is None:
+        return await capture_screenshot(websocket)
+    return await frames.get_or_capture(
+        websocket.action_epoch, partial(capture_screenshot, websocket)
+    )
+
+
+async def capture_screenshot(websocket: WebSocket) -> Screenshot:
+    """
+    Take a new screenshot and keep it in the screenshot store.
+
+    Screenshots pushed by the robot since its last action are used as they are,
+    waiting up to `SCREENSHOT_PUSH_WAIT` seconds for robots that push them, and
+    pulled from the robot otherwise. The local screen is only captured without a
+    robot channel.
+    """
+    started = time.perf_counter()
+    pushed_screenshot = getattr(websocket, "pushed_screenshot", None)
+    if pushed_screenshot is not None:
+        data = await pushed_screenshot(SCREENSHOT_PUSH_WAIT)
+        if data is not None:
+            screenshot_latency.record(time.perf_counter() - started, source="push")
+            return await screenshot_store.put(data)
+
+    if websocket is None:
+        data = await image_service.run("capture", capture_local_screenshot)
+        screenshot_latency.record(time.perf_counter() - started, source="local")
+        return await screenshot_store.put(data)
+
+    data = await request_remote_screenshot(websocket)
+    screenshot_latency.record(time.perf_counter() - started, source="pull")
+    return await screenshot_store.put(data)
+
+
+def capture_local_screenshot() -> bytes:
+    """Take a screenshot of the local screen and encode it as JPEG. Blocking."""
+    # Needs a display, only imported by gateways that run next to the robot
+    from pyautogui import screenshot
+
     buffer = BytesIO()
     screenshot().save(buffer, format="JPEG")
     return buffer.getvalue()
-    return await request_remote_screenshot(websocket)
+
+
+async def session_screenshot(state: dict) -> Screenshot:
+    """
+    Take a screenshot of the robot of a recovery session, within the session budget.
+
+    Args:
+        state (dict): Session state of the recovery (websocket connection to the RPA robot, budget...)
+
+    Returns:
+        Screenshot: Screenshot image data in bytes, with its reference in the store.
+    """
+    async with budget_stage(state, "screenshot"):
+        return await screenshot_bytes(state["websocket"])
@@ -0,0 +1,172 @@
+"""
+Screenshot Preparation for RPA Recovery Framework
+
+Resizes and encodes screenshots for the model role they are sent to, instead of
+sending full-resolution JPEGs to every model.
+
+Each role has an image profile (see `IMAGE_PROFILES` in settings): a pixel budget,
+codec and quality, and how many pixels make an image token for its models.
+Screenshots are resized with `smart_resize` (cached per resolution by
+`resize_geometry`), the same geometry the grounding parser uses to map coordinates back to the screen. As long as the parser gets the
+original screenshot size and the role's pixel budget (see `PreparedImage.parse_kwargs`),
+the coordinates it produces stay exact.
+"""
+
+import math
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image
+
+import metrics
+from agent_tools.image_service import image_service
+from modules.uierror.uitars import IMAGE_FACTOR, MIN_PIXELS, resize_geometry
+from providers.enums import ModelRole
+from settings import IMAGE_PROFILES
+
+image_bytes = metrics.histogram(
+    "image_prep.bytes", "Size of the screenshots sent to models, by role and stage", "By"
+)
+image_tokens = metrics.histogram(
+    "image_prep.tokens",
+    "Estimated image tokens of the screenshots sent to models, by role and stage",
+)
+
+PIL_FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+
+@dataclass(frozen=True)
+class ImageProfile:
+    """
+    How screenshots are prepared for the models of a role.
+    """
+
+    max_pixels: int
+    format: str = "jpeg"
+    quality: int = 85
+    pixels_per_token: int = 784
+    min_pixels: int = MIN_PIXELS
+    factor: int = IMAGE_FACTOR
+
+    def tokens(self, width: int, height: int) -> int:
+        """Estimate the image tokens of an image of the given size."""
+        return math.ceil(width * height / self.pixels_per_token)
+
+
+ROLE_IMAGE_PROFILES = {
+    ModelRole(role): ImageProfile(**profile) for role, profile in IMAGE_PROFILES.items()
+}
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """
+    A screenshot resized and encoded for a model role.
+    """
+
+    data: bytes
+    format: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    profile: ImageProfile
+
+    def content_block(self) -> dict:
+        """Return the image as a content block of an agent message."""
+        return {"image": {"format": self.format, "source": {"bytes": self.data}}}
+
+    def parse_kwargs(self) -> dict:
+        """
+        Return the arguments `parse_actions` needs to map the
+        coordinates of this image back to relative screen coordinates.
+        """
+        return {
+            "origin_resized_height": self.original_height,
+            "origin_resized_width": self.original_width,
+            "factor": self.profile.factor,
+            "max_pixels": self.profile.max_pixels,
+            "min_pixels": self.profile.min_pixels,
+        }
+
+
+def prepare_image(data: bytes, profile: ImageProfile) -> PreparedImage:
+    """
+    Resize and encode an image for a profile. Blocking, run it through the image service.
+
+    Args:
+        data (bytes): Encoded screenshot
+        profile (ImageProfile): Profile of the model role the image is sent to
+
+    Returns:
+        PreparedImage: The prepared image, with its original size
+    """
+    image = Image.open(BytesIO(data))
+    original_width, original_height = image.size
+    height, width = resize_geometry(
+        original_height,
+        original_width,
+        profile.factor,
+        profile.min_pixels,
+        profile.max_pixels,
+    )
+
+    if (width, height) == image.size and image.format == PIL_FORMATS[profile.format]:
+        # Already in shape, re-encoding would only lose quality
+        encoded = data
+    else:
+        if (width, height) != image.size:
+            # Let the JPEG decoder downscale large reductions while decoding
+            image.draft("RGB", (width, height))
+            image = image.convert("RGB").resize(
+                (width, height), Image.Resampling.LANCZOS
+            )
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = BytesIO()
+        if profile.format == "png":
+            image.save(buffer, format="PNG")
+        else:
+            image.save(
+                buffer, format=PIL_FORMATS[profile.format], quality=profile.quality
+            )
+        encoded = buffer.getvalue()
+
+    return PreparedImage(
+        data=encoded,
+        format=profile.format,
+        width=width,
+        height=height,
+        original_width=original_width,
+        original_height=original_height,
+        profile=profile,
+    )
+
+
+async def prepare_screenshot(screenshot: bytes, role: ModelRole) -> PreparedImage:
+    """
+    Prepare a screenshot for the models of a role.
+
+    Args:
+        screenshot (bytes): Encoded screenshot, as taken
+        role (ModelRole): Role of the model the screenshot is sent to
+
+    Returns:
+        PreparedImage: The prepared screenshot
+    """
+    profile = ROLE_IMAGE_PROFILES[role]
+    prepared = await image_service.run("prepare", prepare_image, bytes(screenshot), profile)
+
+    image_bytes.record(len(screenshot), role=role.value, stage="original")
+    image_bytes.record(len(prepared.data), role=role.value, stage="prepared")
+    image_tokens.record(
+        profile.tokens(prepared.original_width, prepared.original_height),
+        role=role.value,
+        stage="original",
+    )
+    image_tokens.record(
+        profile.tokens(prepared.width, prepared.height),
+        role=role.value,
+        stage="prepared",
+    )
+    return prepared
@@ -0,0 +1,142 @@
+"""
+Image Processing Service for RPA Recovery Framework
+
+Runs the CPU-bound image work of the agent tools (JPEG encoding and decoding,
+screenshot comparison) in a dedicated worker pool, so it does not stall the event
+loop serving every robot websocket.
+
+The pool is a thread pool by default, as NumPy, OpenCV and Pillow release the GIL
+while they work, or a process pool (`IMAGE_EXECUTOR=process`). Work submitted to a
+process pool must be a module-level function taking and returning picklable values.
+
+At most `IMAGE_MAX_QUEUE` operations are queued or running. Beyond that, optional
+work is rejected at once with `ImageServiceOverloaded`, so callers can degrade (e.g.
+skip a verification), while required work waits up to `IMAGE_QUEUE_TIMEOUT`
+seconds for a slot.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+import metrics
+from agent_tools.enums import ExecutorKind
+from settings import IMAGE_EXECUTOR, IMAGE_MAX_QUEUE, IMAGE_QUEUE_TIMEOUT, IMAGE_WORKERS
+
+T = TypeVar("T")
+
+queue_depth = metrics.gauge(
+    "image_service.queue_depth", "Image operations queued or running in the image service"
+)
+wait_time = metrics.histogram(
+    "image_service.wait", "Time image operations waited for a worker, by operation", "s"
+)
+latency = metrics.histogram(
+    "image_service.latency", "Time image operations took to run, by operation", "s"
+)
+rejected = metrics.counter(
+    "image_service.rejected", "Image operations rejected by an overloaded service, by operation"
+)
+
+
+class ImageServiceOverloaded(RuntimeError):
+    """Raised when the image service has no room for an operation."""
+
+    def __init__(self, op: str):
+        super().__init__(f"Image service overloaded, could not run {op}")
+        self.op = op
+
+
+class ImageProcessingService:
+    """
+    Bounded worker pool for CPU-bound image operations.
+    """
+
+    def __init__(
+        self,
+        kind: ExecutorKind = ExecutorKind(IMAGE_EXECUTOR),
+        workers: int = IMAGE_WORKERS,
+        max_queue: int = IMAGE_MAX_QUEUE,
+        queue_timeout: float = IMAGE_QUEUE_TIMEOUT,
+    ):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    async def run(
+        self, op: str, fn: Callable[..., T], *args, required: bool = True
+    ) -> T:
+        """
+        Run an image operation in the worker pool.
+
+        Args:
+            op (str): Name of the operation, for metrics
+            fn (Callable): The operation, a module-level function for process pools
+            *args: Arguments of the operation
+            required (bool): Whether to wait for room in an overloaded service,
+                instead of failing at once
+
+        Returns:
+            The result of the operation
+
+        Raises:
+            ImageServiceOverloaded: If the service has no room for the operation.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+        if self._slots.locked() and not required:
+            rejected.add(op=op)
+            raise ImageServiceOverloaded(op)
+
+        queued = time.time()
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await self._slots.acquire()
+        except TimeoutError:
+            rejected.add(op=op)
+            raise ImageServiceOverloaded(op)
+
+        self._pending += 1
+        queue_depth.set(self._pending)
+        try:
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), _timed, fn, args
+            )
+            wait_time.record(started - queued, op=op)
+            latency.record(finished - started, op=op)
+            return result
+        finally:
+            self._pending -= 1
+            queue_depth.set(self._pending)
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        """Stop the worker pool, after the running operations."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == ExecutorKind.PROCESS:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="image"
+                )
+        return self._executor
+
+
+def _timed(fn: Callable[..., T], args: tuple) -> tuple[T, float, float]:
+    # Wall clock times, comparable across the worker processes
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+image_service = ImageProcessingService()
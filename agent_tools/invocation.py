@@ -0,0 +1,190 @@
+"""Helpers to invoke agents that return a structured report."""
+
+from typing import Callable, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+from strands import Agent
+from strands.agent import AgentResult
+
+import metrics
+from gateway.budget import budget_stage, track_budget
+from gateway.enums import ProgressEvent, StructuredOutputMode
+from gateway.progress import emit_progress
+from settings import STRUCTURED_OUTPUT_MODE, STRUCTURED_OUTPUT_MODES
+
+T = TypeVar("T", bound=BaseModel)
+
+# Invocation state entries shared by every agent and tool of a recovery session
+SESSION_STATE_KEYS = ("websocket", "progress", "budget", "trace")
+
+llm_calls = metrics.histogram(
+    "agent.llm_calls", "Model calls made by an agent to produce its report"
+)
+llm_tokens = metrics.histogram(
+    "agent.llm_tokens", "Tokens consumed by an agent to produce its report"
+)
+
+
+def structured_output_mode(agent_name: str) -> StructuredOutputMode:
+    """Return the structured output mode configured for an agent."""
+    return StructuredOutputMode(
+        STRUCTURED_OUTPUT_MODES.get(agent_name, STRUCTURED_OUTPUT_MODE)
+    )
+
+
+def session_state(invocation_state: dict) -> dict:
+    """Return the session entries of an invocation state, to pass them on to nested agents."""
+    return {
+        key: invocation_state[key]
+        for key in SESSION_STATE_KEYS
+        if key in invocation_state
+    }
+
+
+async def stream_agent(
+    agent: Agent,
+    prompt,
+    invocation_state: Optional[dict] = None,
+    tool_events: Optional[dict[str, ProgressEvent]] = None,
+    on_tool_start: Optional[Callable[[str], None]] = None,
+    **kwargs,
+) -> AgentResult:
+    """
+    Run an agent through its streaming API and return its result.
+
+    Args:
+        agent (Agent): The agent to run
+        prompt: The prompt for the agent
+        invocation_state (dict): State made available to the agent tools
+        tool_events (dict): Progress event to emit when the agent starts calling a tool
+        on_tool_start (Callable): Called with the tool name when the agent starts calling a tool
+        **kwargs: Additional arguments for `Agent.stream_async`
+
+    Returns:
+        AgentResult: The result of the invocation.
+    """
+    invocation_state = invocation_state or {}
+    tool_events = tool_events or {}
+    started_tools = set()
+    result = None
+    async for event in agent.stream_async(
+        prompt, invocation_state=invocation_state, **kwargs
+    ):
+        if "result" in event:
+            result = event["result"]
+            continue
+        tool_use = event.get("current_tool_use")
+        if tool_use and tool_use.get("toolUseId") not in started_tools:
+            started_tools.add(tool_use.get("toolUseId"))
+            if on_tool_start is not None:
+                on_tool_start(tool_use.get("name"))
+            if tool_use.get("name") in tool_events:
+                await emit_progress(
+                    invocation_state,
+                    tool_events[tool_use["name"]],
+                    tool=tool_use["name"],
+                )
+    return result
+
+
+def record_agent_usage(agent_name: str, agent: Agent, mode: StructuredOutputMode):
+    """Record the model calls and tokens consumed by an agent so far."""
+    usage = agent.event_loop_metrics.accumulated_usage
+    llm_calls.record(
+        agent.event_loop_metrics.cycle_count, agent=agent_name, mode=mode.value
+    )
+    for kind in ("inputTokens", "outputTokens"):
+        llm_tokens.record(
+            usage.get(kind, 0), agent=agent_name, mode=mode.value, kind=kind
+        )
+
+
+async def invoke_structured(
+    agent_name: str,
+    agent: Agent,
+    prompt,
+    output_model: Type[T],
+    summary_prompt: str,
+    invocation_state: Optional[dict] = None,
+    assemble: Optional[Callable[[Agent], Optional[T]]] = None,
+    tool_events: Optional[dict[str, ProgressEvent]] = None,
+    on_tool_start: Optional[Callable[[str], None]] = None,
+) -> T:
+    """
+    Run an agent and return its report as an instance of `output_model`.
+
+    Depending on the mode configured for `agent_name`:
+    - two_pass: runs the agent, then asks it to summarize the conversation into
+      `output_model` with `summary_prompt` (one extra round trip).
+    - single_pass: constrains the final turn of the agent to `output_model`.
+    - local: runs the agent and builds the report from its tool results with
+      `assemble`. Falls back to a summary call if `assemble` returns None, and
+      behaves as single_pass for agents without an assembler.
+
+    The agent checks the session budget before each model call, see gateway.budget.
+
+    Args:
+        agent_name (str): Name of the agent, used for configuration and metrics
+        agent (Agent): The agent to invoke
+        prompt: The prompt for the agent
+        output_model (Type[T]): Template model of the report
+        summary_prompt (str): Prompt used to request the report in two_pass mode
+        invocation_state (dict): State made available to the agent tools
+        assemble (Callable): Builds the report from the agent messages in local mode
+        tool_events (dict): Progress event to emit when the agent starts calling a tool
+        on_tool_start (Callable): Called with the tool name when the agent starts calling a tool
+
+    Returns:
+        T: The structured report.
+    """
+    mode = structured_output_mode(agent_name)
+    if mode == StructuredOutputMode.LOCAL and assemble is None:
+        mode = StructuredOutputMode.SINGLE_PASS
+
+    invocation_state = invocation_state or {}
+    track_budget(agent, invocation_state, agent_name)
+    async with budget_stage(invocation_state, agent_name):
+        try:
+            if mode == StructuredOutputMode.SINGLE_PASS:
+                result = await stream_agent(
+                    agent,
+                    prompt,
+                    invocation_state,
+                    tool_events,
+                    on_tool_start,
+                    structured_output_model=output_model,
+                )
+                return result.structured_output
+
+            await stream_agent(
+                agent, prompt, invocation_state, tool_events, on_tool_start
+            )
+            if mode == StructuredOutputMode.LOCAL:
+                report = assemble(agent)
+                if report is not None:
+                    return report
+
+            result = await agent.invoke_async(
+                summary_prompt, structured_output_model=output_model
+            )
+            return result.structured_output
+        finally:
+            record_agent_usage(agent_name, agent, mode)
+
+
+def tool_results(agent: Agent) -> list[tuple[str, list]]:
+    """
+    Return the (tool name, result content) pairs found in the agent messages.
+    """
+    names = {}
+    results = []
+    for message in agent.messages:
+        for block in message.get("content", []):
+            if "toolUse" in block:
+                names[block["toolUse"]["toolUseId"]] = block["toolUse"]["name"]
+            elif "toolResult" in block:
+                result = block["toolResult"]
+                results.append(
+                    (names.get(result["toolUseId"], ""), result.get("content", []))
+                )
+    return results
@@ -1,6 +1,6 @@
 from typing import Optional
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column
+from sqlalchemy import Column, Index
 from sqlalchemy.dialects.postgresql import JSON
 import uuid
 
@@ -11,5 +11,9 @@ class ToolModuleLink(SQLModel, table=True):
     This is used to avoid circular imports.
     """
 
+    __table_args__ = (
+        Index("ix_toolmodulelink_module_id", "module_id"),
+    )
+
     tool_id: uuid.UUID = Field(..., foreign_key="tool.id", primary_key=True)
     module_id: uuid.UUID = Field(..., foreign_key="module.id", primary_key=True)
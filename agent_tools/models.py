@@ -3,8 +3,10 @@ from typing import Optional
 from gateway.models import Module
 from agent_tools.links import ToolModuleLink
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy import Column
+from sqlalchemy import Column, Index
 import uuid
+from datetime import datetime
+from database.columns import TimestampField, uuid7
 
 
 class Tool(SQLModel, table=True):
@@ -13,7 +15,7 @@ class Tool(SQLModel, table=True):
     """
 
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the tool.",
         primary_key=True,
     )
@@ -56,8 +58,13 @@ class ToolUse(SQLModel, table=True):
     Represents a usage instance of a tool.
     """
 
+    __table_args__ = (
+        Index("ix_tooluse_action_id_timestamp", "action_id", "timestamp"),
+        Index("ix_tooluse_tool_id_timestamp", "tool_id", "timestamp"),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the tool use instance.",
         primary_key=True,
     )
@@ -69,7 +76,7 @@ class ToolUse(SQLModel, table=True):
         foreign_key="executedaction.id",
         description="ID of the action that was executed using the tool.",
     )
-    timestamp: str = Field(..., description="Timestamp of when the tool was used.")
+    timestamp: datetime = TimestampField("Timestamp of when the tool was used.")
     parameters: Optional[dict] = Field(
         None,
         description="Parameters used when invoking the tool.",
@@ -78,6 +85,10 @@ class ToolUse(SQLModel, table=True):
     result: Optional[str] = Field(
         None, description="Result returned by the tool after execution."
     )
+    screenshot: Optional[str] = Field(
+        None,
+        description="Reference of the screenshot the tool worked on, in the screenshot store.",
+    )
 
     class Config:
         arbitrary_types_allowed = True
@@ -88,7 +99,8 @@ class ToolUse(SQLModel, table=True):
             "id": str(self.id),
             "tool_id": str(self.tool_id),
             "action_id": str(self.action_id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "parameters": self.parameters,
             "result": self.result,
+            "screenshot": self.screenshot,
         }
@@ -0,0 +1,293 @@
+"""
+Screenshot Store for RPA Recovery Framework
+
+Content-addressed store of the screenshots taken during recoveries, on the local
+filesystem. Screenshots are keyed by the SHA-256 of their bytes, so the same screen
+sent twice is stored once, and are referenced as `screenshot://<sha256>` by the
+recovery trace (`ExecutedAction.screenshot`, `ToolUse.screenshot`).
+
+Near-duplicates (same screen, different JPEG encoding or a blinking cursor) can also
+be deduplicated by comparing the difference hash (dHash) of the screenshots: a
+screenshot within `SCREENSHOT_NEAR_DUPLICATE_DISTANCE` bits of a stored one reuses
+its reference. dHashes are indexed by 16-bit bands, so a lookup only compares the
+candidates sharing a band instead of scanning the whole store.
+
+The store is bounded by `SCREENSHOT_STORE_MAX_BYTES`, evicting the least recently
+used screenshots first, and by `SCREENSHOT_STORE_RETENTION_DAYS`.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+import metrics
+from settings import (
+    SCREENSHOT_NEAR_DUPLICATE_DISTANCE,
+    SCREENSHOT_STORE_ENABLED,
+    SCREENSHOT_STORE_MAX_BYTES,
+    SCREENSHOT_STORE_PATH,
+    SCREENSHOT_STORE_RETENTION_DAYS,
+)
+
+logger = logging.getLogger(__name__)
+
+REF_PREFIX = "screenshot://"
+DHASH_BANDS = 4  # 16-bit bands of the 64-bit dHash
+PRUNE_INTERVAL = 3600  # Seconds between retention sweeps
+
+stored = metrics.counter(
+    "screenshot_store.stored",
+    "Screenshots put in the store, by result (new, duplicate or near_duplicate)",
+)
+bytes_written = metrics.counter(
+    "screenshot_store.bytes_written", "Bytes written to the screenshot store, by day"
+)
+evicted = metrics.counter(
+    "screenshot_store.evicted", "Screenshots removed from the store, by reason"
+)
+dedup_ratio = metrics.gauge(
+    "screenshot_store.dedup_ratio",
+    "Share of the screenshots put in the store that were not written",
+)
+store_size = metrics.gauge("screenshot_store.size", "Bytes held by the screenshot store")
+
+
+class Screenshot(bytes):
+    """
+    Screenshot image data, along with its reference in the screenshot store.
+
+    Behaves as plain bytes, so it can be decoded or sent to a model as is.
+    """
+
+    ref: Optional[str] = None
+
+    def __new__(cls, data: bytes, ref: Optional[str] = None):
+        screenshot = super().__new__(cls, data)
+        screenshot.ref = ref
+        return screenshot
+
+
+@dataclass
+class _Entry:
+    path: Path
+    size: int
+    last_used: float
+    dhash: Optional[int] = None
+
+
+def dhash(data: bytes, size: int = 8) -> int:
+    """
+    Compute the 64-bit difference hash of an image.
+
+    Each bit tells whether a pixel is brighter than its right neighbour, on a 9x8
+    grayscale thumbnail, so the hash survives recompression and small changes.
+
+    Args:
+        data (bytes): Encoded image (JPEG/PNG)
+        size (int): Side of the hash, in bits
+
+    Returns:
+        int: The hash, `size * size` bits long
+    """
+    image = Image.open(BytesIO(data))
+    # Let the JPEG decoder downscale while decoding
+    image.draft("L", (image.width // 8 or 1, image.height // 8 or 1))
+    pixels = list(
+        image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).getdata()
+    )
+    value = 0
+    for row in range(size):
+        for column in range(size):
+            left = pixels[row * (size + 1) + column]
+            right = pixels[row * (size + 1) + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _bands(value: int) -> list[tuple[int, int]]:
+    return [(band, (value >> (16 * band)) & 0xFFFF) for band in range(DHASH_BANDS)]
+
+
+class ScreenshotStore:
+    """
+    Content-addressed screenshot store on the local filesystem.
+    """
+
+    def __init__(
+        self,
+        root: str = SCREENSHOT_STORE_PATH,
+        max_bytes: int = SCREENSHOT_STORE_MAX_BYTES,
+        retention_days: float = SCREENSHOT_STORE_RETENTION_DAYS,
+        near_duplicate_distance: int = SCREENSHOT_NEAR_DUPLICATE_DISTANCE,
+        enabled: bool = SCREENSHOT_STORE_ENABLED,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.near_duplicate_distance = near_duplicate_distance
+        self.enabled = enabled
+        self._entries: dict[str, _Entry] = {}
+        self._bands: dict[tuple[int, int], set[str]] = {}
+        self._size = 0
+        self._puts = 0
+        self._deduplicated = 0
+        self._loaded = False
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    async def put(self, data: bytes) -> Screenshot:
+        """
+        Store a screenshot, unless it (or a near-duplicate) is already stored.
+
+        Args:
+            data (bytes): Encoded screenshot
+
+        Returns:
+            Screenshot: The screenshot bytes, with the reference of the stored copy
+        """
+        if not self.enabled:
+            return Screenshot(data)
+        try:
+            ref = await asyncio.to_thread(self._put, data)
+        except Exception as e:
+            logger.warning("Could not store screenshot: %s", e)
+            ref = None
+        return Screenshot(data, ref)
+
+    async def get(self, ref: str) -> Optional[bytes]:
+        """Return the bytes of a stored screenshot, or None if it was evicted."""
+        return await asyncio.to_thread(self._get, ref)
+
+    def _put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._load()
+            self._puts += 1
+            entry = self._entries.get(digest)
+            if entry is not None:
+                return self._reuse(digest, "duplicate")
+
+        near_hash = dhash(data) if self.near_duplicate_distance > 0 else None
+        with self._lock:
+            # Another thread may have stored it while the lock was released
+            if digest in self._entries:
+                return self._reuse(digest, "duplicate")
+            if near_hash is not None:
+                match = self._near_duplicate(near_hash)
+                if match is not None:
+                    return self._reuse(match, "near_duplicate")
+
+            path = self.root / digest[:2] / digest
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_suffix(".tmp")
+            temporary.write_bytes(data)
+            os.replace(temporary, path)
+
+            self._index(digest, _Entry(path, len(data), time.time(), near_hash))
+            stored.add(result="new")
+            bytes_written.add(len(data), day=date.today().isoformat())
+            self._update_ratio()
+            self._evict()
+            return REF_PREFIX + digest
+
+    def _get(self, ref: str) -> Optional[bytes]:
+        digest = ref.removeprefix(REF_PREFIX)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            entry.last_used = time.time()
+        try:
+            return entry.path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _reuse(self, digest: str, result: str) -> str:
+        self._entries[digest].last_used = time.time()
+        self._deduplicated += 1
+        stored.add(result=result)
+        self._update_ratio()
+        return REF_PREFIX + digest
+
+    def _near_duplicate(self, value: int) -> Optional[str]:
+        # Hashes within DHASH_BANDS - 1 bits of each other share at least one band,
+        # farther near-duplicates are only found if they happen to share one
+        candidates = set()
+        for band in _bands(value):
+            candidates |= self._bands.get(band, set())
+        best, best_distance = None, self.near_duplicate_distance + 1
+        for digest in candidates:
+            distance = (self._entries[digest].dhash ^ value).bit_count()
+            if distance < best_distance:
+                best, best_distance = digest, distance
+        return best
+
+    def _index(self, digest: str, entry: _Entry) -> None:
+        self._entries[digest] = entry
+        self._size += entry.size
+        if entry.dhash is not None:
+            for band in _bands(entry.dhash):
+                self._bands.setdefault(band, set()).add(digest)
+        store_size.set(self._size)
+
+    def _remove(self, digest: str, reason: str) -> None:
+        entry = self._entries.pop(digest)
+        self._size -= entry.size
+        if entry.dhash is not None:
+            for band in _bands(entry.dhash):
+                self._bands[band].discard(digest)
+        entry.path.unlink(missing_ok=True)
+        evicted.add(reason=reason)
+        store_size.set(self._size)
+
+    def _evict(self) -> None:
+        """Drop expired screenshots, then the least recently used ones over the size limit."""
+        now = time.time()
+        if self.retention_days and now - self._pruned_at > PRUNE_INTERVAL:
+            self._pruned_at = now
+            cutoff = now - self.retention_days * 86400
+            for digest in [
+                digest
+                for digest, entry in self._entries.items()
+                if entry.last_used < cutoff
+            ]:
+                self._remove(digest, "retention")
+
+        if self.max_bytes and self._size > self.max_bytes:
+            # Evict down to 90% of the limit so eviction does not run on every put
+            for digest in sorted(self._entries, key=lambda d: self._entries[d].last_used):
+                if self._size <= self.max_bytes * 0.9:
+                    break
+                self._remove(digest, "size")
+
+    def _load(self) -> None:
+        """Index the screenshots stored by previous runs."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.root.exists():
+            return
+        for path in self.root.glob("*/*"):
+            if path.suffix == ".tmp":
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            # dHashes are not persisted, earlier screenshots only deduplicate exactly
+            self._index(path.name, _Entry(path, stat.st_size, stat.st_mtime))
+
+    def _update_ratio(self) -> None:
+        dedup_ratio.set(self._deduplicated / self._puts)
+
+
+screenshot_store = ScreenshotStore()
@@ -0,0 +1,55 @@
+# Column helpers shared by the SQLModel models of every package.
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import Column, DateTime, func
+from sqlmodel import Field
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Generate a time-ordered UUID (version 7, RFC 9562).
+
+    The first 48 bits hold the Unix time in milliseconds, so primary keys generated
+    close in time land in the same index pages instead of random ones.
+    """
+    value = (time.time_ns() // 1_000_000) << 80
+    value |= int.from_bytes(os.urandom(10), "big")
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # Version
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # Variant
+    return uuid.UUID(int=value)
+
+
+def utcnow() -> datetime:
+    """Return the current time, timezone-aware."""
+    return datetime.now(timezone.utc)
+
+
+def TimestampField(description: str, nullable: bool = False, **kwargs: Any) -> Any:
+    """
+    Declare a `timestamptz` column.
+
+    Non-nullable columns default to the time the row is created, both on the Python
+    side (so the value is available before the row is reloaded) and on the server side
+    (for rows inserted in bulk or outside the ORM).
+
+    Args:
+        description (str): Description of the column
+        nullable (bool): Whether the column can be NULL, without default
+    """
+    if nullable:
+        kwargs["default"] = None
+    else:
+        kwargs["default_factory"] = utcnow
+    return Field(
+        description=description,
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=nullable,
+            server_default=None if nullable else func.now(),
+        ),
+        **kwargs,
+    )
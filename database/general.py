@@ -1,34 +1,109 @@
+import asyncio
 from typing import Annotated
 from fastapi.params import Depends
-from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from gateway.models import *  # Needed for SQLModel to recognize the models defined in gateway.models
 from agent_tools.models import *  # Needed for SQLModel to recognize the models defined in tools.models
 from modules.models import *  # Needed for SQLModel to recognize the models defined in modules.models
-from settings import POSTGRES_URL
+from settings import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT,
+    POSTGRES_ASYNC_URL,
+    POSTGRES_URL,
+)
 import database.populators as populators
 
 # Database one: General purpose, postgresql
 
 postgres_url = POSTGRES_URL
 
-general_engine = create_engine(postgres_url)
+# Blocking engine, only used to create the schema, run migrations and populate
+# default data. Application code must use the async engine, so database I/O never
+# blocks the event loop serving the robot connections.
+general_engine = create_engine(
+    postgres_url,
+    pool_pre_ping=True,
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"},
+)
+
+async_engine = create_async_engine(
+    POSTGRES_ASYNC_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}},
+)
+
+async_session = async_sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False
+)
+
+
+# Tables whose changes must be propagated to the in-memory module registry
+NOTIFIED_TABLES = ("module", "routingrule", "toolmodulelink")
+
+
+async def install_change_notifications(connection: AsyncConnection):
+    """
+    Notify the `module_changes` channel on every write to the tables cached by the
+    module registry (see gateway.module_registry).
+    """
+    await connection.execute(
+        text(
+            """
+            CREATE OR REPLACE FUNCTION notify_module_changes() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('module_changes', TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """
+        )
+    )
+    for table in NOTIFIED_TABLES:
+        await connection.execute(
+            text(f"DROP TRIGGER IF EXISTS {table}_changes ON {table}")
+        )
+        await connection.execute(
+            text(
+                f"CREATE TRIGGER {table}_changes AFTER INSERT OR UPDATE OR DELETE "
+                f"ON {table} FOR EACH STATEMENT EXECUTE FUNCTION notify_module_changes()"
+            )
+        )
 
 
 async def create_db_and_tables():
-    SQLModel.metadata.create_all(general_engine)
+    async with async_engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+        await install_change_notifications(connection)
     for populator in populators.__all__:
         populator_func = getattr(populators, populator)
         if callable(populator_func):
-            populator_func(general_engine)
+            await asyncio.to_thread(populator_func, general_engine)
 
 
 async def drop_db_and_tables():
-    SQLModel.metadata.drop_all(general_engine)
+    async with async_engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.drop_all)
+
+
+async def dispose_engines():
+    await async_engine.dispose()
+    general_engine.dispose()
 
 
-def get_session():
-    with Session(general_engine) as session:
+async def get_session():
+    async with async_session() as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
@@ -0,0 +1,98 @@
+-- Typed time columns and indexes on the audit/execution schema.
+--
+-- Converts the text timestamps to timestamptz with per-row server defaults, and
+-- adds the indexes used by session timelines (exception -> audit -> execution ->
+-- solution -> planning -> step -> action -> tool use, ordered by time) and by
+-- per-module history queries.
+--
+-- Schema created by database.general.create_db_and_tables already matches this
+-- migration; it is only needed for databases created by earlier versions.
+--
+-- The indexes are built CONCURRENTLY to avoid blocking writes on large tables, so
+-- this file must run outside of a transaction block:
+--     psql "$DATABASE_URL" -f database/migrations/0001_timestamptz_and_indexes.sql
+--
+-- Rows keep their uuid4 primary keys; new rows get time-ordered uuid7 keys from
+-- the application (database.columns.uuid7).
+
+\set ON_ERROR_STOP on
+
+ALTER TABLE module
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE module SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE module ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE robotexception
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE robotexception SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE robotexception ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE result
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE result SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE result ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE audit
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE audit SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE audit ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE execution
+    ALTER COLUMN "timestamp_start" TYPE timestamptz USING NULLIF("timestamp_start", '')::timestamptz,
+    ALTER COLUMN "timestamp_start" SET DEFAULT now();
+UPDATE execution SET "timestamp_start" = now() WHERE "timestamp_start" IS NULL;
+ALTER TABLE execution ALTER COLUMN "timestamp_start" SET NOT NULL;
+
+ALTER TABLE solution
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE solution SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE solution ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE planning
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE planning SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE planning ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE step
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE step SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE step ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE executedaction
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE executedaction SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE executedaction ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE tooluse
+    ALTER COLUMN "timestamp" TYPE timestamptz USING NULLIF("timestamp", '')::timestamptz,
+    ALTER COLUMN "timestamp" SET DEFAULT now();
+UPDATE tooluse SET "timestamp" = now() WHERE "timestamp" IS NULL;
+ALTER TABLE tooluse ALTER COLUMN "timestamp" SET NOT NULL;
+
+ALTER TABLE execution
+    ALTER COLUMN timestamp_end TYPE timestamptz USING NULLIF(timestamp_end, '')::timestamptz;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_routingrule_module_id ON routingrule ("module_id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_robotexception_timestamp ON robotexception ("timestamp");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_result_audit_id ON result ("audit_id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_audit_exception_id_timestamp ON audit ("exception_id", "timestamp");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_audit_module_id_timestamp ON audit ("module_id", "timestamp");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_execution_exception_id_timestamp_start ON execution ("exception_id", "timestamp_start");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_execution_module_id_timestamp_start ON execution ("module_id", "timestamp_start");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_solution_execution_id_timestamp ON solution ("execution_id", "timestamp");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_planning_solution_id ON planning ("solution_id");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_step_planning_id_timestamp ON step ("planning_id", "timestamp");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_executedaction_step_id_timestamp ON executedaction ("step_id", "timestamp");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tooluse_action_id_timestamp ON tooluse ("action_id", "timestamp");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tooluse_tool_id_timestamp ON tooluse ("tool_id", "timestamp");
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_toolmodulelink_module_id ON toolmodulelink ("module_id");
+
+ANALYZE;
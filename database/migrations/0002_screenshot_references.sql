@@ -0,0 +1,14 @@
+-- References to the screenshot store on the recovery trace.
+--
+-- Executed actions and tool uses carry the `screenshot://<sha256>` reference of
+-- the screenshot they worked on (see agent_tools.screenshot_store) instead of the
+-- image itself.
+--
+-- Schema created by database.general.create_db_and_tables already matches this
+-- migration; it is only needed for databases created by earlier versions:
+--     psql "$DATABASE_URL" -f database/migrations/0002_screenshot_references.sql
+
+\set ON_ERROR_STOP on
+
+ALTER TABLE executedaction ADD COLUMN IF NOT EXISTS screenshot varchar;
+ALTER TABLE tooluse ADD COLUMN IF NOT EXISTS screenshot varchar;
@@ -1,5 +1,7 @@
 from database.populators.modules import populate_modules
+from database.populators.routing_rules import populate_routing_rules
 
 __all__ = [
     "populate_modules",
+    "populate_routing_rules",
 ]
@@ -0,0 +1,35 @@
+# This file defines the default routing rules used by the gateway pre-router.
+
+from sqlmodel import Session, select
+from gateway.models import Module, RoutingRule
+from gateway.enums import ExceptionType
+
+
+def populate_routing_rules(engine):
+    """
+    Populates the database with the default routing rules for the R2Framework.
+    This includes:
+    - UI exceptions: Routed straight to the UI Error Handler module
+    """
+
+    with Session(engine) as session:
+        ui_error_module = session.exec(
+            select(Module).where(Module.name == "UI Error Handler")
+        ).first()
+        if ui_error_module is None:
+            return
+
+        existing_rules = session.exec(
+            select(RoutingRule).where(RoutingRule.module_id == ui_error_module.id)
+        ).all()
+
+        session.add(
+            RoutingRule(
+                module_id=ui_error_module.id,
+                priority=10,
+                exception_type=ExceptionType.UI_EXCEPTION,
+            )
+        ) if not existing_rules else None
+        session.commit()
+
+        print("Successfully populated routing rules")
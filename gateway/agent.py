@@ -6,69 +6,220 @@ external RPA systems, standardizes them, and intelligently routes them to approp
 recovery modules for resolution.
 """
 
+import asyncio
 from functools import partial
+import json
+import uuid
 
 from strands import Agent, ToolContext, tool
-from strands.models.openai import OpenAIModel
-from typing import Dict, Any
+from typing import Awaitable, Callable, Dict, Any, Optional
+from sqlmodel import select
 
-from settings import FREE_PROVIDER_API_KEY, PROVIDER_API_BASE, PROVIDER_MODEL
+from providers.enums import ModelRole
+from providers.registry import get_role_model
 from gateway.prompts import (
     GATEWAY_ORCHESTRATOR_PROMPT,
 )
-from gateway.models import RobotExceptionRequest
+from gateway.models import Audit, Module, RobotExceptionRequest
+from gateway.coalescing import Decide, RoutingDecision, fingerprint, single_flight
+from gateway.budget import BudgetExhausted, RecoveryBudget
+from gateway.enums import ProgressEvent
+from gateway.progress import ProgressReporter, emit_progress
+from gateway.prerouter import CompiledRule, routing_decisions, routing_table
+from gateway.module_registry import module_registry
+from gateway.trace import SessionTrace, trace_recorder
+from database.general import async_session
 
-from modules.uierror.agent import ui_exception_handler
+from modules.uierror.agent import handle_ui_exception, ui_exception_handler
+from modules.uierror.templates import UiExceptionReport
 from gateway.templates import ResponseToRPA
 from agent_tools.database import available_modules
+from agent_tools.invocation import invoke_structured, tool_results
 
 from fastapi import WebSocket
 
 
 async def robot_exception_handler(
-    exception: RobotExceptionRequest, websocket: WebSocket
+    exception: RobotExceptionRequest,
+    websocket: WebSocket,
+    exception_id: Optional[uuid.UUID] = None,
+    budget: Optional[RecoveryBudget] = None,
 ) -> str:
     """
     Central Gateway Agent for the RPA Recovery Framework.
 
     Handles error intake, standardization, module routing, and session management.
+    Identical exceptions reported concurrently are coalesced: only the first one is
+    routed, the others reuse its routing decision as soon as it is taken, and run
+    their own UI recovery, which depends on each robot's screen.
+
+    The recovery is cancelled when its budget (set at intake) is exhausted, and the
+    robot gets a partial report of what was done until then. The trace of the
+    recovery is written in the background, and flushed when the session ends.
+    """
+    budget = budget or RecoveryBudget.for_request(exception)
+    budget.labels["push"] = str(getattr(websocket, "push_screenshots", False)).lower()
+    trace = SessionTrace(trace_recorder, exception_id)
+    state = {
+        "websocket": websocket,
+        "progress": ProgressReporter(websocket, budget.started_at),
+        "budget": budget,
+        "trace": trace,
+    }
+    try:
+        budget.check("routing")
+        async with asyncio.timeout(budget.remaining()):
+            decision, is_leader = await single_flight.run(
+                fingerprint(exception),
+                partial(route_exception, exception, state, exception_id),
+            )
+            if is_leader:
+                return decision.response
+            return await follow_decision(decision, exception, state, exception_id)
+    except BudgetExhausted:
+        return partial_report(state)
+    except TimeoutError:
+        # The deadline passed in the middle of a stage
+        budget.exhaust("completion", "deadline")
+        return partial_report(state)
+    except Exception as _:
+        return "Failed to process error notification."
+    finally:
+        budget.finish()
+        await trace.close()
+
+
+async def route_exception(
+    exception: RobotExceptionRequest,
+    state: dict,
+    exception_id: Optional[uuid.UUID] = None,
+    decide: Optional[Decide] = None,
+) -> RoutingDecision:
+    """
+    Route an exception to a recovery module and return the routing decision.
+
+    Exceptions matching a routing rule are dispatched directly to the module's
+    routing tool, the gateway agent only routes the remaining ones.
+
+    Args:
+        exception (RobotExceptionRequest): The exception to route
+        state (dict): Session state of the recovery (websocket connection to the RPA robot, progress reporter...)
+        exception_id (uuid.UUID): ID of the persisted RobotException, if any
+        decide (Decide): Shares the decision with coalesced exceptions when it is
+            routed to the UI exception handler, before the recovery runs
     """
-    model = OpenAIModel(
-        client_args={
-            "api_key": FREE_PROVIDER_API_KEY,
-            "base_url": PROVIDER_API_BASE,
+    rule = routing_table.match(exception)
+    if rule is not None:
+        decision = await fast_route(rule, exception, state, exception_id, decide)
+        if decision is not None:
+            return decision
+
+    routing_decisions.add(path="llm")
+
+    model = get_role_model(ModelRole.ROUTING)
+
+    agent = Agent(
+        model=model,
+        messages=[
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": GATEWAY_ORCHESTRATOR_PROMPT}],
+            },
+            {"role": "assistant", "content": [{"text": "okay"}]},
+        ],
+        tools=[available_modules, route_to_human]
+        + [
+            routing_tool
+            for routing_tool in MODULE_ROUTING_TOOLS
+            if module_registry.is_enabled(routing_tool.tool_name)
+        ],
+    )
+
+    def on_tool_start(name: str) -> None:
+        if decide is not None and name == "ui_exception_handler":
+            decide(
+                RoutingDecision(
+                    routing_tool=name,
+                    response="",
+                    reasoning="Routed by the gateway agent.",
+                    llm_calls=agent.event_loop_metrics.cycle_count,
+                    exception_id=exception_id,
+                )
+            )
+
+    # Process the error through the agent
+    response = await invoke_structured(
+        "gateway",
+        agent,
+        f"Process this error notification and route the error:\n\nError Data: {exception}",
+        ResponseToRPA,
+        "Given the conversation history, provide a structured response for the given model.",
+        invocation_state=state,
+        assemble=assemble_response_to_rpa,
+        tool_events={
+            name: ProgressEvent.ROUTING_DECIDED for name in FAST_PATH_DISPATCHERS
         },
-        model_id=PROVIDER_MODEL,
+        on_tool_start=on_tool_start,
     )
 
-    try:
-        agent = Agent(
-            model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [{"type": "text", "text": GATEWAY_ORCHESTRATOR_PROMPT}],
-                },
-                {"role": "assistant", "content": [{"text": "okay"}]},
-            ],
-            tools=[available_modules, ui_exception_handler, route_to_human],
-        )
+    decision = RoutingDecision(
+        routing_tool="",
+        response=response.__str__(),
+        reasoning="Routed by the gateway agent.",
+        llm_calls=agent.event_loop_metrics.cycle_count,
+        exception_id=exception_id,
+    )
+    for name, content in tool_results(agent):
+        if name in FAST_PATH_DISPATCHERS:
+            decision.routing_tool = name
+        if name == "ui_exception_handler":
+            ui_report = parse_ui_report(
+                "".join(block.get("text", "") for block in content)
+            )
+            decision.plan = ui_report.steps if ui_report else []
+    return decision
 
-        # Process the error through the agent
-        response = await agent.invoke_async(
-            f"Process this error notification and route the error:\n\nError Data: {exception}",
-            invocation_state={"websocket": websocket},
-        )
 
-        response = await agent.invoke_async(
-            "Given the conversation history, provide a structured response for the given model.",
-            structured_output_model=ResponseToRPA,
+async def follow_decision(
+    decision: RoutingDecision,
+    exception: RobotExceptionRequest,
+    state: dict,
+    exception_id: Optional[uuid.UUID],
+) -> str:
+    """
+    Handle an exception coalesced with an identical one, reusing its routing decision.
+    """
+    dispatcher, required_details = FAST_PATH_DISPATCHERS.get(
+        decision.routing_tool, (None, ())
+    )
+    if decision.routing_tool == "ui_exception_handler" and not module_registry.is_enabled(
+        decision.routing_tool
+    ):
+        # The module was disabled after the leader was routed to it
+        return (await route_exception(exception, state, exception_id)).response
+    await emit_progress(
+        state,
+        ProgressEvent.ROUTING_DECIDED,
+        tool=decision.routing_tool,
+        path="coalesced",
+    )
+    if decision.routing_tool != "ui_exception_handler":
+        await record_audit(
+            f"Coalesced with exception {decision.exception_id}, reused its response.",
+            decision.routing_tool,
+            exception_id,
         )
+        return decision.response
+    if any(key not in (exception.details or {}) for key in required_details):
+        return (await route_exception(exception, state, exception_id)).response
 
-        return response.__str__()
-
-    except Exception as _:
-        return "Failed to process error notification."
+    await record_audit(
+        f"Coalesced with exception {decision.exception_id}, routed to {decision.routing_tool} with its recovery plan.",
+        decision.routing_tool,
+        exception_id,
+    )
+    response, _ = await dispatcher(exception, state, decision.plan)
+    return response.__str__()
 
 
 @tool(
@@ -79,3 +230,189 @@ async def robot_exception_handler(
 async def route_to_human(error_data: str, tool_context: ToolContext) -> Dict[str, Any]:
     # TODO: When cockpit
     pass
+
+
+def partial_report(state: dict) -> str:
+    """
+    Build the response for a recovery cancelled by its budget, with the budget
+    consumption and the progress made before it was cancelled.
+    """
+    return json.dumps(
+        {
+            **ResponseToRPA(success=False, continue_from_step=None).model_dump(),
+            "partial": True,
+            "budget": state["budget"].to_json(),
+            "progress": state["progress"].events,
+        },
+        indent=2,
+        default=str,
+    )
+
+
+def parse_ui_report(report: str) -> Optional[UiExceptionReport]:
+    """Parse the report returned by the UI exception handler, if valid."""
+    try:
+        return UiExceptionReport.model_validate_json(report)
+    except ValueError:
+        return None
+
+
+def response_from_ui_report(report: str) -> Optional[ResponseToRPA]:
+    """Derive the response for the robot from a UiExceptionReport."""
+    ui_report = parse_ui_report(report)
+    if ui_report is None:
+        return None
+    return ResponseToRPA(
+        success=ui_report.finish_activity,
+        continue_from_step=ui_report.continue_from_step,
+    )
+
+
+def assemble_response_to_rpa(agent: Agent) -> Optional[ResponseToRPA]:
+    """
+    Build the response for the robot from the result of the routing tool, instead
+    of asking the gateway agent to summarize the conversation.
+    """
+    for name, content in reversed(tool_results(agent)):
+        if name == "route_to_human":
+            return ResponseToRPA(success=False, continue_from_step=None)
+        if name == "ui_exception_handler":
+            return response_from_ui_report(
+                "".join(block.get("text", "") for block in content)
+            )
+    return None
+
+
+async def record_audit(
+    reasoning: str,
+    routing_tool: str,
+    exception_id: Optional[uuid.UUID],
+    module_id: Optional[uuid.UUID] = None,
+) -> None:
+    """Write the Audit row of a routing decision taken without the gateway agent."""
+    if exception_id is None:
+        return
+    async with async_session() as session:
+        if module_id is None:
+            module_id = (
+                await session.exec(
+                    select(Module.id).where(Module.routing_tool == routing_tool)
+                )
+            ).first()
+            if module_id is None:
+                return
+        session.add(
+            Audit(reasoning=reasoning, module_id=module_id, exception_id=exception_id)
+        )
+        await session.commit()
+
+
+async def _dispatch_ui_exception(
+    exception: RobotExceptionRequest,
+    state: dict,
+    known_plan: Optional[list[str]] = None,
+) -> tuple[ResponseToRPA, list[str]]:
+    details = exception.details
+    report = await handle_ui_exception(
+        task=details["task"],
+        action_history=details.get("action_history", []),
+        failed_activity=details["failed_activity"],
+        future_activities=details.get("future_activities", []),
+        variables=exception.variables or {},
+        state=state,
+        known_plan=known_plan,
+    )
+    ui_report = parse_ui_report(report)
+    if ui_report is None:
+        return ResponseToRPA(success=False, continue_from_step=None), []
+    return (
+        ResponseToRPA(
+            success=ui_report.finish_activity,
+            continue_from_step=ui_report.continue_from_step,
+        ),
+        ui_report.steps,
+    )
+
+
+async def _dispatch_to_human(
+    exception: RobotExceptionRequest,
+    state: dict,
+    known_plan: Optional[list[str]] = None,
+) -> tuple[ResponseToRPA, list[str]]:
+    # TODO: When cockpit
+    return ResponseToRPA(success=False, continue_from_step=None), []
+
+
+# Routing tools of the recovery modules, offered to the gateway agent while their
+# module is enabled
+MODULE_ROUTING_TOOLS = [ui_exception_handler]
+
+# Routing tools that can be reached without the gateway agent, along with the keys
+# the exception details must provide to build the tool arguments. Dispatchers return
+# the response for the robot and the recovery plan that was followed.
+FAST_PATH_DISPATCHERS: Dict[
+    str,
+    tuple[
+        Callable[
+            [RobotExceptionRequest, dict, Optional[list[str]]],
+            Awaitable[tuple[ResponseToRPA, list[str]]],
+        ],
+        tuple[str, ...],
+    ],
+] = {
+    "ui_exception_handler": (_dispatch_ui_exception, ("task", "failed_activity")),
+    "route_to_human": (_dispatch_to_human, ()),
+}
+
+
+async def fast_route(
+    rule: CompiledRule,
+    exception: RobotExceptionRequest,
+    state: dict,
+    exception_id: Optional[uuid.UUID],
+    decide: Optional[Decide] = None,
+) -> Optional[RoutingDecision]:
+    """
+    Dispatch an exception matched by a routing rule directly to the module's routing tool.
+
+    Exceptions routed to the UI exception handler share the decision through `decide`
+    before the recovery runs, coalesced exceptions run their own.
+
+    Returns:
+        Optional[RoutingDecision]: The routing decision, or None if the routing tool
+        cannot be reached directly and the gateway agent must route the exception.
+    """
+    dispatcher, required_details = FAST_PATH_DISPATCHERS.get(
+        rule.routing_tool, (None, ())
+    )
+    if dispatcher is None or any(
+        key not in (exception.details or {}) for key in required_details
+    ):
+        return None
+
+    routing_decisions.add(path="rules")
+    reasoning = f"Matched routing rule {rule.rule_id}, routed to {rule.routing_tool} without the gateway agent."
+    await record_audit(
+        reasoning, rule.routing_tool, exception_id, module_id=rule.module_id
+    )
+    await emit_progress(
+        state, ProgressEvent.ROUTING_DECIDED, tool=rule.routing_tool, path="rules"
+    )
+    if decide is not None and rule.routing_tool == "ui_exception_handler":
+        decide(
+            RoutingDecision(
+                routing_tool=rule.routing_tool,
+                response="",
+                reasoning=reasoning,
+                exception_id=exception_id,
+            )
+        )
+
+    response, plan = await dispatcher(exception, state, None)
+    return RoutingDecision(
+        routing_tool=rule.routing_tool,
+        response=response.__str__(),
+        reasoning=reasoning,
+        plan=plan,
+        exception_id=exception_id,
+    )
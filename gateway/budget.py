@@ -0,0 +1,223 @@
+"""
+Recovery Budgets for RPA Recovery Framework
+
+Every exception gets a deadline and a token budget when it is accepted by the intake.
+The budget travels in the invocation state of every nested agent and tool, which
+check it before starting a model call or taking a screenshot. Once it is exhausted
+the recovery is cancelled and the robot gets a partial report instead of waiting
+on the socket indefinitely.
+
+Time and tokens consumed by each stage (queue, agents, screenshots, grounding) are
+recorded for analysis. Stages nest, so the time of a stage includes the time of
+the stages it runs; tokens are only charged to the agent that consumed them.
+"""
+
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from strands import Agent
+from strands.hooks import (
+    AfterInvocationEvent,
+    BeforeModelCallEvent,
+    HookProvider,
+    HookRegistry,
+)
+
+import metrics
+from gateway.models import RobotExceptionRequest
+from settings import RECOVERY_DEADLINE, RECOVERY_TOKEN_BUDGET
+
+stage_seconds = metrics.histogram(
+    "budget.stage_seconds", "Time spent in a stage of a recovery session", "s"
+)
+stage_tokens = metrics.histogram(
+    "budget.stage_tokens", "Tokens consumed by a stage of a recovery session"
+)
+exhausted = metrics.counter(
+    "budget.exhausted", "Recovery sessions cancelled by their budget, by stage"
+)
+remaining_at_finish = metrics.histogram(
+    "budget.remaining_at_finish", "Time left before the deadline when a session ends", "s"
+)
+time_to_first_model_call = metrics.histogram(
+    "budget.time_to_first_model_call",
+    "Time from the intake of an exception to its first model call",
+    "s",
+)
+
+
+class BudgetExhausted(RuntimeError):
+    """Raised when a recovery session runs out of time or tokens."""
+
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"Recovery budget exhausted ({reason}) before {stage}")
+        self.stage = stage
+        self.reason = reason
+
+
+class RecoveryBudget:
+    """
+    Deadline and token budget of a recovery session.
+    """
+
+    def __init__(
+        self,
+        deadline: float = RECOVERY_DEADLINE,
+        max_tokens: int = RECOVERY_TOKEN_BUDGET,
+        started_at: Optional[float] = None,
+    ):
+        self.started_at = started_at or time.monotonic()
+        self.deadline_at = self.started_at + deadline
+        self.max_tokens = max_tokens
+        self.tokens_used = 0
+        self.stages: dict[str, dict] = {}
+        self.exhausted_by: Optional[BudgetExhausted] = None
+        self.first_model_call_at: Optional[float] = None
+        self.labels: dict[str, str] = {}  # Labels of the session metrics
+
+    @classmethod
+    def for_request(cls, request: RobotExceptionRequest) -> "RecoveryBudget":
+        """Create the budget of an exception, using the limits requested by the robot if any."""
+        return cls(
+            deadline=request.deadline or RECOVERY_DEADLINE,
+            max_tokens=request.token_budget or RECOVERY_TOKEN_BUDGET,
+        )
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline."""
+        return self.deadline_at - time.monotonic()
+
+    def check(self, stage: str) -> None:
+        """
+        Check there is budget left to start a stage.
+
+        Raises:
+            BudgetExhausted: If the deadline has passed or the token budget is spent.
+        """
+        reason = None
+        if self.remaining() <= 0:
+            reason = "deadline"
+        elif self.max_tokens and self.tokens_used >= self.max_tokens:
+            reason = "tokens"
+        if reason is not None:
+            raise self.exhaust(stage, reason)
+
+    def exhaust(self, stage: str, reason: str) -> BudgetExhausted:
+        """Record that the budget ran out during a stage and return the error to raise."""
+        error = BudgetExhausted(stage, reason)
+        if self.exhausted_by is None:
+            self.exhausted_by = error
+            exhausted.add(stage=stage, reason=reason)
+        return error
+
+    def model_call(self) -> None:
+        """Record the time to the first model call of the session."""
+        if self.first_model_call_at is None:
+            self.first_model_call_at = time.monotonic()
+            time_to_first_model_call.record(
+                self.first_model_call_at - self.started_at, **self.labels
+            )
+
+    def charge(self, stage: str, tokens: int) -> None:
+        """Charge the tokens consumed by a stage."""
+        self.tokens_used += tokens
+        self._stage(stage)["tokens"] += tokens
+
+    def record(self, stage: str, seconds: float, tokens: int = 0) -> None:
+        """Record the consumption of a finished stage."""
+        entry = self._stage(stage)
+        entry["runs"] += 1
+        entry["seconds"] += seconds
+        stage_seconds.record(seconds, stage=stage)
+        stage_tokens.record(tokens, stage=stage)
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Check the budget, then record the time and tokens consumed by the enclosed stage."""
+        self.check(name)
+        started = time.monotonic()
+        tokens = self._stage(name)["tokens"]
+        try:
+            yield self
+        finally:
+            self.record(
+                name, time.monotonic() - started, self._stage(name)["tokens"] - tokens
+            )
+
+    def finish(self) -> None:
+        """Record the budget left when the session ends."""
+        remaining_at_finish.record(self.remaining())
+
+    def to_json(self) -> dict:
+        """Convert the budget consumption to a dictionary structure."""
+        return {
+            "elapsed": time.monotonic() - self.started_at,
+            "remaining": self.remaining(),
+            "tokens_used": self.tokens_used,
+            "max_tokens": self.max_tokens or None,
+            "exhausted": {
+                "stage": self.exhausted_by.stage,
+                "reason": self.exhausted_by.reason,
+            }
+            if self.exhausted_by
+            else None,
+            "stages": self.stages,
+        }
+
+    def _stage(self, name: str) -> dict:
+        return self.stages.setdefault(name, {"runs": 0, "seconds": 0.0, "tokens": 0})
+
+
+class BudgetHook(HookProvider):
+    """
+    Checks the budget before every model call of an agent and charges the tokens it
+    consumes, so the agent loop stops as soon as the budget is exhausted.
+    """
+
+    def __init__(self, budget: RecoveryBudget, stage: str):
+        self.budget = budget
+        self.stage = stage
+        self._charged = 0
+
+    def register_hooks(self, registry: HookRegistry, **kwargs) -> None:
+        registry.add_callback(BeforeModelCallEvent, self.before_model_call)
+        registry.add_callback(AfterInvocationEvent, self.after_invocation)
+
+    def before_model_call(self, event: BeforeModelCallEvent) -> None:
+        self._settle(event.agent)
+        self.budget.check(self.stage)
+        self.budget.model_call()
+
+    def after_invocation(self, event: AfterInvocationEvent) -> None:
+        self._settle(event.agent)
+
+    def _settle(self, agent: Agent) -> None:
+        total = agent.event_loop_metrics.accumulated_usage.get("totalTokens", 0)
+        self.budget.charge(self.stage, total - self._charged)
+        self._charged = total
+
+
+def check_budget(state: dict, stage: str) -> None:
+    """Check the budget of a session state, if any, before starting a stage."""
+    budget = state.get("budget")
+    if budget is not None:
+        budget.check(stage)
+
+
+def track_budget(agent: Agent, state: dict, stage: str) -> None:
+    """Make an agent check and consume the budget of a session state, if any."""
+    budget = state.get("budget")
+    if budget is not None:
+        agent.hooks.add_hook(BudgetHook(budget, stage))
+
+
+@asynccontextmanager
+async def budget_stage(state: dict, stage: str):
+    """Run a stage within the budget of a session state, if any."""
+    budget = state.get("budget")
+    if budget is None:
+        yield None
+        return
+    async with budget.stage(stage):
+        yield budget
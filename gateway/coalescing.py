@@ -0,0 +1,190 @@
+"""
+Exception Coalescing for RPA Recovery Framework
+
+When a target application goes down, many robots report the same exception within
+seconds. Exceptions are fingerprinted after normalization and a single-flight
+layer lets only the first one (the leader) go through routing; the others
+(followers) await the leader's routing decision. Followers are released as soon as
+the leader has picked a recovery module, before the module runs: recoveries that
+depend on each robot's screen are run by every follower anyway. Exceptions reported
+after the leader is done also reuse its recovery plan.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import metrics
+from gateway.models import RobotExceptionRequest
+from settings import COALESCING_ENABLED, COALESCING_TTL
+
+coalesced_requests = metrics.counter(
+    "coalescing.requests", "Exceptions going through the single-flight layer, by role"
+)
+llm_calls_saved = metrics.counter(
+    "coalescing.llm_calls_saved", "Gateway model calls avoided by coalescing"
+)
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+
+@dataclass
+class RoutingDecision:
+    """
+    Outcome of routing an exception, shared with coalesced followers.
+    """
+
+    routing_tool: str
+    response: str
+    reasoning: str = ""
+    plan: list[str] = field(default_factory=list)
+    llm_calls: int = 0
+    exception_id: Optional[uuid.UUID] = None
+
+
+def _normalize(value):
+    """Lowercase strings and mask numbers (ids, timestamps...) recursively."""
+    if isinstance(value, str):
+        return _SPACES.sub(" ", _DIGITS.sub("#", value.strip().lower()))
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def fingerprint(exception: RobotExceptionRequest) -> str:
+    """
+    Fingerprint an exception by its code, type, failed activity and application.
+    """
+    details = exception.details or {}
+    variables = exception.variables or {}
+    normalized = {
+        "code": _normalize(exception.code),
+        "exception_type": exception.exception_type.value,
+        "failed_activity": _normalize(details.get("failed_activity")),
+        "application": _normalize(
+            details.get("application") or variables.get("application")
+        ),
+    }
+    return hashlib.sha256(
+        json.dumps(normalized, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+Decide = Callable[[RoutingDecision], None]
+
+
+def _ignore_decision(decision: RoutingDecision) -> None:
+    """Decision callback of routings that nobody waits for."""
+
+
+class SingleFlight:
+    """
+    Runs one routing per fingerprint at a time and shares its decision.
+
+    Decisions stay available to followers for `ttl` seconds after the leader is done,
+    so exceptions reported shortly after the first recovery are coalesced too.
+    """
+
+    def __init__(self, ttl: float = COALESCING_TTL, enabled: bool = COALESCING_ENABLED):
+        self.ttl = ttl
+        self.enabled = enabled
+        self._flights: dict[str, asyncio.Future] = {}
+        self._expires: dict[str, float] = {}
+
+    async def run(
+        self, key: str, route: Callable[[Decide], Awaitable[RoutingDecision]]
+    ) -> tuple[RoutingDecision, bool]:
+        """
+        Route an exception, or join the routing of an identical one.
+
+        Args:
+            key (str): Fingerprint of the exception
+            route (Callable): Routes the exception when this call is the leader. It
+                is given a callback to share the decision with the followers as
+                soon as it is taken, before running the recovery module; otherwise
+                the followers get the decision it returns.
+
+        Returns:
+            tuple[RoutingDecision, bool]: The decision, and whether it was taken by this call.
+        """
+        if not self.enabled:
+            return await route(_ignore_decision), True
+
+        self._purge()
+        flight = self._flights.get(key)
+        if flight is not None:
+            try:
+                decision = await asyncio.shield(flight)
+                coalesced_requests.add(role="follower")
+                llm_calls_saved.add(decision.llm_calls)
+                return decision, False
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise  # This call was cancelled, not the leader
+            except Exception:
+                pass
+
+            # The leader failed, route on our own
+            return await route(_ignore_decision), True
+
+        coalesced_requests.add(role="leader")
+        loop = asyncio.get_running_loop()
+        flight = self._flights[key] = loop.create_future()
+
+        def decide(decision: RoutingDecision) -> None:
+            if not flight.done():
+                flight.set_result(decision)
+
+        try:
+            decision = await route(decide)
+        except asyncio.CancelledError:
+            if flight.done():  # A decision already shared stays valid
+                self._expires[key] = time.monotonic() + self.ttl
+            else:
+                self._flights.pop(key, None)
+                flight.cancel()
+            raise
+        except Exception as e:
+            if flight.done():
+                self._expires[key] = time.monotonic() + self.ttl
+            else:
+                self._flights.pop(key, None)
+                flight.set_exception(e)
+                flight.exception()  # Followers handle it, avoid "never retrieved" warnings
+            raise
+        if flight.done():
+            # Followers still to come get the complete decision, with its plan
+            flight = self._flights[key] = loop.create_future()
+        flight.set_result(decision)
+        self._expires[key] = time.monotonic() + self.ttl
+        return decision, True
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for key, expires in list(self._expires.items()):
+            if expires < now:
+                del self._expires[key]
+                self._flights.pop(key, None)
+
+
+def coalescing_stats() -> dict:
+    """Return the coalescing hit rate and the number of model calls saved."""
+    leaders = coalesced_requests.value(role="leader")
+    followers = coalesced_requests.value(role="follower")
+    return {
+        "leaders": leaders,
+        "followers": followers,
+        "hit_rate": followers / (leaders + followers) if leaders + followers else None,
+        "llm_calls_saved": llm_calls_saved.total(),
+    }
+
+
+single_flight = SingleFlight()
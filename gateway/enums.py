@@ -13,3 +13,62 @@ class ExceptionType(str, Enum):
     SYSTEM_EXCEPTION = "system_exception"
     USER_EXCEPTION = "user_exception"
     UI_EXCEPTION = "ui_exception"
+
+
+class JobStatus(str, Enum):
+    """
+    Enum representing the processing status of an exception in the intake queue.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class StructuredOutputMode(str, Enum):
+    """
+    Enum representing how an agent produces its structured report.
+    """
+
+    TWO_PASS = "two_pass"  # Free-form run, then a second call to fill the template
+    SINGLE_PASS = "single_pass"  # The final turn is constrained to the template
+    LOCAL = "local"  # The report is assembled locally from tool results
+
+
+class ProgressEvent(str, Enum):
+    """
+    Enum representing the progress events streamed to the robot during a recovery.
+    """
+
+    ROUTING_DECIDED = "routing_decided"
+    PLAN_PRODUCED = "plan_produced"
+    STEP_STARTED = "step_started"
+    STEP_FINISHED = "step_finished"
+    ACTION_DISPATCHED = "action_dispatched"
+    VERIFICATION_RESULT = "verification_result"
+
+
+class WireProtocol(str, Enum):
+    """
+    Enum representing the robot websocket protocols, negotiated as subprotocols.
+    """
+
+    JSON = "r2.json.v1"  # JSON text messages, screenshots as a header then a binary frame
+    MSGPACK = "r2.msgpack.v1"  # Binary frames: msgpack header followed by the raw payload
+
+
+class CommandType(str, Enum):
+    """
+    Enum representing the UI actions robots with native action support run themselves.
+    """
+
+    CLICK = "click"
+    MOVE = "move"
+    DRAG = "drag"
+    TYPE = "type"
+    HOTKEY = "hotkey"
+    KEY_DOWN = "key_down"
+    KEY_UP = "key_up"
+    SCROLL = "scroll"
@@ -0,0 +1,310 @@
+"""
+Robot Wire Protocols for RPA Recovery Framework
+
+Robots pick the protocol of their websocket with the `Sec-WebSocket-Protocol`
+header (see gateway.enums.WireProtocol):
+
+- `r2.json.v1`, also used when the robot offers no subprotocol: JSON text messages,
+  with screenshots sent as a `{"type": "screenshot"}` message followed by a binary
+  frame. This is the original protocol.
+- `r2.msgpack.v1`: every message is one binary frame made of a msgpack header
+  followed by the raw payload:
+
+      {"v": 1, "t": "<type>", "s": "<session id>", "c": "<correlation id>",
+       "ct": "<content type>"} <payload>
+
+  The payload holds the rest of the message (msgpack or JSON encoded, see `ct`), or
+  the raw bytes of a screenshot (`image/jpeg`, `image/png`). Screenshots travel in
+  a single frame with their correlation id, and payloads are decoded once and
+  validated into pydantic models, without the JSON round trip of the text protocol.
+
+Compression is negotiated by the ASGI server: uvicorn offers permessage-deflate by
+default, which shrinks the control messages of both protocols. Screenshots are
+already compressed.
+"""
+
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Optional, Type, TypeVar
+
+import msgpack
+from fastapi import WebSocket
+from pydantic import BaseModel
+
+import metrics
+from gateway.enums import WireProtocol
+
+T = TypeVar("T", bound=BaseModel)
+
+PROTOCOL_VERSION = 1
+HEADER_READ_SIZE = 256  # Bytes read at a time to decode a frame header
+
+CONTENT_MSGPACK = "application/msgpack"
+CONTENT_JSON = "application/json"
+CONTENT_JPEG = "image/jpeg"
+CONTENT_PNG = "image/png"
+BINARY_CONTENT_TYPES = (CONTENT_JPEG, CONTENT_PNG, "application/octet-stream")
+
+# Envelope keys, every other key of a message is its body
+ENVELOPE_KEYS = ("type", "correlation_id")
+
+frames = metrics.counter(
+    "robot.frames", "Messages exchanged with robots, by protocol and direction"
+)
+frame_bytes = metrics.histogram(
+    "robot.frame_bytes", "Size of the messages exchanged with robots, by protocol and direction", "By"
+)
+
+
+class FrameError(ValueError):
+    """Raised when a robot message cannot be decoded."""
+
+
+class RobotDisconnected(RuntimeError):
+    """Raised when waiting for a message from a robot that is no longer connected."""
+
+
+@dataclass
+class Frame:
+    """
+    A message of the robot protocol, whatever its encoding on the wire.
+    """
+
+    type: str
+    correlation_id: Optional[str] = None
+    session_id: Optional[str] = None
+    content_type: str = CONTENT_MSGPACK
+    payload: bytes = b""
+    body: Optional[dict] = field(default=None, repr=False)  # Decoded payload, if any
+
+    def encode(self) -> bytes:
+        """Encode the frame for the msgpack protocol."""
+        header = {"v": PROTOCOL_VERSION, "t": self.type, "ct": self.content_type}
+        if self.session_id is not None:
+            header["s"] = self.session_id
+        if self.correlation_id is not None:
+            header["c"] = self.correlation_id
+        return msgpack.packb(header) + self.payload
+
+    @classmethod
+    def decode(cls, data: bytes) -> "Frame":
+        """
+        Decode a frame of the msgpack protocol.
+
+        Raises:
+            FrameError: If the frame is malformed or of another protocol version.
+        """
+        # Read from a stream, so only the header is buffered and not the payload
+        unpacker = msgpack.Unpacker(BytesIO(data), read_size=HEADER_READ_SIZE, raw=False)
+        try:
+            header = unpacker.unpack()
+        except Exception as e:
+            raise FrameError(f"Invalid frame header: {e}")
+        if not isinstance(header, dict) or header.get("v") != PROTOCOL_VERSION:
+            raise FrameError(f"Unsupported frame version, expected {PROTOCOL_VERSION}")
+        if "t" not in header:
+            raise FrameError("Frame without type")
+        return cls(
+            type=header["t"],
+            correlation_id=header.get("c"),
+            session_id=header.get("s"),
+            content_type=header.get("ct", CONTENT_MSGPACK),
+            payload=data[unpacker.tell() :],
+        )
+
+    @classmethod
+    def from_message(cls, message: dict, session_id: Optional[str] = None) -> "Frame":
+        """Build the frame of a protocol message (`type`, `correlation_id` and body)."""
+        body = {key: value for key, value in message.items() if key not in ENVELOPE_KEYS}
+        return cls(
+            type=message["type"],
+            correlation_id=message.get("correlation_id"),
+            session_id=session_id,
+            payload=msgpack.packb(body) if body else b"",
+            body=body,
+        )
+
+    def content(self) -> dict:
+        """Return the body of the frame (every key of the message but its envelope)."""
+        if self.body is None:
+            if self.content_type in BINARY_CONTENT_TYPES:
+                self.body = {"content": self.payload}
+            elif not self.payload:
+                self.body = {}
+            elif self.content_type == CONTENT_JSON:
+                self.body = json.loads(self.payload)
+            else:
+                self.body = msgpack.unpackb(self.payload, raw=False)
+        return self.body
+
+    def to_message(self) -> dict:
+        """Return the frame as a protocol message."""
+        return {
+            "type": self.type,
+            "correlation_id": self.correlation_id,
+            **self.content(),
+        }
+
+    def validate(self, model: Type[T]) -> T:
+        """
+        Validate the `content` of the frame into a model.
+
+        Raises:
+            pydantic.ValidationError: If the content does not match the model.
+        """
+        return model.model_validate(self.content().get("content") or {})
+
+
+class WireCodec(ABC):
+    """
+    Sends and receives protocol messages over a robot websocket.
+    """
+
+    protocol: WireProtocol
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id
+
+    @abstractmethod
+    async def send(self, websocket: WebSocket, message: dict) -> None:
+        """Send a protocol message."""
+
+    @abstractmethod
+    def decode(self, message: dict) -> Optional[Frame]:
+        """
+        Decode a message received from the ASGI server.
+
+        Returns:
+            Optional[Frame]: The frame, or None if the message only announced the next one.
+
+        Raises:
+            FrameError: If the message is malformed.
+        """
+
+    async def receive(self, websocket: WebSocket) -> Frame:
+        """Receive the next frame from a websocket."""
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise RobotDisconnected("Robot disconnected")
+            frame = self.decode(message)
+            if frame is not None:
+                return frame
+
+    def _count(self, direction: str, size: int) -> None:
+        frames.add(protocol=self.protocol.value, direction=direction)
+        frame_bytes.record(size, protocol=self.protocol.value, direction=direction)
+
+
+class JsonCodec(WireCodec):
+    """
+    The original protocol: JSON text messages, screenshots in a separate binary frame.
+    """
+
+    protocol = WireProtocol.JSON
+
+    def __init__(self, session_id: Optional[str] = None):
+        super().__init__(session_id)
+        self._pending_screenshot: Optional[str] = None
+
+    async def send(self, websocket: WebSocket, message: dict) -> None:
+        text = json.dumps(message)
+        self._count("sent", len(text))
+        await websocket.send_text(text)
+
+    def decode(self, message: dict) -> Optional[Frame]:
+        if message.get("bytes") is not None:
+            data = message["bytes"]
+            self._count("received", len(data))
+            correlation_id, self._pending_screenshot = self._pending_screenshot, None
+            return Frame(
+                type="screenshot",
+                correlation_id=correlation_id,
+                content_type=CONTENT_JPEG,
+                payload=data,
+            )
+        text = message.get("text")
+        if text is None:
+            return None
+        self._count("received", len(text))
+        try:
+            data = json.loads(text)
+        except ValueError:
+            raise FrameError("Invalid JSON message")
+        if not isinstance(data, dict):
+            raise FrameError("Messages must be JSON objects")
+        if data.get("type") == "screenshot":
+            # The screenshot follows in a binary frame
+            self._pending_screenshot = data.get("correlation_id")
+            return None
+        return Frame(
+            type=data.get("type", ""),
+            correlation_id=data.get("correlation_id"),
+            session_id=self.session_id,
+            content_type=CONTENT_JSON,
+            payload=text.encode(),
+            body={key: value for key, value in data.items() if key not in ENVELOPE_KEYS},
+        )
+
+
+class MsgpackCodec(WireCodec):
+    """
+    Binary protocol: one frame per message, msgpack header and raw payload.
+    """
+
+    protocol = WireProtocol.MSGPACK
+
+    async def send(self, websocket: WebSocket, message: dict) -> None:
+        content = message.get("content")
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            frame = Frame(
+                type=message["type"],
+                correlation_id=message.get("correlation_id"),
+                session_id=self.session_id,
+                content_type=message.get("content_type", CONTENT_JPEG),
+                payload=bytes(content),
+            )
+        else:
+            frame = Frame.from_message(message, self.session_id)
+        data = frame.encode()
+        self._count("sent", len(data))
+        await websocket.send_bytes(data)
+
+    def decode(self, message: dict) -> Optional[Frame]:
+        data = message.get("bytes")
+        if data is None:
+            if message.get("text") is not None:
+                raise FrameError("Text messages are not part of the binary protocol")
+            return None
+        self._count("received", len(data))
+        return Frame.decode(data)
+
+
+CODECS: dict[WireProtocol, Type[WireCodec]] = {
+    WireProtocol.JSON: JsonCodec,
+    WireProtocol.MSGPACK: MsgpackCodec,
+}
+
+
+async def accept(websocket: WebSocket, session_id: Optional[str] = None) -> WireCodec:
+    """
+    Accept a robot websocket with the first subprotocol it offers that is supported.
+
+    Robots offering no subprotocol get the JSON protocol.
+
+    Args:
+        websocket (WebSocket): The websocket to accept
+        session_id (str): ID of the connection, sent in the binary frame headers
+
+    Returns:
+        WireCodec: The codec of the negotiated protocol
+    """
+    supported = {protocol.value: protocol for protocol in WireProtocol}
+    for offered in websocket.scope.get("subprotocols", []):
+        if offered in supported:
+            await websocket.accept(subprotocol=offered)
+            return CODECS[supported[offered]](session_id)
+    await websocket.accept()
+    return JsonCodec(session_id)
@@ -0,0 +1,267 @@
+"""
+Error Intake Queue for RPA Recovery Framework
+
+Decouples error intake from recovery. Exceptions are validated, persisted and
+enqueued in a priority queue so the submitter gets an acknowledgement in
+milliseconds, while a bounded pool of asyncio workers drains the queue and runs
+the gateway routing logic.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from fastapi import WebSocket
+
+import metrics
+from database.general import async_session
+from gateway.agent import robot_exception_handler
+from gateway.budget import RecoveryBudget
+from gateway.enums import JobStatus
+from gateway.models import RobotException, RobotExceptionRequest
+from settings import INTAKE_JOB_RETENTION, INTAKE_QUEUE_SIZE, INTAKE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+queue_depth = metrics.gauge("intake.queue_depth", "Exceptions waiting for a worker")
+submitted = metrics.counter("intake.submitted", "Exceptions accepted by the intake")
+rejected = metrics.counter("intake.rejected", "Exceptions rejected by a full queue")
+wait_time = metrics.histogram(
+    "intake.wait_time", "Time spent in the queue before a worker picks it up", "s"
+)
+processing_time = metrics.histogram(
+    "intake.processing_time", "Time spent routing and recovering an exception", "s"
+)
+cancelled = metrics.counter(
+    "intake.cancelled", "Exceptions cancelled before their recovery finished"
+)
+
+
+class IntakeQueueFull(Exception):
+    """Raised when an exception is submitted while the intake queue is full."""
+
+
+@dataclass
+class IntakeJob:
+    """
+    An exception waiting for, or going through, recovery.
+    """
+
+    id: uuid.UUID
+    request: RobotExceptionRequest
+    websocket: Optional[WebSocket] = None
+    status: JobStatus = JobStatus.QUEUED
+    created_at: datetime = field(default_factory=datetime.now)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[str] = None
+    budget: Optional[RecoveryBudget] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    task: Optional[asyncio.Task] = None  # Running the recovery, once a worker takes it
+
+    async def wait(self) -> str:
+        """Wait until the job is processed and return its result."""
+        await self.done.wait()
+        return self.result
+
+    def to_json(self) -> dict:
+        """Convert the job status to a dictionary structure."""
+        now = time.monotonic()
+        return {
+            "id": str(self.id),
+            "status": self.status.value,
+            "created_at": self.created_at.isoformat(),
+            "wait_time": (self.started_at or now) - self.enqueued_at,
+            "processing_time": (self.finished_at or now) - self.started_at
+            if self.started_at
+            else None,
+            "result": self.result,
+            "budget": self.budget.to_json() if self.budget else None,
+        }
+
+
+class IntakeQueue:
+    """
+    Priority queue of exceptions drained by a bounded pool of asyncio workers.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[IntakeJob], Awaitable[str]],
+        workers: int = INTAKE_WORKERS,
+        max_size: int = INTAKE_QUEUE_SIZE,
+        retention: int = INTAKE_JOB_RETENTION,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.retention = retention
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=max_size)
+        self._sequence = itertools.count()  # FIFO order within the same priority
+        self._jobs: OrderedDict[uuid.UUID, IntakeJob] = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+        self._reserved = 0  # Slots of exceptions being persisted, not queued yet
+
+    async def start(self) -> None:
+        """Start the worker pool."""
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"intake-worker-{n}")
+            for n in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Cancel the worker pool."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self, request: RobotExceptionRequest, websocket: Optional[WebSocket] = None
+    ) -> IntakeJob:
+        """
+        Persist an exception and enqueue it for recovery.
+
+        Args:
+            request (RobotExceptionRequest): The exception reported by the robot
+            websocket (WebSocket): Connection to the robot, required by modules that
+                interact with its UI. Exceptions submitted over REST have none.
+
+        Returns:
+            IntakeJob: The queued job, whose id is the persisted RobotException id.
+
+        Raises:
+            IntakeQueueFull: If the queue has reached its maximum size.
+        """
+        # Reserve the slot before persisting, so concurrent submissions cannot
+        # overfill the queue while the exception is written
+        if self._queue.maxsize and (
+            self._queue.qsize() + self._reserved >= self._queue.maxsize
+        ):
+            rejected.add()
+            raise IntakeQueueFull("Intake queue is full")
+        self._reserved += 1
+
+        row = RobotException(
+            code=request.code,
+            variables=request.variables,
+            exception_type=request.exception_type,
+            message=request.message or request.code,
+            details=json.dumps(request.details) if request.details else None,
+        )
+        job = IntakeJob(
+            id=row.id,
+            request=request,
+            websocket=websocket,
+            budget=RecoveryBudget.for_request(request),
+        )
+        try:
+            async with async_session() as session:
+                session.add(row)
+                await session.commit()
+        finally:
+            self._reserved -= 1
+
+        self._remember(job)
+        self._queue.put_nowait((request.priority, next(self._sequence), job))
+        submitted.add(priority=request.priority)
+        queue_depth.set(self._queue.qsize())
+        return job
+
+    def cancel(self, job_id: uuid.UUID, reason: str) -> bool:
+        """
+        Cancel a job, e.g. when the robot it recovers disconnects.
+
+        Queued jobs are skipped by the workers, running jobs have their recovery
+        cancelled, along with the model and tool calls in progress.
+
+        Args:
+            job_id (uuid.UUID): Id of the job
+            reason (str): Why the job is cancelled, kept as its result
+
+        Returns:
+            bool: Whether the job was cancelled, False if it was unknown or finished.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.done.is_set() or job.status == JobStatus.CANCELLED:
+            return False
+        if job.task is not None and job.task.done():
+            return False  # Finished, the worker is storing its result
+        job.status = JobStatus.CANCELLED
+        job.result = reason
+        cancelled.add()
+        if job.task is not None:
+            job.task.cancel()  # The worker finishes the job
+        else:
+            job.done.set()
+        return True
+
+    def get(self, job_id: uuid.UUID) -> Optional[IntakeJob]:
+        """Return a job known to this process, if any."""
+        return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        """Return the current state of the queue."""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "workers": len(self._tasks),
+            "running": sum(
+                1 for job in self._jobs.values() if job.status == JobStatus.RUNNING
+            ),
+        }
+
+    def _remember(self, job: IntakeJob) -> None:
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.retention:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest.done.is_set():
+                break
+            del self._jobs[oldest_id]
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            queue_depth.set(self._queue.qsize())
+            if job.status == JobStatus.CANCELLED:
+                self._queue.task_done()
+                continue
+            job.started_at = time.monotonic()
+            job.status = JobStatus.RUNNING
+            wait_time.record(job.started_at - job.enqueued_at)
+            job.budget.record("queue", job.started_at - job.enqueued_at)
+            # The recovery runs in its own task, so cancelling it leaves the worker running
+            job.task = asyncio.create_task(self.handler(job))
+            try:
+                result = await job.task
+                if job.status != JobStatus.CANCELLED:
+                    job.result, job.status = result, JobStatus.COMPLETED
+            except asyncio.CancelledError:
+                if job.status != JobStatus.CANCELLED:
+                    raise  # The worker itself is stopping
+                logger.info("Cancelled exception %s: %s", job.id, job.result)
+            except Exception as e:
+                logger.exception("Failed to process exception %s", job.id)
+                job.result = f"Failed to process error notification: {e}"
+                job.status = JobStatus.FAILED
+            finally:
+                job.finished_at = time.monotonic()
+                processing_time.record(job.finished_at - job.started_at)
+                job.done.set()
+                self._queue.task_done()
+
+
+async def route_job(job: IntakeJob) -> str:
+    """Run the gateway routing logic for a queued exception."""
+    return await robot_exception_handler(
+        job.request, job.websocket, job.id, job.budget
+    )
+
+
+intake_queue = IntakeQueue(route_job)
@@ -1,14 +1,16 @@
 # Defines the data models for the gateway service
 
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column
+from sqlalchemy import Column, Index
 from sqlalchemy.dialects.postgresql import JSON
 from typing import Optional
 from datetime import datetime
-from gateway.enums import ExceptionType
+from gateway.enums import CommandType, ExceptionType
 from agent_tools.links import ToolModuleLink
+from database.columns import TimestampField, uuid7
 import uuid
-from pydantic import BaseModel
+from pydantic import BaseModel, Field as PydanticField
+from settings import INTAKE_DEFAULT_PRIORITY
 
 
 class Module(SQLModel, table=True):
@@ -17,13 +19,12 @@ class Module(SQLModel, table=True):
     """
 
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the module.",
         primary_key=True,
     )
-    timestamp: str = Field(
-        datetime.now(),
-        description="Timestamp of when the exception record was created.",
+    timestamp: datetime = TimestampField(
+        "Timestamp of when the exception record was created."
     )
     name: str = Field(..., description="Name of the module.")
     description: str = Field(
@@ -42,12 +43,13 @@ class Module(SQLModel, table=True):
         sa_relationship_kwargs={"lazy": "joined"},
         link_model=ToolModuleLink,
     )
+    routing_rules: list["RoutingRule"] = Relationship(back_populates="module")
 
     def to_json(self) -> dict:
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "name": self.name,
             "description": self.description,
             "enabled": self.enabled,
@@ -60,19 +62,84 @@ class Module(SQLModel, table=True):
         }
 
 
+class RoutingRule(SQLModel, table=True):
+    """
+    Represents a deterministic routing rule. Exceptions matching every pattern set
+    in the rule are dispatched straight to the module's routing tool, without
+    going through the gateway agent.
+    """
+
+    __table_args__ = (
+        Index("ix_routingrule_module_id", "module_id"),
+    )
+
+    id: uuid.UUID = Field(
+        default_factory=uuid7,
+        description="Unique identifier for the routing rule.",
+        primary_key=True,
+    )
+    module_id: uuid.UUID = Field(
+        ...,
+        foreign_key="module.id",
+        description="ID of the module the matching exceptions are routed to.",
+    )
+    priority: int = Field(
+        100, description="Evaluation order of the rule. Lower values are evaluated first."
+    )
+    enabled: bool = Field(
+        True, description="Indicates whether the rule is enabled or not."
+    )
+    code_pattern: Optional[str] = Field(
+        None, description="Regular expression the whole exception code must match."
+    )
+    exception_type: Optional[ExceptionType] = Field(
+        None, description="Exception type the exception must have."
+    )
+    message_regex: Optional[str] = Field(
+        None, description="Regular expression searched in the exception message."
+    )
+    variables_keys: Optional[list] = Field(
+        None,
+        description="Keys that must all be present in the exception variables.",
+        sa_column=Column(JSON),
+    )
+    module: Optional[Module] = Relationship(back_populates="routing_rules")
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def to_json(self) -> dict:
+        """Convert the model to a dictionary structure."""
+        return {
+            "id": str(self.id),
+            "module_id": str(self.module_id),
+            "priority": self.priority,
+            "enabled": self.enabled,
+            "code_pattern": self.code_pattern,
+            "exception_type": self.exception_type.value
+            if self.exception_type
+            else None,
+            "message_regex": self.message_regex,
+            "variables_keys": self.variables_keys,
+        }
+
+
 class RobotException(SQLModel, table=True):
     """
     Represents an exception to be routed for resolution by the gateway service.
     """
 
+    __table_args__ = (
+        Index("ix_robotexception_timestamp", "timestamp"),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the exception.",
         primary_key=True,
     )
-    timestamp: str = Field(
-        datetime.now(),
-        description="Timestamp of when the exception record was created.",
+    timestamp: datetime = TimestampField(
+        "Timestamp of when the exception record was created."
     )
     code: str = Field(..., description="The error code associated with the exception.")
     variables: Optional[dict] = Field(
@@ -95,7 +162,7 @@ class RobotException(SQLModel, table=True):
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "code": self.code,
             "exception_type": self.exception_type.value
             if self.exception_type
@@ -110,14 +177,17 @@ class Result(SQLModel, table=True):
     Represents the result of an exception resolve operation.
     """
 
+    __table_args__ = (
+        Index("ix_result_audit_id", "audit_id"),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the result.",
         primary_key=True,
     )
-    timestamp: str = Field(
-        datetime.now(),
-        description="Timestamp of when the exception record was created.",
+    timestamp: datetime = TimestampField(
+        "Timestamp of when the exception record was created."
     )
     solved: bool = Field(
         ..., description="Indicates whether the exception was successfully resolved."
@@ -135,7 +205,7 @@ class Result(SQLModel, table=True):
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "solved": self.solved,
             "has_fix": self.has_fix,
             "audit_id": str(self.audit_id),
@@ -147,14 +217,18 @@ class Audit(SQLModel, table=True):
     Represents an audit record for the routing of an Exception.
     """
 
+    __table_args__ = (
+        Index("ix_audit_exception_id_timestamp", "exception_id", "timestamp"),
+        Index("ix_audit_module_id_timestamp", "module_id", "timestamp"),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the audit record.",
         primary_key=True,
     )
-    timestamp: str = Field(
-        datetime.now(),
-        description="Timestamp of when the exception record was created.",
+    timestamp: datetime = TimestampField(
+        "Timestamp of when the exception record was created."
     )
     reasoning: str = Field(
         ..., description="The reasoning behind the routing decision."
@@ -174,7 +248,7 @@ class Audit(SQLModel, table=True):
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "reasoning": self.reasoning,
             "module_id": str(self.module_id),
             "exception_id": str(self.exception_id),
@@ -186,10 +260,104 @@ class Audit(SQLModel, table=True):
 ####################
 
 
+class ScreenInfo(BaseModel):
+    """
+    Screen of a robot, as reported in its hello message or with an exception.
+
+    Actions are sent in logical coordinates. With display scaling, screenshots are
+    `scale` times larger than the logical screen.
+    """
+
+    width: Optional[int] = PydanticField(None, gt=0, description="Logical width.")
+    height: Optional[int] = PydanticField(None, gt=0, description="Logical height.")
+    scale: float = PydanticField(
+        1.0, gt=0, description="Screenshot pixels per logical pixel (DPI scaling)."
+    )
+
+    def size(self, frame_width: int, frame_height: int) -> tuple[int, int]:
+        """
+        Return the (height, width) of the logical screen.
+
+        Args:
+            frame_width (int): Width of a screenshot of the screen
+            frame_height (int): Height of a screenshot of the screen
+        """
+        if self.width and self.height:
+            return self.height, self.width
+        return round(frame_height / self.scale), round(frame_width / self.scale)
+
+
 class RobotExceptionRequest(BaseModel):
     code: str
     variables: Optional[dict]
     details: Optional[dict]
+    exception_type: ExceptionType = ExceptionType.ROBOT_EXCEPTION
+    message: Optional[str] = None
+    priority: int = PydanticField(
+        INTAKE_DEFAULT_PRIORITY,
+        description="Intake priority of the exception. Lower values are processed first.",
+    )
+    deadline: Optional[float] = PydanticField(
+        None,
+        gt=0,
+        description="Seconds the robot can wait for the recovery. Defaults to RECOVERY_DEADLINE.",
+    )
+    token_budget: Optional[int] = PydanticField(
+        None,
+        gt=0,
+        description="Maximum tokens the recovery can consume. Defaults to RECOVERY_TOKEN_BUDGET.",
+    )
+    screen: Optional[ScreenInfo] = PydanticField(
+        None,
+        description="Screen of the robot. Defaults to the size of its screenshots.",
+    )
 
     def __str__(self):
         return super().__str__()
+
+
+class ActionCommand(BaseModel):
+    """
+    A UI action sent to robots that run actions natively, instead of code.
+
+    Coordinates are screen pixels. Only the fields of the action are sent.
+    """
+
+    id: str = PydanticField(default_factory=lambda: str(uuid7()))
+    action: CommandType
+    x: Optional[float] = None
+    y: Optional[float] = None
+    end_x: Optional[float] = PydanticField(None, description="Drop point of a drag.")
+    end_y: Optional[float] = None
+    button: Optional[str] = PydanticField(None, description="left or right.")
+    clicks: Optional[int] = None
+    keys: Optional[list[str]] = PydanticField(
+        None, description="Keys pressed together, or the key of key_down and key_up."
+    )
+    text: Optional[str] = None
+    submit: Optional[bool] = PydanticField(None, description="Press enter after typing.")
+    amount: Optional[int] = PydanticField(
+        None, description="Scroll clicks, positive scrolls up."
+    )
+
+    def to_message(self) -> dict:
+        """Return the command as the content of an action message."""
+        return self.model_dump(mode="json", exclude_none=True)
+
+
+class ActionAck(BaseModel):
+    """
+    Completion of an action command, reported by the robot.
+    """
+
+    id: str
+    ok: bool = True
+    error: Optional[str] = None
+    duration: Optional[float] = PydanticField(
+        None, description="Seconds the robot took to run the action."
+    )
+
+
+class ModuleUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    description: Optional[str] = None
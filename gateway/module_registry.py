@@ -0,0 +1,170 @@
+"""
+Module Registry for RPA Recovery Framework
+
+Keeps the recovery modules, with their tools, in memory so the gateway does not
+query Postgres on every routing decision. The registry holds the serialized module
+list served by the `available_modules` tool and the routing tools of the enabled
+modules.
+
+The registry is loaded at startup and refreshed:
+- right after a write through the gateway API,
+- when Postgres notifies a change of the module, routing rule or tool link tables
+  (LISTEN/NOTIFY, see database.general.install_change_notifications),
+- periodically, as a fallback for missed notifications or a lost listener connection.
+
+Refreshing also reloads the routing table of the pre-router, whose rules only apply
+to enabled modules.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import metrics
+from gateway.models import Module
+from gateway.prerouter import routing_table
+from settings import MODULE_REGISTRY_NOTIFY, MODULE_REGISTRY_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+MODULE_CHANGES_CHANNEL = "module_changes"
+
+lookups = metrics.counter(
+    "module_registry.lookups", "Module registry lookups, by result (hit or miss)"
+)
+refreshes = metrics.counter(
+    "module_registry.refreshes", "Module registry reloads, by trigger"
+)
+staleness = metrics.gauge(
+    "module_registry.staleness", "Seconds since the module registry was last loaded"
+)
+
+
+class ModuleRegistry:
+    """
+    In-memory copy of the recovery modules.
+    """
+
+    def __init__(
+        self,
+        notify: bool = MODULE_REGISTRY_NOTIFY,
+        poll_interval: float = MODULE_REGISTRY_POLL_INTERVAL,
+    ):
+        self.notify = notify
+        self.poll_interval = poll_interval
+        self.engine: Optional[AsyncEngine] = None
+        self._modules: Optional[list[dict]] = None
+        self._routing_tools: frozenset[str] = frozenset()
+        self._module_ids: dict[str, uuid.UUID] = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self, engine: AsyncEngine) -> None:
+        """Load the registry and start watching for changes."""
+        self.engine = engine
+        await self.refresh("startup")
+        self._tasks.append(asyncio.create_task(self._poll()))
+        if self.notify:
+            self._tasks.append(asyncio.create_task(self._listen()))
+
+    async def stop(self) -> None:
+        """Stop watching for changes."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def refresh(self, trigger: str = "write") -> None:
+        """
+        Reload the modules from the database.
+
+        Args:
+            trigger (str): What caused the reload, for metrics
+        """
+        async with self._lock:
+            async with AsyncSession(self.engine) as session:
+                modules = (await session.exec(select(Module))).unique().all()
+                serialized = [module.to_json() for module in modules]
+            await routing_table.load(self.engine)
+
+            self._modules = [module for module in serialized if module["enabled"]]
+            self._routing_tools = frozenset(
+                module["routing_tool"] for module in self._modules
+            )
+            self._module_ids = {
+                module["routing_tool"]: uuid.UUID(module["id"])
+                for module in self._modules
+            }
+            self._loaded_at = time.monotonic()
+            refreshes.add(trigger=trigger)
+            staleness.set(0)
+
+    async def modules(self) -> list[dict]:
+        """Return the serialized enabled modules, loading them if needed."""
+        if self._modules is None:
+            lookups.add(result="miss")
+            await self.refresh("miss")
+        else:
+            lookups.add(result="hit")
+            staleness.set(time.monotonic() - self._loaded_at)
+        return self._modules
+
+    def routing_tools(self) -> frozenset[str]:
+        """Return the routing tools of the enabled modules."""
+        return self._routing_tools
+
+    def is_enabled(self, routing_tool: str) -> bool:
+        """Check whether a routing tool belongs to an enabled module."""
+        return routing_tool in self._routing_tools
+
+    def module_id(self, routing_tool: str) -> Optional[uuid.UUID]:
+        """Return the ID of the enabled module owning a routing tool, if any."""
+        return self._module_ids.get(routing_tool)
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh("poll")
+            except Exception as e:
+                logger.warning("Could not refresh the module registry: %s", e)
+
+    async def _listen(self) -> None:
+        """Reload the registry on every change notified by Postgres, reconnecting on failure."""
+        changed = asyncio.Event()
+
+        def on_notification(connection, pid, channel, payload) -> None:
+            changed.set()
+
+        while True:
+            try:
+                async with self.engine.connect() as connection:
+                    raw = await connection.get_raw_connection()
+                    driver = raw.driver_connection
+                    await driver.add_listener(MODULE_CHANGES_CHANNEL, on_notification)
+                    try:
+                        while True:
+                            await changed.wait()
+                            changed.clear()
+                            await self.refresh("notify")
+                    finally:
+                        await driver.remove_listener(
+                            MODULE_CHANGES_CHANNEL, on_notification
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    "Lost the module change listener, polling only for now: %s", e
+                )
+                await asyncio.sleep(self.poll_interval)
+
+
+module_registry = ModuleRegistry()
@@ -0,0 +1,111 @@
+"""
+Rule-based Pre-Router for RPA Recovery Framework
+
+Compiles the `RoutingRule` rows of enabled modules into an in-memory routing table
+that is evaluated before the gateway agent is invoked. Exceptions with a known
+signature are dispatched directly to the module's routing tool; the gateway agent
+is only used when no rule matches.
+"""
+
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import metrics
+from gateway.enums import ExceptionType
+from gateway.models import Module, RobotExceptionRequest, RoutingRule
+
+routing_decisions = metrics.counter(
+    "routing.decisions", "Routing decisions, by path (rules or llm)"
+)
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """
+    A routing rule with its patterns compiled, ready to be matched.
+    """
+
+    rule_id: uuid.UUID
+    module_id: uuid.UUID
+    routing_tool: str
+    priority: int
+    code: Optional[re.Pattern]
+    exception_type: Optional[ExceptionType]
+    message: Optional[re.Pattern]
+    variables_keys: frozenset[str]
+
+    @classmethod
+    def from_rule(cls, rule: RoutingRule, module: Module) -> "CompiledRule":
+        return cls(
+            rule_id=rule.id,
+            module_id=module.id,
+            routing_tool=module.routing_tool,
+            priority=rule.priority,
+            code=re.compile(rule.code_pattern) if rule.code_pattern else None,
+            exception_type=rule.exception_type,
+            message=re.compile(rule.message_regex) if rule.message_regex else None,
+            variables_keys=frozenset(rule.variables_keys or []),
+        )
+
+    def matches(self, exception: RobotExceptionRequest) -> bool:
+        """Check whether the exception satisfies every pattern of the rule."""
+        if self.exception_type and exception.exception_type != self.exception_type:
+            return False
+        if self.code and not self.code.fullmatch(exception.code):
+            return False
+        if self.message and not self.message.search(exception.message or ""):
+            return False
+        if self.variables_keys and not self.variables_keys.issubset(
+            exception.variables or {}
+        ):
+            return False
+        return True
+
+
+class RoutingTable:
+    """
+    Ordered list of compiled routing rules.
+    """
+
+    def __init__(self, rules: Optional[list[CompiledRule]] = None):
+        self.rules = sorted(rules or [], key=lambda rule: rule.priority)
+
+    async def load(self, engine: AsyncEngine) -> None:
+        """(Re)compile the enabled rules of enabled modules from the database."""
+        async with AsyncSession(engine) as session:
+            rows = (
+                await session.exec(
+                    select(RoutingRule, Module)
+                    .join(Module, RoutingRule.module_id == Module.id)
+                    .where(RoutingRule.enabled, Module.enabled)
+                )
+            ).unique()
+            rules = [CompiledRule.from_rule(rule, module) for rule, module in rows]
+        self.rules = sorted(rules, key=lambda rule: rule.priority)
+
+    def match(self, exception: RobotExceptionRequest) -> Optional[CompiledRule]:
+        """Return the first rule matching the exception, if any."""
+        for rule in self.rules:
+            if rule.matches(exception):
+                return rule
+        return None
+
+
+routing_table = RoutingTable()
+
+
+def routing_stats() -> dict:
+    """Return the number of routing decisions per path and the LLM-avoidance rate."""
+    rules = routing_decisions.value(path="rules")
+    llm = routing_decisions.value(path="llm")
+    return {
+        "rules": rules,
+        "llm": llm,
+        "llm_avoidance_rate": rules / (rules + llm) if rules + llm else None,
+    }
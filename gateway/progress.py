@@ -0,0 +1,82 @@
+"""
+Recovery Progress Streaming for RPA Recovery Framework
+
+Forwards incremental events of a recovery session (routing decided, plan produced,
+step started/finished, action dispatched, verification result) to the robot as
+typed websocket messages, with timing stamps, before the final "done" message:
+
+    {"type": "progress", "event": "<ProgressEvent>", "timestamp": "<ISO 8601>",
+     "elapsed_ms": <ms since the session started>, "content": {...}}
+
+Robots opt in, as existing robots take any message other than "code" for the final
+answer: with the `progress` capability of the session hello on /robot/ws, or the
+`progress=true` query parameter on /robot_exception/ws. Events are recorded for the
+partial reports either way.
+"""
+
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+import metrics
+from gateway.enums import ProgressEvent
+
+logger = logging.getLogger(__name__)
+
+time_to_first_decision = metrics.histogram(
+    "progress.time_to_first_decision",
+    "Time from the start of a recovery session to its routing decision",
+    "s",
+)
+events_sent = metrics.counter("progress.events", "Progress events sent, by event")
+
+
+class ProgressReporter:
+    """
+    Sends the progress events of one recovery session to the robot.
+
+    Progress is best-effort: failing to deliver an event never interrupts the recovery.
+    """
+
+    def __init__(self, websocket, started_at: Optional[float] = None):
+        self.websocket = websocket
+        self.started_at = started_at or time.monotonic()
+        self.events: list[dict] = []  # Sent so far, for partial reports
+        self._decided = False
+
+    async def emit(self, event: ProgressEvent, **content) -> None:
+        """
+        Send a progress event.
+
+        Args:
+            event (ProgressEvent): The type of event
+            **content: JSON-serializable details of the event
+        """
+        elapsed = time.monotonic() - self.started_at
+        if event == ProgressEvent.ROUTING_DECIDED and not self._decided:
+            self._decided = True
+            time_to_first_decision.record(elapsed)
+        message = {
+            "type": "progress",
+            "event": event.value,
+            "timestamp": datetime.now().isoformat(),
+            "elapsed_ms": round(elapsed * 1000),
+            "content": content,
+        }
+        self.events.append(message)
+        if not getattr(self.websocket, "progress_events", False):
+            return
+
+        events_sent.add(event=event.value)
+        try:
+            await self.websocket.send_json(message)
+        except Exception as e:
+            logger.debug("Could not send progress event %s: %s", event.value, e)
+
+
+async def emit_progress(state: dict, event: ProgressEvent, **content) -> None:
+    """Emit a progress event through the reporter of a session state, if any."""
+    progress = state.get("progress")
+    if progress is not None:
+        await progress.emit(event, **content)
@@ -0,0 +1,103 @@
+# REST endpoints of the gateway: error intake, status and metrics.
+import uuid
+
+from fastapi import APIRouter, HTTPException, Response, status
+from sqlmodel import select
+
+import metrics
+from agent_tools.screenshot_store import REF_PREFIX, screenshot_store
+from database.general import SessionDep
+from gateway.coalescing import coalescing_stats
+from gateway.intake import IntakeQueueFull, intake_queue
+from gateway.models import Module, ModuleUpdate, RobotException, RobotExceptionRequest
+from gateway.module_registry import module_registry
+from gateway.prerouter import routing_stats
+from providers.registry import model_registry
+
+router = APIRouter(prefix="/api/v1")
+
+
+@router.post("/errors", status_code=status.HTTP_202_ACCEPTED)
+async def submit_error(request: RobotExceptionRequest) -> dict:
+    """
+    Accepts an exception for asynchronous recovery and returns its id.
+    """
+    try:
+        job = await intake_queue.submit(request)
+    except IntakeQueueFull as e:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, str(e))
+    return {"id": str(job.id), "status": job.status.value}
+
+
+@router.get("/errors/{error_id}/status")
+async def error_status(error_id: uuid.UUID, session: SessionDep) -> dict:
+    """
+    Returns the processing status of a submitted exception.
+    """
+    job = intake_queue.get(error_id)
+    if job is not None:
+        return job.to_json()
+
+    # Exceptions submitted before a restart, or evicted from memory
+    exception = (
+        await session.exec(select(RobotException).where(RobotException.id == error_id))
+    ).first()
+    if exception is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Exception not found")
+    return {"id": str(exception.id), "status": "unknown"}
+
+
+@router.get("/modules")
+async def list_modules() -> list[dict]:
+    """
+    Returns the enabled recovery modules, as served to the gateway agent.
+    """
+    return await module_registry.modules()
+
+
+@router.patch("/modules/{module_id}")
+async def update_module(
+    module_id: uuid.UUID, update: ModuleUpdate, session: SessionDep
+) -> dict:
+    """
+    Updates a recovery module (e.g. enables or disables it). The change applies to
+    the next routing decision, without restarting the service.
+    """
+    module = await session.get(Module, module_id)
+    if module is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Module not found")
+    for key, value in update.model_dump(exclude_unset=True).items():
+        setattr(module, key, value)
+    session.add(module)
+    await session.commit()
+    await session.refresh(module)
+    module_json = module.to_json()
+
+    await module_registry.refresh("write")
+    return module_json
+
+
+@router.get("/screenshots/{digest}")
+async def get_screenshot(digest: str) -> Response:
+    """
+    Returns a screenshot of the screenshot store, by the SHA-256 of its
+    `screenshot://` reference.
+    """
+    data = await screenshot_store.get(REF_PREFIX + digest)
+    if data is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Screenshot not found")
+    return Response(content=data, media_type="image/jpeg")
+
+
+@router.get("/metrics")
+async def get_metrics() -> dict:
+    """
+    Returns the current value of the framework metrics.
+    """
+    return {
+        "intake": intake_queue.stats(),
+        "routing": routing_stats(),
+        "coalescing": coalescing_stats(),
+        "providers": model_registry.breaker_states(),
+        "metrics": metrics.snapshot(),
+    }
@@ -0,0 +1,564 @@
+"""
+Robot Sessions for RPA Recovery Framework
+
+A robot keeps one long-lived websocket open and multiplexes any number of
+exceptions over it. Every message of a recovery carries the correlation id chosen
+by the robot when reporting the exception, so screenshots and code are routed to
+the right recovery session.
+
+Protocol messages, shown in the JSON protocol (JSON text messages, screenshots as
+binary frames). With the binary protocol negotiated by the robot, each message is a
+single binary frame, screenshots included (see gateway.framing):
+
+    robot -> server
+        {"type": "hello", "content": {"capabilities": ["push_screenshots", "native_actions",
+                                                       "progress"],
+                                      "screen": {ScreenInfo}}}
+        {"type": "exception", "correlation_id": "<id>", "content": {RobotExceptionRequest}}
+        {"type": "screenshot", "correlation_id": "<id>"}  followed by one binary frame
+        {"type": "action_done", "correlation_id": "<id>", "content": {ActionAck}}
+        {"type": "heartbeat"}
+    server -> robot
+        {"type": "hello", "content": {"session_id": "<id>", "protocol": "<subprotocol>",
+                                      "capabilities": [<accepted capabilities>]}}
+        {"type": "accepted", "correlation_id": "<id>", "content": {"id": "<exception id>"}}
+        {"type": "request_screenshot", "correlation_id": "<id>", "content": ""}
+        {"type": "code", "correlation_id": "<id>", "content": "<code>"}
+        {"type": "action", "correlation_id": "<id>", "content": {ActionCommand}}
+        {"type": "actions", "correlation_id": "<id>", "content": {"commands": [{ActionCommand}]}}
+        {"type": "progress", "correlation_id": "<id>", "event": "<ProgressEvent>", ...}
+        {"type": "done", "correlation_id": "<id>", "content": "<response>"}
+        {"type": "error", "correlation_id": "<id>", "content": "<reason>"}
+        {"type": "heartbeat"}
+
+Any other message carrying a correlation id is delivered to that recovery session.
+When the robot disconnects, its recoveries are cancelled through the intake queue:
+queued ones never start, and running ones stop their model and tool calls.
+
+Screenshots are pulled with `request_screenshot`, or pushed by the robot: a
+screenshot sent right after an exception is the screen at the moment of the
+failure, and robots declaring `push_screenshots` send one after running each
+`code` or `action` message. Pushed screenshots are used when available, the server
+pulls otherwise.
+
+Robots declaring `native_actions` get UI actions as typed `action` commands (click,
+type, hotkey, scroll, drag... with screen coordinates) instead of generated Python
+code, and acknowledge each one with an `action_done` message carrying its id, its
+outcome and how long it took. Several actions can be sent at once in an `actions`
+message: the robot runs them in order, acknowledges each one and stops at the first
+that fails, skipping the rest. Actions without a native command are still sent as
+`code`.
+
+Actions are grounded on the screen the robot reports, in its hello message or with
+each exception (`screen`: logical size and display scale factor), and on the size of
+its screenshots otherwise.
+
+Both endpoints negotiate the wire protocol, robots that offer no subprotocol keep
+the JSON protocol.
+
+Migration: the single-shot protocol of /robot_exception/ws is unchanged and keeps
+accepting one exception per connection. It is equivalent to a session with a single
+exception whose correlation id is implicit, so robots can move to /robot/ws by
+wrapping their existing messages in the envelope above.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+import metrics
+from agent_tools.frame_cache import FrameCache
+from database.columns import uuid7
+from gateway.framing import (
+    Frame,
+    FrameError,
+    JsonCodec,
+    RobotDisconnected,
+    WireCodec,
+    accept,
+)
+from gateway.intake import IntakeQueueFull, intake_queue
+from gateway.models import ActionAck, ActionCommand, RobotExceptionRequest, ScreenInfo
+from settings import (
+    ROBOT_HEARTBEAT_INTERVAL,
+    ROBOT_HEARTBEAT_TIMEOUT,
+    ROBOT_SESSION_MAX_CONCURRENCY,
+)
+
+logger = logging.getLogger(__name__)
+
+open_sessions = metrics.gauge("robot.sessions", "Open multiplexed robot connections")
+active_recoveries = metrics.gauge(
+    "robot.active_recoveries", "Recoveries in progress over multiplexed connections"
+)
+rejected_exceptions = metrics.counter(
+    "robot.rejected_exceptions", "Exceptions rejected by a robot connection, by reason"
+)
+action_latency = metrics.histogram(
+    "robot.action_latency",
+    "Time from sending an action command to its ack, by action and result",
+    "s",
+)
+action_duration = metrics.histogram(
+    "robot.action_duration", "Time robots report running an action command took", "s"
+)
+
+# Optional behaviours a robot can declare in its hello message
+SUPPORTED_CAPABILITIES = frozenset({"push_screenshots", "native_actions", "progress"})
+
+# Messages that make the robot act on its screen
+ACTION_MESSAGE_TYPES = ("code", "action", "actions")
+
+
+class RobotChannel(ABC):
+    """
+    Connection to a robot as seen by a single recovery session.
+
+    Exposes the subset of the WebSocket interface used by agents and tools, so they
+    work the same whether the robot uses a single-shot or a multiplexed connection.
+
+    Channels count the actions sent to the robot (`action_epoch`): screenshots taken
+    in the same epoch show the same screen, and are served by `frames`.
+    """
+
+    push_screenshots = False  # Whether the robot pushes a screenshot after each action
+    native_actions = False  # Whether the robot runs action commands instead of code
+    progress_events = False  # Whether the robot accepts progress messages, see gateway.progress
+
+    def __init__(self):
+        self.action_epoch = 0
+        self.frames = FrameCache()
+        self.screen: Optional[ScreenInfo] = None  # As reported by the robot, if it did
+
+    def screen_size(self, frame_width: int, frame_height: int) -> tuple[int, int]:
+        """
+        Return the (height, width) of the robot screen, in the coordinates of its actions.
+
+        Args:
+            frame_width (int): Width of a screenshot of the robot screen
+            frame_height (int): Height of a screenshot of the robot screen
+        """
+        if self.screen is None:
+            return frame_height, frame_width
+        return self.screen.size(frame_width, frame_height)
+
+    async def send_json(self, data: dict) -> None:
+        if data.get("type") in ACTION_MESSAGE_TYPES:
+            self.action_epoch += 1
+        await self._send_json(data)
+
+    @abstractmethod
+    async def _send_json(self, data: dict) -> None:
+        """Send a message to the robot, without counting actions."""
+
+    @abstractmethod
+    async def receive_bytes(self) -> bytes:
+        """Wait for the next screenshot of the robot."""
+
+    @abstractmethod
+    async def receive_json(self) -> dict:
+        """Wait for the next message of the robot."""
+
+    async def request_screenshot(self, timeout: float) -> bytes:
+        """Ask the robot for a screenshot and wait for it."""
+        await self.send_json({"type": "request_screenshot", "content": ""})
+        return await asyncio.wait_for(self.receive_bytes(), timeout=timeout)
+
+    async def pushed_screenshot(self, wait: float) -> Optional[bytes]:
+        """
+        Return the screenshot pushed by the robot in the current action epoch, if any.
+
+        Args:
+            wait (float): Seconds to wait for the push, if the robot pushes screenshots
+        """
+        return None
+
+    async def run_action(self, command: ActionCommand, timeout: float) -> ActionAck:
+        """
+        Send an action command and wait for the robot to acknowledge it.
+
+        Only for robots with `native_actions`.
+
+        Raises:
+            TimeoutError: If the robot does not acknowledge the action in time.
+        """
+        raise NotImplementedError
+
+    async def run_actions(
+        self, commands: list[ActionCommand], timeout: float
+    ) -> list[ActionAck]:
+        """
+        Send action commands as one batch and wait for the robot to acknowledge them.
+
+        The robot runs the commands in order and stops at the first that fails. Only
+        for robots with `native_actions`.
+
+        Returns:
+            list[ActionAck]: The acks, up to the first failed action included.
+
+        Raises:
+            TimeoutError: If the robot does not acknowledge an action in time.
+        """
+        raise NotImplementedError
+
+
+class WebSocketChannel(RobotChannel):
+    """
+    Channel over a dedicated websocket (single-shot protocol).
+    """
+
+    def __init__(self, websocket: WebSocket, codec: Optional[WireCodec] = None):
+        super().__init__()
+        self.websocket = websocket
+        self.codec = codec or JsonCodec()
+
+    async def _send_json(self, data: dict) -> None:
+        await self.codec.send(self.websocket, data)
+
+    async def receive_bytes(self) -> bytes:
+        frame = await self.codec.receive(self.websocket)
+        if frame.type != "screenshot":
+            raise FrameError(f"Expected a screenshot, got a {frame.type} message")
+        return frame.payload
+
+    async def receive_json(self) -> dict:
+        return (await self.codec.receive(self.websocket)).to_message()
+
+
+_DISCONNECTED = object()
+
+
+class SessionChannel(RobotChannel):
+    """
+    Channel of one recovery session multiplexed over a robot connection.
+    """
+
+    def __init__(self, session: "RobotSession", correlation_id: str):
+        super().__init__()
+        self.session = session
+        self.correlation_id = correlation_id
+        self.job_id: Optional[uuid.UUID] = None  # Set once the exception is queued
+        self._bytes: asyncio.Queue = asyncio.Queue()
+        self._json: asyncio.Queue = asyncio.Queue()
+        self._pulls = 0
+        self._pushed: Optional[bytes] = None
+        self._pushed_epoch = -1
+        self._pushed_arrived = asyncio.Event()
+        self._acks: dict[str, asyncio.Future] = {}
+
+    @property
+    def push_screenshots(self) -> bool:
+        return self.session.push_screenshots
+
+    @property
+    def native_actions(self) -> bool:
+        return self.session.native_actions
+
+    @property
+    def progress_events(self) -> bool:
+        return self.session.progress_events
+
+    async def _send_json(self, data: dict) -> None:
+        await self.session.send_json({**data, "correlation_id": self.correlation_id})
+
+    async def request_screenshot(self, timeout: float) -> bytes:
+        self._pulls += 1
+        try:
+            return await super().request_screenshot(timeout)
+        finally:
+            self._pulls -= 1
+
+    async def pushed_screenshot(self, wait: float) -> Optional[bytes]:
+        epoch = self.action_epoch
+        if self._pushed_epoch != epoch and self.push_screenshots and wait > 0:
+            self._pushed_arrived.clear()
+            try:
+                await asyncio.wait_for(self._pushed_arrived.wait(), timeout=wait)
+            except TimeoutError:
+                pass
+        return self._pushed if self._pushed_epoch == epoch else None
+
+    async def run_action(self, command: ActionCommand, timeout: float) -> ActionAck:
+        message = {"type": "action", "content": command.to_message()}
+        return (await self._run_commands(message, [command], timeout))[0]
+
+    async def run_actions(
+        self, commands: list[ActionCommand], timeout: float
+    ) -> list[ActionAck]:
+        message = {
+            "type": "actions",
+            "content": {"commands": [command.to_message() for command in commands]},
+        }
+        return await self._run_commands(message, commands, timeout)
+
+    async def _run_commands(
+        self, message: dict, commands: list[ActionCommand], timeout: float
+    ) -> list[ActionAck]:
+        loop = asyncio.get_running_loop()
+        pending = {command.id: loop.create_future() for command in commands}
+        self._acks.update(pending)
+        started = time.monotonic()
+        acks = []
+        try:
+            await self.send_json(message)
+            for command in commands:
+                result = "timeout"
+                try:
+                    async with asyncio.timeout(timeout):
+                        ack = await pending[command.id]
+                    result = "ok" if ack.ok else "failed"
+                except RobotDisconnected:
+                    result = "disconnected"
+                    raise
+                finally:
+                    action_latency.record(
+                        time.monotonic() - started,
+                        action=command.action.value,
+                        result=result,
+                    )
+                if ack.duration is not None:
+                    action_duration.record(ack.duration, action=command.action.value)
+                acks.append(ack)
+                if not ack.ok:
+                    break  # The robot skips the rest of the batch
+            return acks
+        finally:
+            for command in commands:
+                self._acks.pop(command.id, None)
+
+    async def receive_bytes(self) -> bytes:
+        return self._unwrap(await self._bytes.get())
+
+    async def receive_json(self) -> dict:
+        return self._unwrap(await self._json.get())
+
+    def deliver_bytes(self, data: bytes) -> None:
+        if self._pulls:
+            # Answer to a screenshot request
+            self._bytes.put_nowait(data)
+        else:
+            # Pushed by the robot, along with the exception or after running an action
+            self._pushed, self._pushed_epoch = data, self.action_epoch
+            self._pushed_arrived.set()
+
+    def deliver_json(self, data: dict) -> None:
+        self._json.put_nowait(data)
+
+    def deliver_ack(self, ack: ActionAck) -> None:
+        future = self._acks.get(ack.id)
+        if future is not None and not future.done():
+            future.set_result(ack)
+
+    def disconnect(self) -> None:
+        self._bytes.put_nowait(_DISCONNECTED)
+        self._json.put_nowait(_DISCONNECTED)
+        for future in self._acks.values():
+            if not future.done():
+                future.set_exception(RobotDisconnected("Robot disconnected"))
+
+    def _unwrap(self, item):
+        if item is _DISCONNECTED:
+            raise RobotDisconnected("Robot disconnected")
+        return item
+
+
+class RobotSession:
+    """
+    Long-lived, multiplexed connection with a robot.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        codec: Optional[WireCodec] = None,
+        max_concurrency: int = ROBOT_SESSION_MAX_CONCURRENCY,
+        heartbeat_interval: float = ROBOT_HEARTBEAT_INTERVAL,
+        heartbeat_timeout: float = ROBOT_HEARTBEAT_TIMEOUT,
+    ):
+        self.websocket = websocket
+        self.codec = codec or JsonCodec()
+        self.max_concurrency = max_concurrency
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.channels: dict[str, SessionChannel] = {}
+        self.capabilities: frozenset[str] = frozenset()
+        self.screen: Optional[ScreenInfo] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._send_lock = asyncio.Lock()
+        self._last_seen = time.monotonic()
+
+    @classmethod
+    async def accept(cls, websocket: WebSocket) -> "RobotSession":
+        """Accept a robot connection, negotiating its wire protocol."""
+        return cls(websocket, await accept(websocket, str(uuid7())))
+
+    @property
+    def push_screenshots(self) -> bool:
+        return "push_screenshots" in self.capabilities
+
+    @property
+    def native_actions(self) -> bool:
+        return "native_actions" in self.capabilities
+
+    @property
+    def progress_events(self) -> bool:
+        return "progress" in self.capabilities
+
+    async def send_json(self, data: dict) -> None:
+        async with self._send_lock:
+            await self.codec.send(self.websocket, data)
+
+    async def run(self) -> None:
+        """Serve the connection until the robot disconnects or stops sending heartbeats."""
+        open_sessions.add(1)
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                self._last_seen = time.monotonic()
+                try:
+                    frame = self.codec.decode(message)
+                except FrameError as e:
+                    await self.send_json({"type": "error", "content": str(e)})
+                    continue
+                if frame is not None:
+                    await self._on_frame(frame)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            heartbeat.cancel()
+            for channel in self.channels.values():
+                channel.disconnect()
+                if channel.job_id is not None:
+                    intake_queue.cancel(channel.job_id, "Robot disconnected")
+            for task in self._tasks:
+                task.cancel()
+            open_sessions.add(-1)
+
+    async def _on_frame(self, frame: Frame) -> None:
+        correlation_id = frame.correlation_id
+        if frame.type == "heartbeat":
+            return
+        if frame.type == "hello":
+            await self._hello(frame)
+        elif frame.type == "exception":
+            await self._start_recovery(correlation_id, frame)
+        elif frame.type == "screenshot":
+            channel = self.channels.get(correlation_id)
+            if channel is not None:
+                channel.deliver_bytes(frame.payload)
+        elif frame.type == "action_done":
+            channel = self.channels.get(correlation_id)
+            if channel is not None:
+                try:
+                    channel.deliver_ack(frame.validate(ActionAck))
+                except ValueError as e:
+                    await self.send_json(
+                        {"type": "error", "correlation_id": correlation_id, "content": str(e)}
+                    )
+        elif correlation_id in self.channels:
+            self.channels[correlation_id].deliver_json(frame.to_message())
+
+    async def _hello(self, frame: Frame) -> None:
+        """Agree on the capabilities of the connection."""
+        content = frame.content().get("content") or {}
+        self.capabilities = SUPPORTED_CAPABILITIES.intersection(
+            content.get("capabilities") or []
+        )
+        if content.get("screen") is not None:
+            try:
+                self.screen = ScreenInfo.model_validate(content["screen"])
+            except ValueError as e:
+                logger.warning("Ignoring invalid screen of robot session: %s", e)
+        await self.send_json(
+            {
+                "type": "hello",
+                "content": {
+                    "session_id": self.codec.session_id,
+                    "protocol": self.codec.protocol.value,
+                    "capabilities": sorted(self.capabilities),
+                },
+            }
+        )
+
+    async def _start_recovery(self, correlation_id: Optional[str], frame: Frame):
+        if not correlation_id or correlation_id in self.channels:
+            rejected_exceptions.add(reason="correlation_id")
+            await self.send_json(
+                {
+                    "type": "error",
+                    "correlation_id": correlation_id,
+                    "content": "A unique correlation_id is required",
+                }
+            )
+            return
+        if len(self.channels) >= self.max_concurrency:
+            rejected_exceptions.add(reason="concurrency")
+            await self.send_json(
+                {
+                    "type": "error",
+                    "correlation_id": correlation_id,
+                    "content": f"Connection limit of {self.max_concurrency} concurrent recoveries reached",
+                }
+            )
+            return
+        try:
+            request = frame.validate(RobotExceptionRequest)
+        except ValueError as e:  # Invalid payload, or content not matching the model
+            rejected_exceptions.add(reason="validation")
+            await self.send_json(
+                {"type": "error", "correlation_id": correlation_id, "content": str(e)}
+            )
+            return
+
+        channel = SessionChannel(self, correlation_id)
+        channel.screen = request.screen or self.screen
+        self.channels[correlation_id] = channel
+        active_recoveries.add(1)
+        # Queuing the exception writes it to the database: do it in the task of the
+        # recovery, so the reader keeps serving the other recoveries meanwhile
+        task = asyncio.create_task(self._recover(channel, request))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _recover(
+        self, channel: SessionChannel, request: RobotExceptionRequest
+    ) -> None:
+        """Queue the exception of a recovery session and deliver its result."""
+        try:
+            try:
+                job = await intake_queue.submit(request, websocket=channel)
+            except IntakeQueueFull as e:
+                rejected_exceptions.add(reason="queue_full")
+                await channel.send_json({"type": "error", "content": str(e)})
+                return
+
+            channel.job_id = job.id
+            await channel.send_json(
+                {"type": "accepted", "content": {"id": str(job.id)}}
+            )
+            response = await job.wait()
+            await channel.send_json({"type": "done", "content": response})
+        except Exception as e:
+            logger.warning(
+                "Could not complete the recovery of %s: %s", channel.correlation_id, e
+            )
+        finally:
+            self.channels.pop(channel.correlation_id, None)
+            active_recoveries.add(-1)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if time.monotonic() - self._last_seen > self.heartbeat_timeout:
+                logger.warning("Robot stopped sending heartbeats, closing connection")
+                await self.websocket.close()
+                return
+            await self.send_json({"type": "heartbeat"})
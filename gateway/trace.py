@@ -0,0 +1,309 @@
+"""
+Recovery Trace for RPA Recovery Framework
+
+Persists what a recovery module did (REQ-F-006): the execution, its planning and
+steps, the actions sent to the robot and the resulting solution.
+
+Agents and tools record the trace through the `SessionTrace` of their session state,
+which only appends rows to an in-memory buffer. A background task writes the buffer
+with bulk multi-row inserts when it reaches `TRACE_BATCH_SIZE` rows or every
+`TRACE_FLUSH_INTERVAL` seconds, so tracing never adds database round trips to the
+action loop. When the buffer is full, recording waits for the next flush for up to
+`TRACE_BACKPRESSURE_TIMEOUT` seconds, then drops the row. Ending a session requests
+an immediate flush, and stopping the recorder flushes whatever is left.
+
+Primary keys are generated on the client, so rows can reference each other before
+they are written. Rows are inserted in foreign key order, then updates (e.g. the end
+of an execution) are applied.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import metrics
+from agent_tools.models import ToolUse
+from database.columns import utcnow
+from modules.models import (
+    ExecutedAction,
+    Execution,
+    Planning,
+    Solution,
+    Step,
+)
+from settings import (
+    TRACE_BACKPRESSURE_TIMEOUT,
+    TRACE_BATCH_SIZE,
+    TRACE_ENABLED,
+    TRACE_FLUSH_INTERVAL,
+    TRACE_MAX_BUFFER,
+)
+
+logger = logging.getLogger(__name__)
+
+# Insert order, parents first
+TRACE_MODELS: tuple[type[SQLModel], ...] = (
+    Execution,
+    Solution,
+    Planning,
+    Step,
+    ExecutedAction,
+    ToolUse,
+)
+
+flush_latency = metrics.histogram(
+    "trace.flush_latency", "Time to write a batch of trace rows", "s"
+)
+batch_size = metrics.histogram("trace.batch_size", "Trace rows written per flush")
+dropped = metrics.counter("trace.dropped", "Trace rows dropped, by table and reason")
+buffered = metrics.gauge("trace.buffered", "Trace rows waiting to be written")
+
+
+class TraceRecorder:
+    """
+    Write-behind buffer of trace rows, flushed in bulk by a background task.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = TRACE_BATCH_SIZE,
+        flush_interval: float = TRACE_FLUSH_INTERVAL,
+        max_buffer: int = TRACE_MAX_BUFFER,
+        backpressure_timeout: float = TRACE_BACKPRESSURE_TIMEOUT,
+        enabled: bool = TRACE_ENABLED,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.backpressure_timeout = backpressure_timeout
+        self.enabled = enabled
+        self.engine: Optional[AsyncEngine] = None
+        self._rows: dict[type[SQLModel], list[dict]] = defaultdict(list)
+        self._updates: list[tuple[type[SQLModel], uuid.UUID, dict]] = []
+        self._size = 0
+        self._wake = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, engine: AsyncEngine) -> None:
+        """Start the background flush task."""
+        self.engine = engine
+        if self.enabled:
+            self._task = asyncio.create_task(self._run(), name="trace-recorder")
+
+    async def stop(self) -> None:
+        """Stop the background task and write the remaining rows."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def record(self, row: SQLModel) -> None:
+        """
+        Buffer a row for insertion.
+
+        Waits for a flush when the buffer is full, and drops the row if the buffer
+        is still full after `backpressure_timeout` seconds.
+        """
+        if not self.enabled:
+            return
+        if self._size >= self.max_buffer:
+            self._drained.clear()
+            self._wake.set()
+            try:
+                await asyncio.wait_for(
+                    self._drained.wait(), timeout=self.backpressure_timeout
+                )
+            except TimeoutError:
+                pass
+            if self._size >= self.max_buffer:
+                dropped.add(table=row.__tablename__, reason="buffer_full")
+                return
+
+        self._rows[type(row)].append(row.model_dump())
+        self._size += 1
+        buffered.set(self._size)
+        if self._size >= self.batch_size:
+            self._wake.set()
+
+    def update(self, model: type[SQLModel], row_id: uuid.UUID, **values) -> None:
+        """Buffer an update of a row, applied after the pending inserts."""
+        if self.enabled:
+            self._updates.append((model, row_id, values))
+
+    def request_flush(self) -> None:
+        """Wake the background task up to write the buffer now."""
+        self._wake.set()
+
+    async def flush(self) -> None:
+        """Write every buffered row and update."""
+        async with self._flush_lock:
+            rows, self._rows = self._rows, defaultdict(list)
+            updates, self._updates = self._updates, []
+            size, self._size = self._size, 0
+            buffered.set(0)
+            self._drained.set()
+            if not size and not updates:
+                return
+
+            started = time.monotonic()
+            try:
+                async with AsyncSession(self.engine) as session:
+                    for model in TRACE_MODELS:
+                        if rows.get(model):
+                            await session.execute(insert(model), rows[model])
+                    for model, row_id, values in updates:
+                        await session.execute(
+                            update(model).where(model.id == row_id).values(**values)
+                        )
+                    await session.commit()
+            except Exception as e:
+                logger.warning("Could not write %d trace rows: %s", size, e)
+                for model, model_rows in rows.items():
+                    dropped.add(
+                        len(model_rows), table=model.__tablename__, reason="flush_error"
+                    )
+                return
+            flush_latency.record(time.monotonic() - started)
+            batch_size.record(size)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+
+class SessionTrace:
+    """
+    Trace of the recovery of one exception.
+
+    Tracks the current execution, planning and step so callers only describe what
+    happened. Nothing is recorded for exceptions that were not persisted.
+    """
+
+    def __init__(self, recorder: TraceRecorder, exception_id: Optional[uuid.UUID]):
+        self.recorder = recorder
+        self.exception_id = exception_id
+        self.execution_id: Optional[uuid.UUID] = None
+        self.planning_id: Optional[uuid.UUID] = None
+        self.step_id: Optional[uuid.UUID] = None
+        self._steps: dict[str, uuid.UUID] = {}
+        self._planned = False
+        self._finished = False
+
+    @property
+    def active(self) -> bool:
+        return self.execution_id is not None
+
+    async def start_execution(self, module_id: Optional[uuid.UUID]) -> None:
+        """Record the start of the recovery by a module."""
+        if self.exception_id is None or module_id is None or self.active:
+            return
+        execution = Execution(exception_id=self.exception_id, module_id=module_id)
+        self.execution_id = execution.id
+        await self.recorder.record(execution)
+
+    async def plan(self, steps: list[str], details: Optional[str] = None) -> None:
+        """Record a recovery plan and its steps."""
+        if not self.active:
+            return
+        self._planned = True
+        await self._record_planning(details)
+        for step in steps:
+            await self._record_step(step)
+
+    async def start_step(self, step: str, details: Optional[str] = None) -> None:
+        """Record the start of a step, planned or not."""
+        if not self.active:
+            return
+        if self.planning_id is None:
+            await self._record_planning("Unplanned recovery")
+        self.step_id = self._steps.get(step) or await self._record_step(step, details)
+
+    async def action(
+        self,
+        details: str,
+        result: Optional[str] = None,
+        screenshot: Optional[str] = None,
+    ) -> None:
+        """
+        Record an action sent to the robot.
+
+        Args:
+            details (str): The action
+            result (str): Outcome of the action, if known
+            screenshot (str): Reference of the screenshot the action was grounded on
+        """
+        if not self.active:
+            return
+        if self.step_id is None:
+            await self.start_step("Direct recovery")
+        await self.recorder.record(
+            ExecutedAction(
+                step_id=self.step_id,
+                details=details,
+                result=result,
+                screenshot=screenshot,
+            )
+        )
+
+    async def finish(
+        self, resolved: bool, details: Optional[str] = None, fix: Optional[str] = None
+    ) -> None:
+        """Record the solution of the recovery and the end of the execution."""
+        if not self.active or self._finished:
+            return
+        self._finished = True
+        solution = Solution(
+            details=details,
+            fix=fix,
+            resolved=resolved,
+            requires_planning=self._planned,
+            execution_id=self.execution_id,
+        )
+        await self.recorder.record(solution)
+        if self.planning_id is not None:
+            self.recorder.update(Planning, self.planning_id, solution_id=solution.id)
+        self.recorder.update(Execution, self.execution_id, timestamp_end=utcnow())
+
+    async def close(self) -> None:
+        """End the session trace and request its flush."""
+        if self.active and not self._finished:
+            await self.finish(False, "Recovery ended without a report")
+        if self.active:
+            self.recorder.request_flush()
+
+    async def _record_planning(self, details: Optional[str]) -> None:
+        planning = Planning(details=details, solution_id=None)
+        self.planning_id = planning.id
+        self.step_id = None
+        self._steps = {}
+        await self.recorder.record(planning)
+
+    async def _record_step(self, step: str, details: Optional[str] = None) -> uuid.UUID:
+        row = Step(step=step, details=details, planning_id=self.planning_id)
+        self._steps[step] = row.id
+        await self.recorder.record(row)
+        return row.id
+
+
+trace_recorder = TraceRecorder()
+
+
+def session_trace(state: dict) -> Optional[SessionTrace]:
+    """Return the trace of a session state, if any."""
+    return state.get("trace")
@@ -1,11 +1,22 @@
 # Initializes the FastAPI application and includes the main entry point.
 # It also sets up the database connection and includes the necessary routers.
+import asyncio
 from fastapi import FastAPI, WebSocket
 from scalar_fastapi import get_scalar_api_reference
 from contextlib import asynccontextmanager
 import database.general as database
-from gateway.agent import robot_exception_handler
+import metrics
+from agent_tools.image_service import image_service
+from gateway.enums import WireProtocol
+from gateway.framing import accept
+from gateway.intake import IntakeQueueFull, intake_queue
 from gateway.models import RobotExceptionRequest
+from gateway.module_registry import module_registry
+from gateway.router import router as gateway_router
+from gateway.sessions import RobotSession, WebSocketChannel
+from gateway.trace import trace_recorder
+from providers.registry import model_registry
+from settings import EVENT_LOOP_LAG_INTERVAL
 from strands.telemetry import StrandsTelemetry
 import logging
 
@@ -13,7 +24,9 @@ import logging
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Lifespan event handler to initialize and clean up the database connection.
+    Lifespan event handler to initialize and clean up the database connection,
+    the shared LLM model registry, the intake workers, the trace recorder and the
+    image workers, and to monitor the event loop lag.
     """
     strands_telemetry = StrandsTelemetry()
     strands_telemetry.setup_otlp_exporter()  # Send traces to OTLP endpoint
@@ -29,12 +42,27 @@ async def lifespan(app: FastAPI):
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
+    lag_monitor = asyncio.create_task(
+        metrics.monitor_event_loop_lag(EVENT_LOOP_LAG_INTERVAL)
+    )
     await database.create_db_and_tables()
+    await module_registry.start(database.async_engine)
+    await trace_recorder.start(database.async_engine)
+    model_registry.open()
+    await intake_queue.start()
     yield
+    await intake_queue.stop()
+    await module_registry.stop()
+    await trace_recorder.stop()
+    image_service.shutdown()
+    await model_registry.close()
     await database.drop_db_and_tables()
+    await database.dispose_engines()
+    lag_monitor.cancel()
 
 
 app = FastAPI(lifespan=lifespan)
+app.include_router(gateway_router)
 
 
 @app.get("/scalar", include_in_schema=False)
@@ -50,14 +78,40 @@ async def root():
 @app.websocket("/robot_exception/ws")
 async def handle_robot_exception(websocket: WebSocket):
     """
-    Passes the exception to the robot exception handler for processing.
+    Submits the exception to the intake queue and waits for its recovery.
+
+    Single-shot protocol: one exception per connection. See /robot/ws for the
+    multiplexed protocol. Robots connecting with `?progress=true` also get the
+    progress events of the recovery (see gateway.progress).
     """
-    await websocket.accept()
-    data = (
-        await websocket.receive_json()
-    )  # Will only accept one exception per connection
-    request = RobotExceptionRequest(**data)
-    response = await robot_exception_handler(request, websocket)
-    await websocket.send_json({"type": "done", "content": response})
+    codec = await accept(websocket)
+    # Will only accept one exception per connection
+    if codec.protocol == WireProtocol.JSON:
+        # The bare request, validated straight from the text
+        request = RobotExceptionRequest.model_validate_json(
+            await websocket.receive_text()
+        )
+    else:
+        request = (await codec.receive(websocket)).validate(RobotExceptionRequest)
+    channel = WebSocketChannel(websocket, codec)
+    channel.screen = request.screen
+    channel.progress_events = websocket.query_params.get("progress") in ("1", "true")
+    try:
+        job = await intake_queue.submit(request, websocket=channel)
+    except IntakeQueueFull as e:
+        await channel.send_json({"type": "error", "content": str(e)})
+        await websocket.close()
+        return
+    response = await job.wait()
+    await channel.send_json({"type": "done", "content": response})
     await websocket.close()
     return
+
+
+@app.websocket("/robot/ws")
+async def handle_robot_session(websocket: WebSocket):
+    """
+    Serves a long-lived robot connection multiplexing many exceptions.
+    """
+    session = await RobotSession.accept(websocket)
+    await session.run()
@@ -0,0 +1,139 @@
+# In-process metrics for the RPA Recovery Framework.
+# Every instrument keeps a local aggregate, served by `snapshot()` through the
+# /api/v1/metrics endpoint, and mirrors its values to the OpenTelemetry meter set
+# up by StrandsTelemetry in main.lifespan.
+import asyncio
+import time
+from collections import defaultdict
+from opentelemetry import metrics as otel_metrics
+
+_meter = otel_metrics.get_meter("r2framework")
+_instruments: dict[str, "Counter | Gauge | Histogram"] = {}
+
+
+def _label_key(labels: dict) -> str:
+    return ",".join(f"{key}={value}" for key, value in sorted(labels.items()))
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self._values: dict[str, float] = defaultdict(float)
+        self._otel = _meter.create_counter(name, description=description)
+
+    def add(self, amount: float = 1, **labels) -> None:
+        self._values[_label_key(labels)] += amount
+        self._otel.add(amount, attributes=labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def snapshot(self) -> dict:
+        return dict(self._values)
+
+
+class Gauge:
+    """
+    Value that can go up and down (queue depth, open sessions...).
+    """
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self._values: dict[str, float] = defaultdict(float)
+        self._otel = _meter.create_up_down_counter(name, description=description)
+
+    def set(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        self._otel.add(value - self._values[key], attributes=labels)
+        self._values[key] = value
+
+    def add(self, amount: float = 1, **labels) -> None:
+        self.set(self._values[_label_key(labels)] + amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> dict:
+        return dict(self._values)
+
+
+class Histogram:
+    """
+    Distribution of observed values (latencies, sizes...).
+    """
+
+    def __init__(self, name: str, description: str = "", unit: str = ""):
+        self.name = name
+        self._values: dict[str, dict] = {}
+        self._otel = _meter.create_histogram(name, description=description, unit=unit)
+
+    def record(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        stats = self._values.get(key)
+        if stats is None:
+            stats = self._values[key] = {
+                "count": 0,
+                "sum": 0.0,
+                "min": value,
+                "max": value,
+            }
+        stats["count"] += 1
+        stats["sum"] += value
+        stats["min"] = min(stats["min"], value)
+        stats["max"] = max(stats["max"], value)
+        self._otel.record(value, attributes=labels)
+
+    def snapshot(self) -> dict:
+        return {
+            key: {**stats, "avg": stats["sum"] / stats["count"]}
+            for key, stats in self._values.items()
+        }
+
+
+def counter(name: str, description: str = "") -> Counter:
+    """Return the counter registered under `name`, creating it if needed."""
+    if name not in _instruments:
+        _instruments[name] = Counter(name, description)
+    return _instruments[name]
+
+
+def gauge(name: str, description: str = "") -> Gauge:
+    """Return the gauge registered under `name`, creating it if needed."""
+    if name not in _instruments:
+        _instruments[name] = Gauge(name, description)
+    return _instruments[name]
+
+
+def histogram(name: str, description: str = "", unit: str = "") -> Histogram:
+    """Return the histogram registered under `name`, creating it if needed."""
+    if name not in _instruments:
+        _instruments[name] = Histogram(name, description, unit)
+    return _instruments[name]
+
+
+def snapshot() -> dict:
+    """Return the current value of every registered instrument."""
+    return {name: instrument.snapshot() for name, instrument in _instruments.items()}
+
+
+async def monitor_event_loop_lag(interval: float) -> None:
+    """
+    Record how late the event loop wakes up from a sleep of `interval` seconds.
+
+    Any blocking call in a coroutine (sync I/O, CPU-bound work) shows up as lag,
+    delaying every robot connection served by the loop.
+    """
+    lag = histogram(
+        "event_loop.lag", "Delay of the event loop in waking up a sleeping task", "s"
+    )
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag.record(max(0.0, time.perf_counter() - started - interval))
@@ -1,9 +1,10 @@
 from argparse import Action
 from sqlmodel import SQLModel, Field
 from typing import Optional
-from sqlalchemy import Column
+from sqlalchemy import Column, Index
 from datetime import datetime
 import uuid
+from database.columns import TimestampField, uuid7
 
 
 class Execution(SQLModel, table=True):
@@ -11,16 +12,27 @@ class Execution(SQLModel, table=True):
     Represents an execution of a tool.
     """
 
+    __table_args__ = (
+        Index(
+            "ix_execution_exception_id_timestamp_start",
+            "exception_id",
+            "timestamp_start",
+        ),
+        Index(
+            "ix_execution_module_id_timestamp_start", "module_id", "timestamp_start"
+        ),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the execution.",
         primary_key=True,
     )
-    timestamp_start: str = Field(
-        datetime.now(), description="Timestamp of when the tool was executed."
+    timestamp_start: datetime = TimestampField(
+        "Timestamp of when the tool was executed."
     )
-    timestamp_end: Optional[str] = Field(
-        None, description="Timestamp of when the tool execution ended."
+    timestamp_end: Optional[datetime] = TimestampField(
+        "Timestamp of when the tool execution ended.", nullable=True
     )
     exception_id: uuid.UUID = Field(
         None,
@@ -40,8 +52,12 @@ class Execution(SQLModel, table=True):
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp_start": self.timestamp_start,
-            "timestamp_end": self.timestamp_end,
+            "timestamp_start": self.timestamp_start.isoformat()
+            if self.timestamp_start
+            else None,
+            "timestamp_end": self.timestamp_end.isoformat()
+            if self.timestamp_end
+            else None,
             "exception_id": str(self.exception_id) if self.exception_id else None,
             "module_id": str(self.module_id),
         }
@@ -52,14 +68,16 @@ class Solution(SQLModel, table=True):
     Represents a solution to an exception.
     """
 
+    __table_args__ = (
+        Index("ix_solution_execution_id_timestamp", "execution_id", "timestamp"),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the solution.",
         primary_key=True,
     )
-    timestamp: str = Field(
-        datetime.now(), description="Timestamp of when the solution was created."
-    )
+    timestamp: datetime = TimestampField("Timestamp of when the solution was created.")
     details: Optional[str] = Field(
         None, description="Details about the solution, if available."
     )
@@ -83,7 +101,7 @@ class Solution(SQLModel, table=True):
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "details": self.details,
             "fix": self.fix,
             "resolved": self.resolved,
@@ -97,14 +115,16 @@ class Planning(SQLModel, table=True):
     Represents a planning for a solution.
     """
 
+    __table_args__ = (
+        Index("ix_planning_solution_id", "solution_id"),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the planning.",
         primary_key=True,
     )
-    timestamp: str = Field(
-        datetime.now(), description="Timestamp of when the planning was created."
-    )
+    timestamp: datetime = TimestampField("Timestamp of when the planning was created.")
     details: Optional[str] = Field(
         None, description="Details about the planning, if available."
     )
@@ -118,7 +138,7 @@ class Planning(SQLModel, table=True):
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "details": self.details,
             "solution_id": str(self.solution_id),
         }
@@ -129,14 +149,16 @@ class Step(SQLModel, table=True):
     Represents a step in the planning.
     """
 
+    __table_args__ = (
+        Index("ix_step_planning_id_timestamp", "planning_id", "timestamp"),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the step.",
         primary_key=True,
     )
-    timestamp: str = Field(
-        datetime.now(), description="Timestamp of when the step was created."
-    )
+    timestamp: datetime = TimestampField("Timestamp of when the step was created.")
     step: str = Field(..., description="Description of the step to be executed.")
     details: Optional[str] = Field(
         None, description="Details about the step, if available."
@@ -151,7 +173,7 @@ class Step(SQLModel, table=True):
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "step": self.step,
             "details": self.details,
             "planning_id": str(self.planning_id),
@@ -163,14 +185,16 @@ class ExecutedAction(SQLModel, table=True):
     Represents an action that has been executed as part of a step.
     """
 
+    __table_args__ = (
+        Index("ix_executedaction_step_id_timestamp", "step_id", "timestamp"),
+    )
+
     id: uuid.UUID = Field(
-        default_factory=uuid.uuid4,
+        default_factory=uuid7,
         description="Unique identifier for the executed action.",
         primary_key=True,
     )
-    timestamp: str = Field(
-        datetime.now(), description="Timestamp of when the action was executed."
-    )
+    timestamp: datetime = TimestampField("Timestamp of when the action was executed.")
     step_id: uuid.UUID = Field(
         ...,
         foreign_key="step.id",
@@ -182,6 +206,10 @@ class ExecutedAction(SQLModel, table=True):
     result: Optional[str] = Field(
         None, description="Result of the executed action, if available."
     )
+    screenshot: Optional[str] = Field(
+        None,
+        description="Reference of the screenshot the action was grounded on, in the screenshot store.",
+    )
     # TODO: action: "Action" = Field(..., description="The action that was executed. This should be a reference to an Action model that defines the action's logic.")
     tool_use_id: Optional[uuid.UUID] = Field(
         None,
@@ -193,9 +221,10 @@ class ExecutedAction(SQLModel, table=True):
         """Convert the model to a dictionary structure."""
         return {
             "id": str(self.id),
-            "timestamp": self.timestamp,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
             "step_id": str(self.step_id),
             "details": self.details,
             "result": self.result,
+            "screenshot": self.screenshot,
             "tool_use_id": str(self.tool_use_id) if self.tool_use_id else None,
         }
@@ -1,17 +1,18 @@
 from strands import Agent, ToolContext, tool
-from strands.models.openai import OpenAIModel
+from typing import Optional
 from settings import (
-    PROVIDER_API_BASE,
-    PROVIDER_API_KEY,
-    FREE_PROVIDER_API_KEY,
-    PROVIDER_MODEL,
-    PROVIDER_VISION_MODEL,
-    PROVIDER_VISION_TOOL_MODEL,
-    PROVIDER_GROUNDING_MODEL,
     UI_ERROR_PLANNING,
     UI_MID_AGENT,
 )
 from config import Config
+from agent_tools.invocation import invoke_structured, session_state
+from gateway.enums import ProgressEvent
+from gateway.budget import BudgetExhausted, budget_stage, track_budget
+from gateway.module_registry import module_registry
+from gateway.progress import emit_progress
+from gateway.trace import session_trace
+from providers.enums import ModelRole
+from providers.registry import get_role_model
 from modules.uierror.agent_utils import (
     ensure_required_type,
     extract_agent_response_text,
@@ -24,11 +25,9 @@ from modules.uierror.prompts import (
     RECOVERY_STEP_EXECUTION_PROMPT,
     COMPUTER_USE_DOUBAO,
 )
-from modules.uierror.uitars import (
-    parse_action_to_structure_output,
-    parsing_response_to_pyautogui_code,
-)
-from agent_tools.image import screenshot_bytes, take_screenshot, compare_images
+from modules.uierror.grounding import screen_size, send_actions, stream_grounding
+from agent_tools.image import session_screenshot, take_screenshot, compare_images
+from agent_tools.image_prep import prepare_screenshot
 from modules.uierror.templates import (
     RecoveryDirectReport,
     RecoveryPlannerReport,
@@ -37,20 +36,20 @@ from modules.uierror.templates import (
 )
 
 
-@tool(
-    description="Generate a recovery plan for a UI error based on the provided task and action history.",
-    context=True,
-)
-async def ui_exception_handler(
+async def handle_ui_exception(
     task: str,
     action_history: list,
     failed_activity: dict,
     future_activities: list,
     variables: dict,
-    tool_context: ToolContext,
-) -> list:
+    state: dict,
+    known_plan: Optional[list[str]] = None,
+) -> str:
     """
-    Generate a recovery plan for a UI error based on the provided task and action history.
+    Run the UI exception handler agent and return its recovery report.
+
+    Used by the `ui_exception_handler` tool, and directly by the gateway when an
+    exception is routed to this module without going through the gateway agent.
 
     Args:
         task (str): The task description that the robot was trying to complete
@@ -58,17 +57,11 @@ async def ui_exception_handler(
         failed_activity (dict): The action that was expected to be performed but failed (dict)
         future_activities (list): The list of future activities the robot planned to perform (list)
         variables (dict): A dictionary of variables used in the process
+        state (dict): Session state of the recovery (websocket connection to the RPA robot, progress reporter...)
+        known_plan (list): Steps that recovered an identical exception on another robot, if any
 
     Returns:
-        Dictionary containing status and tool response:
-        {
-            "toolUseId": "unique_id",
-            "status": "success|error",
-            "content": [{"text": "Recovery report"}]
-        }
-
-        Success: Returns a JSON-serializable report of the recovery in content[0]["text"].
-        Error: Returns information about what went wrong.
+        str: A JSON-serializable UiExceptionReport, or information about what went wrong.
     """
     # Validate inputs (fail fast if missing or wrong type)
     ensure_required_type(action_history, "action_history", list)
@@ -76,17 +69,11 @@ async def ui_exception_handler(
     ensure_required_type(future_activities, "future_activities", list)
     ensure_required_type(variables, "variables", dict)
 
-    assert "websocket" in tool_context.invocation_state, (
-        "WebSocket must be provided in tool context"
-    )
+    trace = session_trace(state)
+    if trace is not None:
+        await trace.start_execution(module_registry.module_id("ui_exception_handler"))
 
-    model = OpenAIModel(
-        client_args={
-            "api_key": FREE_PROVIDER_API_KEY,
-            "base_url": PROVIDER_API_BASE,
-        },
-        model_id=PROVIDER_MODEL,
-    )
+    model = get_role_model(ModelRole.ROUTING)
 
     messages = [
         {
@@ -108,25 +95,84 @@ async def ui_exception_handler(
         else [standalone_uitars]
     )
 
+    prompt = f"Task: {task}\nAction History: {action_history}\nFailed Action: {failed_activity}\nFuture Activities: {future_activities}\nVariables: {variables}. DO NOT ASK FOR CONFIRMATION, execute the plan directly."
+    if known_plan:
+        prompt += f"\nAn identical error was just recovered on another robot with these steps: {known_plan}. Follow them if they apply to the current screen."
+
     agent = Agent(
         model=model,
         messages=messages,
         tools=[] + recovery_tools,
     )
     try:
-        await agent.invoke_async(
-            f"Task: {task}\nAction History: {action_history}\nFailed Action: {failed_activity}\nFuture Activities: {future_activities}\nVariables: {variables}. DO NOT ASK FOR CONFIRMATION, execute the plan directly.",
-            invocation_state={"websocket": tool_context.invocation_state["websocket"]},
-        )
-
-        response = await agent.invoke_async(
+        response = await invoke_structured(
+            "ui_exception_handler",
+            agent,
+            prompt,
+            UiExceptionReport,
             "Given our conversation so far, please provide a structured recovery report.",
-            structured_output_model=UiExceptionReport,
+            invocation_state=state,
         )
+        if trace is not None:
+            await trace.finish(
+                response.finish_activity,
+                details=response.result,
+                fix="\n".join(response.steps),
+            )
 
-        return [{"text": str(response)}]
+        return str(response)
+    except BudgetExhausted:
+        raise  # The gateway answers with a partial report
     except Exception as e:
-        return [{"text": str(e)}]
+        return str(e)
+
+
+@tool(
+    description="Generate a recovery plan for a UI error based on the provided task and action history.",
+    context=True,
+)
+async def ui_exception_handler(
+    task: str,
+    action_history: list,
+    failed_activity: dict,
+    future_activities: list,
+    variables: dict,
+    tool_context: ToolContext,
+) -> list:
+    """
+    Generate a recovery plan for a UI error based on the provided task and action history.
+
+    Args:
+        task (str): The task description that the robot was trying to complete
+        action_history (list): The history of actions taken by the robot (list)
+        failed_activity (dict): The action that was expected to be performed but failed (dict)
+        future_activities (list): The list of future activities the robot planned to perform (list)
+        variables (dict): A dictionary of variables used in the process
+
+    Returns:
+        Dictionary containing status and tool response:
+        {
+            "toolUseId": "unique_id",
+            "status": "success|error",
+            "content": [{"text": "Recovery report"}]
+        }
+
+        Success: Returns a JSON-serializable report of the recovery in content[0]["text"].
+        Error: Returns information about what went wrong.
+    """
+    assert "websocket" in tool_context.invocation_state, (
+        "WebSocket must be provided in tool context"
+    )
+
+    report = await handle_ui_exception(
+        task,
+        action_history,
+        failed_activity,
+        future_activities,
+        variables,
+        session_state(tool_context.invocation_state),
+    )
+    return [{"text": report}]
 
 
 @tool(
@@ -170,29 +216,20 @@ async def recovery_agent(
     assert "websocket" in tool_context.invocation_state, (
         "WebSocket must be provided in tool context"
     )
-    websocket = tool_context.invocation_state["websocket"]
 
-    model = OpenAIModel(
-        client_args={
-            "api_key": FREE_PROVIDER_API_KEY,
-            "base_url": PROVIDER_API_BASE,
-        },
-        model_id=PROVIDER_VISION_TOOL_MODEL,
-    )
+    model = get_role_model(ModelRole.VISION_TOOL)
 
     messages = [
         {
             "role": "user",
             "content": [
                 {"text": RECOVERY_DIRECT_PROMPT},
-                {
-                    "image": {
-                        "format": "jpeg",
-                        "source": {
-                            "bytes": await screenshot_bytes(websocket),
-                        },
-                    },
-                },
+                (
+                    await prepare_screenshot(
+                        await session_screenshot(tool_context.invocation_state),
+                        ModelRole.VISION_TOOL,
+                    )
+                ).content_block(),
             ],
         },
         {
@@ -208,17 +245,18 @@ async def recovery_agent(
 
     agent = Agent(model=model, messages=messages, tools=[take_screenshot, ui_tars])
     try:
-        await agent.invoke_async(
+        response = await invoke_structured(
+            "recovery_agent",
+            agent,
             f"Task: {task}\nAction History: {action_history}\nFailed Action: {failed_activity}\nVariables: {variables}. DO NOT ASK FOR CONFIRMATION, execute the actions directly.",
-            invocation_state={"websocket": websocket},
-        )
-
-        response = await agent.invoke_async(
+            RecoveryDirectReport,
             "Given our conversation so far, please provide a structured recovery report.",
-            structured_output_model=RecoveryDirectReport,
+            invocation_state=session_state(tool_context.invocation_state),
         )
 
         return [{"text": str(response)}]
+    except BudgetExhausted:
+        raise
     except Exception as e:
         return [{"text": str(e)}]
 
@@ -266,29 +304,20 @@ async def recovery_plan_generator(
     assert "websocket" in tool_context.invocation_state, (
         "WebSocket must be provided in tool context"
     )
-    websocket = tool_context.invocation_state["websocket"]
 
-    model = OpenAIModel(
-        client_args={
-            "api_key": FREE_PROVIDER_API_KEY,
-            "base_url": PROVIDER_API_BASE,
-        },
-        model_id=PROVIDER_VISION_MODEL,
-    )
+    model = get_role_model(ModelRole.PLANNING)
 
     messages = [
         {
             "role": "user",
             "content": [
                 {"text": RECOVERY_PLANNER_PROMPT},
-                {
-                    "image": {
-                        "format": "jpeg",
-                        "source": {
-                            "bytes": await screenshot_bytes(websocket),
-                        },
-                    },
-                },
+                (
+                    await prepare_screenshot(
+                        await session_screenshot(tool_context.invocation_state),
+                        ModelRole.PLANNING,
+                    )
+                ).content_block(),
             ],
         },
         {
@@ -304,17 +333,28 @@ async def recovery_plan_generator(
 
     agent = Agent(model=model, messages=messages)
     try:
-        await agent.invoke_async(
+        response = await invoke_structured(
+            "recovery_plan_generator",
+            agent,
             f"Task: {task}\nAction History: {action_history}\nFailed Action: {failed_activity}\nFuture Activities: {future_activities}\nVariables: {variables}. DO NOT ASK FOR CONFIRMATION, execute the plan directly.",
-            invocation_state={"websocket": websocket},
-        )
-
-        response = await agent.invoke_async(
+            RecoveryPlannerReport,
             "Given our conversation so far, please provide a structured recovery plan.",
-            structured_output_model=RecoveryPlannerReport,
+            invocation_state=session_state(tool_context.invocation_state),
+        )
+        await emit_progress(
+            tool_context.invocation_state,
+            ProgressEvent.PLAN_PRODUCED,
+            steps=getattr(response, "steps", []),
         )
+        trace = session_trace(tool_context.invocation_state)
+        if trace is not None:
+            await trace.plan(
+                getattr(response, "steps", []), str(getattr(response, "reasoning", ""))
+            )
 
         return [{"text": str(response)}]
+    except BudgetExhausted:
+        raise
     except Exception as e:
         return [{"text": str(e)}]
 
@@ -359,15 +399,8 @@ async def step_execution_handler(
     assert "websocket" in tool_context.invocation_state, (
         "WebSocket must be provided in tool context"
     )
-    websocket = tool_context.invocation_state["websocket"]
 
-    model = OpenAIModel(
-        client_args={
-            "api_key": FREE_PROVIDER_API_KEY,
-            "base_url": PROVIDER_API_BASE,
-        },
-        model_id=PROVIDER_VISION_TOOL_MODEL,
-    )
+    model = get_role_model(ModelRole.VISION_TOOL)
 
     messages = [
         {
@@ -379,13 +412,12 @@ async def step_execution_handler(
         {
             "role": "user",
             "content": [
-                {
-                    "type": "image",
-                    "image": {
-                        "format": "jpeg",
-                        "source": {"bytes": await screenshot_bytes(websocket)},
-                    },
-                },
+                (
+                    await prepare_screenshot(
+                        await session_screenshot(tool_context.invocation_state),
+                        ModelRole.VISION_TOOL,
+                    )
+                ).content_block(),
             ],
         },
         {
@@ -399,18 +431,34 @@ async def step_execution_handler(
     ]
 
     agent = Agent(model=model, messages=messages, tools=[ui_tars, take_screenshot])
+    await emit_progress(
+        tool_context.invocation_state,
+        ProgressEvent.STEP_STARTED,
+        step=step,
+        is_final=is_final,
+    )
+    trace = session_trace(tool_context.invocation_state)
+    if trace is not None:
+        await trace.start_step(step)
     try:
-        await agent.invoke_async(
+        response = await invoke_structured(
+            "step_execution_handler",
+            agent,
             f"Step: {step}\nStep History: {step_history}\nProcess Goal: {process_goal}\nVariables: {variables}\nIs Final Step: {is_final}",
-            invocation_state={"websocket": websocket},
-        )
-
-        response = await agent.invoke_async(
+            RecoveryStepExecutionResult,
             "Given our conversation so far, please provide the structured step execution result.",
-            structured_output_model=RecoveryStepExecutionResult,
+            invocation_state=session_state(tool_context.invocation_state),
+        )
+        await emit_progress(
+            tool_context.invocation_state,
+            ProgressEvent.STEP_FINISHED,
+            step=step,
+            status=getattr(response, "status", None),
         )
 
         return [{"text": str(response)}]
+    except BudgetExhausted:
+        raise
     except Exception as e:
         return [{"text": str(e)}]
 
@@ -461,82 +509,88 @@ Variables: {variables}
     )
     websocket = tool_context.invocation_state["websocket"]
 
-    before_screenshot = await screenshot_bytes(websocket)
+    before_screenshot = await session_screenshot(tool_context.invocation_state)
+    grounding_image = await prepare_screenshot(before_screenshot, ModelRole.GROUNDING)
 
     messages = [
         {
             "role": "user",
             "content": [
                 {"text": COMPUTER_USE_DOUBAO.format(instruction=instruction)},
-                {
-                    "type": "image",
-                    "image": {
-                        "format": "jpeg",
-                        "source": {"bytes": before_screenshot},
-                    },
-                },
+                grounding_image.content_block(),
             ],
         },
     ]
 
-    model = OpenAIModel(
-        client_args={"api_key": PROVIDER_API_KEY, "base_url": PROVIDER_API_BASE},
-        model_id=PROVIDER_GROUNDING_MODEL,
-    )
+    model = get_role_model(ModelRole.GROUNDING)
 
     agent = Agent(model=model, messages=messages)
-    try:
-        response = await agent.invoke_async(
-            ""
-        )  # Empty input since all context is in messages
-
-        iteration = 1
+    track_budget(agent, tool_context.invocation_state, "ui_tars")
+
+    async def dispatch(actions: list, code: str) -> None:
+        await send_actions(websocket, actions, code, screen)
+        for action in actions:
+            await emit_progress(
+                tool_context.invocation_state,
+                ProgressEvent.ACTION_DISPATCHED,
+                action_type=action.action_type,
+                attempt=iteration,
+            )
 
-        while True:
-            ui_tars_response = ""
-            try:
-                ui_tars_response = response.message.get("content", "")[0].get(
-                    "text", ""
+    try:
+        async with budget_stage(tool_context.invocation_state, "ui_tars"):
+            prompt = ""  # Empty input since all context is in messages
+            iteration = 1
+
+            while True:
+                screen = screen_size(websocket, grounding_image)
+                grounded = await stream_grounding(
+                    agent, prompt, grounding_image, dispatch, screen
                 )
-            except Exception:
-                ui_tars_response = str(response)
-                break
-
-            try:
-                action = parse_action_to_structure_output(
-                    ui_tars_response,
-                    origin_resized_height=1080,
-                    origin_resized_width=1920,
-                )[0]
-                code = parsing_response_to_pyautogui_code(action, 1080, 1920)
-
-                if code == "DONE":
+                if grounded.text is None or grounded.code == "DONE":
                     break
 
-                await websocket.send_json({"type": "code", "content": code})
-
-            except Exception as e:
-                if iteration >= Config.MAX_UI_ACTION_RETRIES:
-                    return [{"text": f"Error executing action: {str(e)}"}]
-                response = agent("The action failed. Try again")
+                if grounded.error is not None:
+                    if iteration >= Config.MAX_UI_ACTION_RETRIES:
+                        return [
+                            {"text": f"Error executing action: {str(grounded.error)}"}
+                        ]
+                    prompt = "The action failed. Try again"
+                    iteration += 1
+                    continue
+                code = grounded.code
+
+                verified = await compare_images(
+                    before_screenshot, expect_ui_change, websocket
+                )
+                await emit_progress(
+                    tool_context.invocation_state,
+                    ProgressEvent.VERIFICATION_RESULT,
+                    expected_change=expect_ui_change,
+                    verified=verified,
+                    attempt=iteration,
+                )
+                trace = session_trace(tool_context.invocation_state)
+                if trace is not None:
+                    await trace.action(
+                        f"ui_tars: {code}",
+                        "verified" if verified else "not verified",
+                        before_screenshot.ref,
+                    )
+                if verified or iteration >= Config.MAX_UI_ACTION_RETRIES:
+                    break
+                else:
+                    # Prompt of the next grounding request
+                    prompt = "The action failed. Try again"
                 iteration += 1
-                continue
-
-            if (
-                compare_images(before_screenshot, expect_ui_change, websocket)
-                or iteration >= Config.MAX_UI_ACTION_RETRIES
-            ):
-                break
-            else:
-                # Redefinition of response before starting the loop again.
-                response = await agent.invoke_async("The action failed. Try again")
-            iteration += 1
-
-        return (
-            [{"text": "Action executed successfully."}]
-            if iteration < Config.MAX_UI_ACTION_RETRIES
-            else [{"text": "Action failed after maximum retries."}]
-        )
+
+            return (
+                [{"text": "Action executed successfully."}]
+                if iteration < Config.MAX_UI_ACTION_RETRIES
+                else [{"text": "Action failed after maximum retries."}]
+            )
+    except BudgetExhausted:
+        raise
     except Exception as e:
         return [{"text": str(e)}]
 
@@ -586,6 +640,10 @@ Variables: {variables}
     )
     websocket = tool_context.invocation_state["websocket"]
 
+    # Screenshot the next action is grounded on
+    current_screenshot = await session_screenshot(tool_context.invocation_state)
+    grounding_image = await prepare_screenshot(current_screenshot, ModelRole.GROUNDING)
+
     messages = [
         {
             "role": "user",
@@ -595,88 +653,84 @@ Variables: {variables}
                         instruction=instruction
                     )
                 },
-                {
-                    "type": "image",
-                    "image": {
-                        "format": "jpeg",
-                        "source": {"bytes": await screenshot_bytes(websocket)},
-                    },
-                },
+                grounding_image.content_block(),
             ],
         },
     ]
 
-    model = OpenAIModel(
-        client_args={"api_key": PROVIDER_API_KEY, "base_url": PROVIDER_API_BASE},
-        model_id=PROVIDER_GROUNDING_MODEL,
-    )
+    model = get_role_model(ModelRole.GROUNDING)
 
     agent = Agent(model=model, messages=messages)
-    try:
-        response = await agent.invoke_async(
-            ""
-        )  # Empty input since all context is in messages
+    track_budget(agent, tool_context.invocation_state, "standalone_uitars")
+
+    async def dispatch(actions: list, code: str) -> None:
+        await send_actions(websocket, actions, code, screen)
+        for action in actions:
+            await emit_progress(
+                tool_context.invocation_state,
+                ProgressEvent.ACTION_DISPATCHED,
+                action_type=action.action_type,
+                attempt=iteration,
+            )
 
-        iteration = 0
+    try:
+        async with budget_stage(tool_context.invocation_state, "standalone_uitars"):
+            prompt = ""  # Empty input since all context is in messages
+            iteration = 0
 
-        while True:
-            iteration += 1
-            if iteration > Config.MAX_ACTIONS_ALLOWED:
-                return [{"text": "Exceeded maximum allowed actions."}]
+            while True:
+                iteration += 1
+                if iteration > Config.MAX_ACTIONS_ALLOWED:
+                    return [{"text": "Exceeded maximum allowed actions."}]
 
-            ui_tars_response = ""
-            try:
-                ui_tars_response = response.message.get("content", "")[0].get(
-                    "text", ""
+                screen = screen_size(websocket, grounding_image)
+                grounded = await stream_grounding(
+                    agent, prompt, grounding_image, dispatch, screen
                 )
-            except Exception:
-                ui_tars_response = str(response)
-                break
-
-            try:
-                action = parse_action_to_structure_output(
-                    ui_tars_response,
-                    origin_resized_height=1080,
-                    origin_resized_width=1920,
-                )[0]
-                code = parsing_response_to_pyautogui_code(action, 1080, 1920)
-
-                if code == "DONE":
+                if grounded.text is None or grounded.code == "DONE":
                     break
-
-                await websocket.send_json({"type": "code", "content": code})
-
-                new_messages = [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "image": {
-                                    "format": "jpeg",
-                                    "source": {
-                                        "bytes": await screenshot_bytes(websocket)
-                                    },
-                                },
-                            },
-                        ],
-                    },
-                ]
-
-                response = await agent.invoke_async(
-                    new_messages
-                )  # Empty input since all context is in messages
-            except Exception as _:
-                response = agent("The action failed. Try again")
-                continue
-
-        conversation_history = list(
-            map(
-                lambda m: m["content"],
-                filter(lambda m: m["role"] == "assistant", agent.messages),
+                if grounded.error is not None:
+                    prompt = "The action failed. Try again"
+                    continue
+
+                try:
+                    trace = session_trace(tool_context.invocation_state)
+                    if trace is not None:
+                        await trace.action(
+                            f"standalone_uitars: {grounded.code}",
+                            "dispatched",
+                            current_screenshot.ref,
+                        )
+
+                    current_screenshot = await session_screenshot(
+                        tool_context.invocation_state
+                    )
+                    grounding_image = await prepare_screenshot(
+                        current_screenshot, ModelRole.GROUNDING
+                    )
+                    new_messages = [
+                        {
+                            "role": "user",
+                            "content": [grounding_image.content_block()],
+                        },
+                    ]
+
+                    prompt = new_messages
+                except BudgetExhausted:
+                    raise
+                except Exception as _:
+                    prompt = "The action failed. Try again"
+                    continue
+
+            conversation_history = list(
+                map(
+                    lambda m: m["content"],
+                    filter(lambda m: m["role"] == "assistant", agent.messages),
+                )
             )
-        )
-        return conversation_history
+            return conversation_history
 
+    except BudgetExhausted:
+        raise
     except Exception as e:
         return [{"text": str(e)}]
@@ -0,0 +1,27 @@
+# Declares the enums used by the UI error module
+
+from enum import Enum
+
+
+class ActionType(str, Enum):
+    """
+    Enum representing the type of an action in a UI-TARS response.
+    """
+
+    CLICK = "click"
+    LEFT_SINGLE = "left_single"
+    LEFT_DOUBLE = "left_double"
+    RIGHT_SINGLE = "right_single"
+    HOVER = "hover"
+    DRAG = "drag"
+    SELECT = "select"
+    HOTKEY = "hotkey"
+    PRESS = "press"
+    KEYDOWN = "keydown"
+    RELEASE = "release"
+    KEYUP = "keyup"
+    TYPE = "type"
+    SCROLL = "scroll"
+    WAIT = "wait"
+    FINISHED = "finished"
+    CALL_USER = "call_user"
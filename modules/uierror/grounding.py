@@ -0,0 +1,325 @@
+"""
+Streamed Grounding for the UI Error Module
+
+UI-TARS answers with its thought followed by the action to run, and the action is
+usually complete before the response ends, or only trails a short suffix. The
+grounding tools stream the response and dispatch its first action to the robot as
+soon as it is complete, instead of waiting for the whole response. Actions carrying
+free text (`content=`) are never dispatched early: the text may hold parentheses and
+quotes, so they wait for the complete response.
+
+When a response holds several actions (e.g. click a field, then type its value),
+the remaining ones are sent as one batch once the response ends, instead of asking
+the model again for each of them (`GROUNDING_BATCH_ACTIONS`). Robots running native
+actions acknowledge each action of a batch and stop at the first one that fails,
+which aborts the rest; code batches stop at the first error raised by the code.
+
+Actions are sent as typed commands to robots that run them natively (see
+gateway.sessions), and as generated code otherwise, in the coordinates of the robot
+screen (see `screen_size`).
+
+The rest of the response is still consumed, while the robot runs the action: the
+agent keeps the complete answer in its conversation, which the retries and the
+following actions build on. Once the response ends, it is parsed again, and actions
+dispatched early that do not match it are counted in `grounding.early_mismatches`.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from strands import Agent
+
+import metrics
+from agent_tools.image_prep import PreparedImage
+from modules.uierror.uitars import (
+    ParsedAction,
+    action_command,
+    parse_actions,
+    parsing_response_to_pyautogui_code,
+)
+from modules.uierror.enums import ActionType
+from settings import (
+    GROUNDING_BATCH_ACTIONS,
+    GROUNDING_EARLY_DISPATCH,
+    ROBOT_ACTION_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+ACTION_PREFIX = "Action: "
+
+time_to_action = metrics.histogram(
+    "grounding.time_to_action",
+    "Time from the grounding request to the dispatch of its action, by path (early or full)",
+    "s",
+)
+response_time = metrics.histogram(
+    "grounding.response_time", "Time to receive the complete grounding response", "s"
+)
+early_lead = metrics.histogram(
+    "grounding.early_lead",
+    "Time between an early dispatch and the end of the grounding response",
+    "s",
+)
+early_mismatches = metrics.counter(
+    "grounding.early_mismatches",
+    "Actions dispatched early that differ from the complete grounding response",
+)
+actions_sent = metrics.counter(
+    "grounding.actions_sent", "Actions sent to robots, by format (native or code)"
+)
+batch_size = metrics.histogram(
+    "grounding.batch_size", "Actions run from a single grounding response"
+)
+calls_saved = metrics.counter(
+    "grounding.calls_saved",
+    "Grounding calls saved by running every action of a response at once",
+)
+
+Dispatch = Callable[[list[ParsedAction], str], Awaitable[None]]
+
+
+@dataclass
+class GroundedAction:
+    """
+    The outcome of a grounding request.
+    """
+
+    text: Optional[str]  # None if the model answered without text
+    actions: list[ParsedAction] = field(default_factory=list)  # Dispatched, in order
+    code: Optional[str] = None  # "DONE" when the model finished the task
+    error: Optional[Exception] = None  # Set if the actions could not be parsed or sent
+    early: bool = False  # Whether the first action was dispatched before the response ended
+
+    @property
+    def action(self) -> Optional[ParsedAction]:
+        """The first action of the response."""
+        return self.actions[0] if self.actions else None
+
+    def extend(self, other: "GroundedAction") -> None:
+        """Add the outcome of the rest of the batch."""
+        self.actions += other.actions
+        self.code = "\n".join(code for code in (self.code, other.code) if code)
+        self.error = other.error
+
+
+class ActionScanner:
+    """
+    Finds the first action of a streamed UI-TARS response as soon as it is complete.
+    """
+
+    def __init__(self, parse_kwargs: dict):
+        self.parse_kwargs = parse_kwargs
+        self.text = ""
+        self._checked = 0
+
+    def feed(self, chunk: str) -> Optional[ParsedAction]:
+        """
+        Add a chunk of the response.
+
+        Returns:
+            Optional[ParsedAction]: The first action, once it is complete.
+        """
+        self.text += chunk
+        first = self.text.find(ACTION_PREFIX)
+        if first < 0:
+            return None
+        start = self.text.rfind(ACTION_PREFIX) + len(ACTION_PREFIX)
+        position = max(start, self._checked)
+        while (end := self.text.find(")", position)) >= 0:
+            call = self.text[start : end + 1]
+            if "content=" in self.text[first : end + 1]:
+                # Free text may hold parentheses, quotes and even "Action: ", so
+                # where it ends is only known once the response does
+                return None
+            if not _balanced(call):
+                position = self._checked = end + 1
+                continue
+            position = self._checked = end + 1
+            try:
+                return parse_actions(self.text[: end + 1], **self.parse_kwargs)[0]
+            except Exception:
+                continue
+        return None
+
+
+def _balanced(call: str) -> bool:
+    """Whether the string literals of a call are all closed."""
+    unescaped = call.replace("\\\\", "").replace("\\'", "").replace('\\"', "")
+    return unescaped.count("'") % 2 == 0 and unescaped.count('"') % 2 == 0
+
+
+def screen_size(channel, image: PreparedImage) -> tuple[int, int]:
+    """
+    Return the (height, width) of a robot screen, in the coordinates of its actions.
+
+    Args:
+        channel (RobotChannel): Connection to the robot, with the screen it reported
+        image (PreparedImage): A screenshot of the robot screen
+    """
+    if hasattr(channel, "screen_size"):
+        return channel.screen_size(image.original_width, image.original_height)
+    return image.original_height, image.original_width
+
+
+async def stream_grounding(
+    agent: Agent,
+    prompt,
+    image: PreparedImage,
+    dispatch: Dispatch,
+    screen: tuple[int, int],
+) -> GroundedAction:
+    """
+    Ask the grounding agent for the next actions and dispatch them as soon as they are complete.
+
+    Args:
+        agent (Agent): The grounding agent
+        prompt: The prompt for the agent
+        image (PreparedImage): The screenshot the actions are grounded on
+        dispatch (Dispatch): Sends actions and their code to the robot, as one unit.
+            Not called when the model finished the task.
+        screen (tuple[int, int]): (height, width) of the robot screen, see `screen_size`
+
+    Returns:
+        GroundedAction: The response, with the dispatched actions and their code if any
+    """
+    parse_kwargs = image.parse_kwargs()
+    scanner = ActionScanner(parse_kwargs)
+    started = time.perf_counter()
+    grounded: Optional[GroundedAction] = None
+    early: Optional[asyncio.Task] = None  # The robot runs it while the stream is read
+    dispatched_at = 0.0
+    result = None
+
+    try:
+        async for event in agent.stream_async(prompt):
+            if "result" in event:
+                result = event["result"]
+            elif "data" in event and early is None and GROUNDING_EARLY_DISPATCH:
+                action = scanner.feed(event["data"])
+                if action is not None:
+                    dispatched_at = time.perf_counter()
+                    early = asyncio.create_task(
+                        _dispatch([action], dispatch, screen, started, "early")
+                    )
+    except BaseException:
+        if early is not None:
+            early.cancel()
+        raise
+
+    finished_at = time.perf_counter()
+    response_time.record(finished_at - started)
+    if early is not None:
+        grounded = await early
+        grounded.early = True
+    try:
+        text = result.message.get("content", "")[0].get("text", "")
+    except Exception:
+        return GroundedAction(text=None)
+    try:
+        actions = _batch(parse_actions(text, **parse_kwargs))
+    except Exception as e:
+        actions = []
+        if grounded is None:
+            return GroundedAction(text=text, error=e)
+
+    if grounded is None:
+        grounded = await _dispatch(actions, dispatch, screen, started, "full")
+    else:
+        early_lead.record(finished_at - dispatched_at)
+        if grounded.error is None:
+            first = actions[0] if actions else None
+            if first is not None and (first.action_type, first.action_inputs) == (
+                grounded.action.action_type,
+                grounded.action.action_inputs,
+            ):
+                grounded.actions[0] = first
+                if len(actions) > 1:
+                    grounded.extend(
+                        await _dispatch(
+                            actions[1:], dispatch, screen, started, "batch"
+                        )
+                    )
+            else:
+                early_mismatches.add()
+                logger.warning(
+                    "Action dispatched early differs from the response: %r", text
+                )
+
+    grounded.text = text
+    if grounded.code != "DONE" and grounded.actions:
+        batch_size.record(len(grounded.actions))
+        if len(grounded.actions) > 1:
+            calls_saved.add(len(grounded.actions) - 1)
+    return grounded
+
+
+def _batch(actions: list[ParsedAction]) -> list[ParsedAction]:
+    """Return the actions of a response to run, up to the end of the task."""
+    if not GROUNDING_BATCH_ACTIONS or actions[0].action_type == ActionType.FINISHED:
+        return actions[:1]
+    for index, action in enumerate(actions):
+        if action.action_type == ActionType.FINISHED:
+            return actions[:index]
+    return actions
+
+
+async def _dispatch(
+    actions: list[ParsedAction],
+    dispatch: Dispatch,
+    screen: tuple[int, int],
+    started: float,
+    path: str,
+) -> GroundedAction:
+    try:
+        code = parsing_response_to_pyautogui_code(actions, *screen)
+        if code != "DONE":
+            time_to_action.record(time.perf_counter() - started, path=path)
+            await dispatch(actions, code)
+    except Exception as e:
+        return GroundedAction(text=None, actions=actions, error=e)
+    return GroundedAction(text=None, actions=actions, code=code)
+
+
+async def send_actions(
+    channel, actions: list[ParsedAction], code: str, screen: tuple[int, int]
+) -> None:
+    """
+    Send actions to the robot as one unit, as native commands if the robot runs them.
+
+    Native commands are acknowledged by the robot, so the actions are done when this
+    returns; the robot stops at the first action that fails. Code is sent without
+    waiting, as before.
+
+    Args:
+        channel (RobotChannel): Connection to the robot
+        actions (list[ParsedAction]): The actions, in order
+        code (str): The code of the actions, sent to robots without native actions
+        screen (tuple[int, int]): (height, width) of the robot screen
+
+    Raises:
+        RuntimeError: If the robot reports an action failed.
+        TimeoutError: If the robot does not acknowledge an action in time.
+    """
+    commands = None
+    if getattr(channel, "native_actions", False):
+        commands = [action_command(action, *screen) for action in actions]
+        if None in commands:
+            commands = None  # The code runs the whole batch
+    if commands is None:
+        actions_sent.add(len(actions), format="code")
+        await channel.send_json({"type": "code", "content": code})
+        return
+    actions_sent.add(len(commands), format="native")
+    if len(commands) == 1:
+        acks = [await channel.run_action(commands[0], ROBOT_ACTION_TIMEOUT)]
+    else:
+        acks = await channel.run_actions(commands, ROBOT_ACTION_TIMEOUT)
+    for index, ack in enumerate(acks):
+        if not ack.ok:
+            raise RuntimeError(
+                f"The robot failed to run action {index + 1} of {len(commands)}: {ack.error}"
+            )
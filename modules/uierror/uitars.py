@@ -2,7 +2,22 @@
 # SPDX-License-Identifier: Apache-2.0
 import re
 import ast
+import keyword
+import logging
 import math
+import random
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import metrics
+from gateway.enums import CommandType
+from gateway.models import ActionCommand
+from modules.uierror.enums import ActionType
+from settings import UITARS_PARSER_SHADOW_RATE
+
+logger = logging.getLogger(__name__)
 
 IMAGE_FACTOR = 28
 MIN_PIXELS = 100 * 28 * 28
@@ -149,6 +164,23 @@ def smart_resize(
     return h_bar, w_bar
 
 
+@lru_cache(maxsize=64)
+def resize_geometry(
+    height: int,
+    width: int,
+    factor: int = IMAGE_FACTOR,
+    min_pixels: int = MIN_PIXELS,
+    max_pixels: int = MAX_PIXELS,
+) -> tuple[int, int]:
+    """
+    `smart_resize`, cached: robots send screenshots of a handful of sizes, so the
+    geometry of each resolution is computed once.
+    """
+    return smart_resize(
+        height, width, factor=factor, min_pixels=min_pixels, max_pixels=max_pixels
+    )
+
+
 def parse_action_to_structure_output(
     text,
     origin_resized_height,
@@ -288,6 +320,271 @@ def parse_action_to_structure_output(
     return actions
 
 
+# Compiled parser, producing typed actions. `parse_action_to_structure_output` above
+# is the reference implementation, and a sample of parses is checked against it
+# (see `UITARS_PARSER_SHADOW_RATE`).
+
+_POINT = re.compile(r"<point>(\d+)\s+(\d+)</point>")
+_POINT_ALIAS = re.compile(r"(start_|end_)?point=")
+_POINT_ALIASES = {"start_": "start_box=", "end_": "end_box=", None: "start_box="}
+_THOUGHT_PATTERNS = {
+    "Thought:": re.compile(r"Thought: (.+?)(?=\s*Action: |$)", re.DOTALL),
+    "Reflection:": re.compile(
+        r"Reflection: (.+?)Action_Summary: (.+?)(?=\s*Action: |$)", re.DOTALL
+    ),
+    "Action_Summary:": re.compile(r"Action_Summary: (.+?)(?=\s*Action: |$)", re.DOTALL),
+}
+_TYPE_CONTENT = re.compile(r"type\(content='(.*?)'\)")
+_UNESCAPED_QUOTE = re.compile(r"(?<!\\)'")
+
+# Calls with keyword string arguments only, e.g. click(start_box='(10,20)'). Anything
+# else is left to `parse_action`, so both parsers accept the same inputs.
+_IDENTIFIER = r"[A-Za-z_][A-Za-z0-9_]*"
+_CALL = re.compile(
+    rf"(?:{_IDENTIFIER}[ \t]*\.[ \t]*)*({_IDENTIFIER})[ \t]*\((.*)\)[ \t]*", re.DOTALL
+)
+_KWARG = re.compile(
+    rf"[ \t]*({_IDENTIFIER})[ \t]*=[ \t]*"
+    r"('(?:[^'\\\r\n]|\\[^\r\n])*'|\"(?:[^\"\\\r\n]|\\[^\r\n])*\")[ \t]*"
+)
+
+parse_latency = metrics.histogram(
+    "uitars.parse_latency", "Time to parse a UI-TARS response, by parser", "s"
+)
+parse_mismatches = metrics.counter(
+    "uitars.parse_mismatches",
+    "Sampled UI-TARS responses parsed differently by the reference parser",
+)
+
+_ACTION_TYPES = {action_type.value: action_type for action_type in ActionType}
+
+
+@dataclass(frozen=True, slots=True)
+class ParsedAction:
+    """
+    An action of a UI-TARS response.
+
+    Box inputs (`start_box`, `end_box`) are tuples of screen coordinates relative to
+    the screenshot size, other inputs are strings.
+    """
+
+    action_type: ActionType | str  # The name of the function for unknown actions
+    action_inputs: dict
+    thought: Optional[str] = None
+    reflection: Optional[str] = None
+    text: str = ""
+
+    def to_dict(self, legacy: bool = False) -> dict:
+        """
+        Convert the action to a dictionary structure.
+
+        Args:
+            legacy (bool): Return the structure of `parse_action_to_structure_output`,
+                with boxes as strings
+
+        Returns:
+            dict: The action
+        """
+        action_inputs = self.action_inputs
+        if legacy:
+            action_inputs = {
+                name: str(list(value)) if isinstance(value, tuple) else value
+                for name, value in action_inputs.items()
+            }
+        action_type = self.action_type
+        return {
+            "reflection": self.reflection,
+            "thought": self.thought,
+            "action_type": getattr(action_type, "value", action_type),
+            "action_inputs": action_inputs,
+            "text": self.text,
+        }
+
+
+def parse_actions(
+    text: str,
+    origin_resized_height: int,
+    origin_resized_width: int,
+    factor: int = IMAGE_FACTOR,
+    model_type: str = "qwen25vl",
+    max_pixels: int = MAX_PIXELS,
+    min_pixels: int = MIN_PIXELS,
+) -> list[ParsedAction]:
+    """
+    Parse the actions of a UI-TARS response.
+
+    Same semantics as `parse_action_to_structure_output`, with precompiled patterns,
+    without round-tripping plain calls through `ast`, and with numeric boxes.
+
+    Args:
+        text (str): The response of the model
+        origin_resized_height (int): Height of the screenshot sent to the model
+        origin_resized_width (int): Width of the screenshot sent to the model
+        factor (int): Coordinate factor, for models with relative coordinates
+        model_type (str): "qwen25vl" for models answering in absolute coordinates
+        max_pixels (int): Pixel budget the screenshot was resized to
+        min_pixels (int): Minimum pixels the screenshot was resized to
+
+    Returns:
+        list[ParsedAction]: The actions, in order
+
+    Raises:
+        ValueError: If the response holds no action, or an action cannot be parsed.
+    """
+    started = time.perf_counter()
+    actions = _parse_actions(
+        text,
+        origin_resized_height,
+        origin_resized_width,
+        factor,
+        model_type,
+        max_pixels,
+        min_pixels,
+    )
+    parse_latency.record(time.perf_counter() - started, parser="compiled")
+
+    if UITARS_PARSER_SHADOW_RATE and random.random() < UITARS_PARSER_SHADOW_RATE:
+        started = time.perf_counter()
+        try:
+            expected = parse_action_to_structure_output(
+                text,
+                origin_resized_height,
+                origin_resized_width,
+                factor,
+                model_type,
+                max_pixels,
+                min_pixels,
+            )
+        except Exception:
+            expected = None
+        parse_latency.record(time.perf_counter() - started, parser="reference")
+        if expected != [action.to_dict(legacy=True) for action in actions]:
+            parse_mismatches.add()
+            logger.warning("UI-TARS parsers disagree on response: %r", text)
+    return actions
+
+
+def _parse_actions(
+    text, origin_resized_height, origin_resized_width, factor, model_type, max_pixels, min_pixels
+) -> list[ParsedAction]:
+    text = text.strip()
+    if "<point>" in text:
+        text = _POINT.sub(r"(\1,\2)", text.replace("[EOS]", "")).strip()
+    if "point=" in text:
+        text = _POINT_ALIAS.sub(lambda match: _POINT_ALIASES[match.group(1)], text)
+
+    if model_type == "qwen25vl":
+        # The reference parser always resizes with IMAGE_FACTOR
+        height, width = resize_geometry(
+            origin_resized_height, origin_resized_width, IMAGE_FACTOR, min_pixels, max_pixels
+        )
+
+    reflection, thought = None, None
+    thought_pattern = _THOUGHT_PATTERNS["Thought:"]
+    for prefix, pattern in _THOUGHT_PATTERNS.items():
+        if text.startswith(prefix):
+            thought_pattern = pattern
+            break
+    thought_match = thought_pattern.search(text)
+    if thought_match:
+        if thought_match.re.groups == 1:
+            thought = thought_match.group(1).strip()
+        else:
+            reflection = thought_match.group(1).strip()
+            thought = thought_match.group(2).strip()
+    if "Action:" not in text:
+        raise ValueError("No action in the response")
+
+    actions = []
+    for raw in text.rpartition("Action: ")[2].split(")\n\n"):
+        if "type(content" in raw:
+            if not raw.strip().endswith(")"):
+                raw = raw.strip() + ")"
+            if not _TYPE_CONTENT.search(raw):
+                raise ValueError("Pattern not found in the input string.")
+            content = _UNESCAPED_QUOTE.sub(r"\\'", _TYPE_CONTENT.sub(r"\1", raw))
+            raw = "type(content='" + content + "')"
+        if not raw.strip().endswith(")"):
+            raw = raw.strip() + ")"
+
+        parsed = _parse_call(raw.replace("\n", "\\n").lstrip())
+        if parsed is None:
+            raise ValueError(f"Action can't parse: {raw}")
+        function, arguments = parsed
+
+        action_inputs = {}
+        for name, value in arguments.items():
+            if value == "":
+                continue
+            value = value.lstrip()
+            name = name.strip()
+            if "start_box" in name or "end_box" in name:
+                numbers = value.rpartition("(")[2].partition(")")[0].split(",")
+                if model_type == "qwen25vl":
+                    box = tuple(
+                        float(number) / (height if index % 2 else width)
+                        for index, number in enumerate(numbers)
+                    )
+                else:
+                    box = tuple(float(number) / factor for number in numbers)
+                action_inputs[name] = box * 2 if len(box) == 2 else box
+            else:
+                action_inputs[name] = value
+
+        actions.append(
+            ParsedAction(
+                action_type=_ACTION_TYPES.get(function, function),
+                action_inputs=action_inputs,
+                thought=thought,
+                reflection=reflection,
+                text=text,
+            )
+        )
+    return actions
+
+
+def _parse_call(action: str) -> Optional[tuple[Optional[str], dict]]:
+    """Parse the function name and keyword arguments of an action call."""
+    call = _CALL.fullmatch(action)
+    if call is None or "\x00" in action:
+        return _parse_call_ast(action)
+    function, arguments = call.groups()
+    if keyword.iskeyword(function):
+        return _parse_call_ast(action)
+
+    kwargs = {}
+    position, end = 0, len(arguments)
+    if arguments.strip(" \t"):
+        while True:
+            argument = _KWARG.match(arguments, position)
+            if argument is None or keyword.iskeyword(argument.group(1)):
+                return _parse_call_ast(action)
+            name, literal = argument.groups()
+            body = literal[1:-1]
+            if "\\" in body:
+                try:
+                    body = ast.literal_eval(literal)
+                except Exception:
+                    return _parse_call_ast(action)
+            kwargs[name] = body
+            position = argument.end()
+            if position == end:
+                break
+            if arguments[position] != ",":
+                return _parse_call_ast(action)
+            position += 1
+            if not arguments[position:].strip(" \t"):
+                break  # Trailing comma
+    return function, kwargs
+
+
+def _parse_call_ast(action: str) -> Optional[tuple[Optional[str], dict]]:
+    parsed = parse_action(action)
+    if parsed is None:
+        return None
+    return parsed["function"], parsed["args"]
+
+
 def parsing_response_to_pyautogui_code(
     responses, image_height: int, image_width: int, input_swap: bool = True
 ) -> str:
@@ -308,9 +605,11 @@ def parsing_response_to_pyautogui_code(
     """
 
     pyautogui_code = f"import pyautogui\nimport time\n"
-    if isinstance(responses, dict):
+    if isinstance(responses, (dict, ParsedAction)):
         responses = [responses]
     for response_id, response in enumerate(responses):
+        if isinstance(response, ParsedAction):
+            response = response.to_dict()
         if "observation" in response:
             observation = response["observation"]
         else:
@@ -443,10 +742,10 @@ def parsing_response_to_pyautogui_code(
             start_box = action_inputs.get("start_box")
             end_box = action_inputs.get("end_box")
             if start_box and end_box:
-                x1, y1, x2, y2 = eval(start_box)  # Assuming box is in [x1, y1, x2, y2]
+                x1, y1, x2, y2 = _box(start_box)  # Assuming box is in [x1, y1, x2, y2]
                 sx = round(float((x1 + x2) / 2) * image_width, 3)
                 sy = round(float((y1 + y2) / 2) * image_height, 3)
-                x1, y1, x2, y2 = eval(end_box)  # Assuming box is in [x1, y1, x2, y2]
+                x1, y1, x2, y2 = _box(end_box)  # Assuming box is in [x1, y1, x2, y2]
                 ex = round(float((x1 + x2) / 2) * image_width, 3)
                 ey = round(float((y1 + y2) / 2) * image_height, 3)
                 pyautogui_code += (
@@ -458,7 +757,7 @@ def parsing_response_to_pyautogui_code(
             # Parsing scroll action
             start_box = action_inputs.get("start_box")
             if start_box:
-                x1, y1, x2, y2 = eval(start_box)  # Assuming box is in [x1, y1, x2, y2]
+                x1, y1, x2, y2 = _box(start_box)  # Assuming box is in [x1, y1, x2, y2]
                 x = round(float((x1 + x2) / 2) * image_width, 3)
                 y = round(float((y1 + y2) / 2) * image_height, 3)
 
@@ -488,28 +787,25 @@ def parsing_response_to_pyautogui_code(
             "hover",
         ]:
             # Parsing mouse click actions
-            start_box = action_inputs.get("start_box")
-            start_box = str(start_box)
-            if start_box:
-                start_box = eval(start_box)
-                if len(start_box) == 4:
-                    x1, y1, x2, y2 = start_box  # Assuming box is in [x1, y1, x2, y2]
-                elif len(start_box) == 2:
-                    x1, y1 = start_box
-                    x2 = x1
-                    y2 = y1
-                x = round(float((x1 + x2) / 2) * image_width, 3)
-                y = round(float((y1 + y2) / 2) * image_height, 3)
-                if action_type == "left_single" or action_type == "click":
-                    pyautogui_code += f"\npyautogui.click({x}, {y}, button='left')"
-                elif action_type == "left_double":
-                    pyautogui_code += (
-                        f"\npyautogui.doubleClick({x}, {y}, button='left')"
-                    )
-                elif action_type == "right_single":
-                    pyautogui_code += f"\npyautogui.click({x}, {y}, button='right')"
-                elif action_type == "hover":
-                    pyautogui_code += f"\npyautogui.moveTo({x}, {y})"
+            start_box = _box(action_inputs.get("start_box"))  # Required, None fails below
+            if len(start_box) == 4:
+                x1, y1, x2, y2 = start_box  # Assuming box is in [x1, y1, x2, y2]
+            elif len(start_box) == 2:
+                x1, y1 = start_box
+                x2 = x1
+                y2 = y1
+            x = round(float((x1 + x2) / 2) * image_width, 3)
+            y = round(float((y1 + y2) / 2) * image_height, 3)
+            if action_type == "left_single" or action_type == "click":
+                pyautogui_code += f"\npyautogui.click({x}, {y}, button='left')"
+            elif action_type == "left_double":
+                pyautogui_code += (
+                    f"\npyautogui.doubleClick({x}, {y}, button='left')"
+                )
+            elif action_type == "right_single":
+                pyautogui_code += f"\npyautogui.click({x}, {y}, button='right')"
+            elif action_type == "hover":
+                pyautogui_code += f"\npyautogui.moveTo({x}, {y})"
 
         elif action_type in ["finished"]:
             pyautogui_code = f"DONE"
@@ -520,6 +816,132 @@ def parsing_response_to_pyautogui_code(
     return pyautogui_code
 
 
+_KEY_ALIASES = {
+    "arrowleft": "left",
+    "arrowright": "right",
+    "arrowup": "up",
+    "arrowdown": "down",
+}
+
+
+def action_command(
+    action: ParsedAction, image_height: int, image_width: int
+) -> Optional[ActionCommand]:
+    """
+    Convert a parsed action to the command robots with native action support run.
+
+    Same semantics as `parsing_response_to_pyautogui_code`, without the code: the
+    robot decides how to type text and how long to wait after each action.
+
+    Args:
+        action (ParsedAction): The action
+        image_height (int): Height of the robot screen, in pixels
+        image_width (int): Width of the robot screen, in pixels
+
+    Returns:
+        Optional[ActionCommand]: The command, or None for actions without one
+            (finished, unknown actions, or actions missing their inputs).
+    """
+    action_type = action.action_type
+    inputs = action.action_inputs
+
+    def center(box) -> tuple[float, float]:
+        if len(box) == 2:
+            box = (*box, *box)
+        x1, y1, x2, y2 = box
+        return (
+            round(float((x1 + x2) / 2) * image_width, 3),
+            round(float((y1 + y2) / 2) * image_height, 3),
+        )
+
+    if action_type == ActionType.HOTKEY:
+        hotkey = inputs.get("key", "") if "key" in inputs else inputs.get("hotkey", "")
+        hotkey = _KEY_ALIASES.get(hotkey, hotkey)
+        if not hotkey:
+            return None
+        keys = [" " if key == "space" else key for key in hotkey.split()]
+        return ActionCommand(action=CommandType.HOTKEY, keys=keys)
+
+    if action_type in (
+        ActionType.PRESS,
+        ActionType.KEYDOWN,
+        ActionType.RELEASE,
+        ActionType.KEYUP,
+    ):
+        key = inputs.get("key", "") if "key" in inputs else inputs.get("press", "")
+        key = " " if key == "space" else _KEY_ALIASES.get(key, key)
+        if not key:
+            return None
+        command_type = (
+            CommandType.KEY_DOWN
+            if action_type in (ActionType.PRESS, ActionType.KEYDOWN)
+            else CommandType.KEY_UP
+        )
+        return ActionCommand(action=command_type, keys=[key])
+
+    if action_type == ActionType.TYPE:
+        content = inputs.get("content", "")
+        if not content:
+            return None
+        submit = content.endswith("\n") or content.endswith("\\n")
+        if submit:
+            # A single trailing newline, escaped or not, submits the text
+            content = content[:-2] if content.endswith("\\n") else content[:-1]
+        return ActionCommand(action=CommandType.TYPE, text=content, submit=submit)
+
+    if action_type in (ActionType.DRAG, ActionType.SELECT):
+        start_box, end_box = inputs.get("start_box"), inputs.get("end_box")
+        if not (start_box and end_box):
+            return None
+        x, y = center(_box(start_box))
+        end_x, end_y = center(_box(end_box))
+        return ActionCommand(
+            action=CommandType.DRAG, x=x, y=y, end_x=end_x, end_y=end_y
+        )
+
+    if action_type == ActionType.SCROLL:
+        direction = inputs.get("direction", "").lower()
+        if "up" in direction:
+            amount = 5
+        elif "down" in direction:
+            amount = -5
+        else:
+            return None
+        x = y = None
+        if inputs.get("start_box"):
+            x, y = center(_box(inputs["start_box"]))
+        return ActionCommand(action=CommandType.SCROLL, x=x, y=y, amount=amount)
+
+    if action_type in (
+        ActionType.CLICK,
+        ActionType.LEFT_SINGLE,
+        ActionType.LEFT_DOUBLE,
+        ActionType.RIGHT_SINGLE,
+        ActionType.HOVER,
+    ):
+        if not inputs.get("start_box"):
+            return None
+        x, y = center(_box(inputs["start_box"]))
+        if action_type == ActionType.HOVER:
+            return ActionCommand(action=CommandType.MOVE, x=x, y=y)
+        return ActionCommand(
+            action=CommandType.CLICK,
+            x=x,
+            y=y,
+            button="right" if action_type == ActionType.RIGHT_SINGLE else "left",
+            clicks=2 if action_type == ActionType.LEFT_DOUBLE else 1,
+        )
+
+    return None
+
+
+def _box(value) -> tuple:
+    """Return a box of a parsed action as numbers. Boxes of the reference parser are strings."""
+    if isinstance(value, str):
+        return ast.literal_eval(value)
+    return value
+
+
 def add_box_token(input_string):
     # Step 1: Split the string into individual actions
     if "Action: " in input_string and "start_box=" in input_string:
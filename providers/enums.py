@@ -0,0 +1,35 @@
+# Declares the enums used by the LLM provider layer
+
+from enum import Enum
+
+
+class ModelRole(str, Enum):
+    """
+    Enum representing what a model is used for. Each role has its own model and
+    provider failover chain.
+    """
+
+    ROUTING = "routing"
+    PLANNING = "planning"
+    VISION_TOOL = "vision_tool"
+    GROUNDING = "grounding"
+
+
+class ProviderTier(str, Enum):
+    """
+    Enum representing the provider tiers a role can fail over to.
+    """
+
+    PAID = "paid"  # PROVIDER_API_KEY
+    FREE = "free"  # FREE_PROVIDER_API_KEY
+    LOCAL = "local"  # Ollama
+
+
+class BreakerState(int, Enum):
+    """
+    Enum representing the state of a circuit breaker.
+    """
+
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
@@ -0,0 +1,276 @@
+"""
+Provider Failover for RPA Recovery Framework
+
+Wraps the models of a role (routing, planning, vision tool, grounding) in an ordered
+failover chain (e.g. paid key -> free key -> local Ollama). Each endpoint has a
+circuit breaker and a first-event timeout, and requests slower than a latency
+percentile of the endpoint are hedged with a duplicate request to the next one.
+
+Failover and hedging only happen before the first event of a response is received;
+an error in the middle of a stream is propagated, since partial output cannot be
+replayed safely.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Optional
+
+from strands.models import Model
+
+import metrics
+from providers.enums import BreakerState, ModelRole
+from settings import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    PROVIDER_HEDGE_MIN_SAMPLES,
+    PROVIDER_HEDGE_PERCENTILE,
+    PROVIDER_HEDGING,
+    PROVIDER_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+breaker_state = metrics.gauge(
+    "provider.breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)"
+)
+failovers = metrics.counter("provider.failovers", "Requests failed over to the next endpoint")
+hedges = metrics.counter("provider.hedges", "Duplicate requests sent to a slow endpoint's successor")
+hedge_wins = metrics.counter(
+    "provider.hedge_wins", "Duplicate requests answering before the slow request they hedge"
+)
+first_event_latency = metrics.histogram(
+    "provider.first_event_latency", "Time to the first event of a model response", "s"
+)
+
+
+class ProviderUnavailable(RuntimeError):
+    """Raised when no endpoint of a failover chain could serve a request."""
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to an endpoint after consecutive failures, and lets a
+    single request through again after `reset_timeout` seconds to probe it. Other
+    requests skip the endpoint until the probe succeeds or fails.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = BreakerState.CLOSED
+        self.probing = False  # Whether a probe request is in flight
+
+    def can_try(self) -> bool:
+        """Check whether a request could be sent to the endpoint, without changing its state."""
+        if self.state == BreakerState.CLOSED:
+            return True
+        if self.state == BreakerState.OPEN and (
+            time.monotonic() - self.opened_at < self.reset_timeout
+        ):
+            return False
+        return not self.probing
+
+    def acquire(self) -> bool:
+        """
+        Take the right to send a request to the endpoint, right before sending it.
+
+        Returns:
+            bool: Whether the request can be sent. Once the reset timeout has passed,
+            only the first request gets through, as the probe.
+        """
+        if not self.can_try():
+            return False
+        if self.state != BreakerState.CLOSED:
+            self._set_state(BreakerState.HALF_OPEN)
+            self.probing = True
+        return True
+
+    def release(self) -> None:
+        """Give up a request abandoned before its outcome was known."""
+        self.probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.probing = False
+        self._set_state(BreakerState.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if (
+            self.state == BreakerState.HALF_OPEN
+            or self.failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            self._set_state(BreakerState.OPEN)
+
+    def _set_state(self, state: BreakerState) -> None:
+        if state != self.state:
+            logger.warning("Circuit breaker %s is now %s", self.name, state.name)
+        self.state = state
+        breaker_state.set(state.value, endpoint=self.name)
+
+
+class Endpoint:
+    """
+    A model at a provider, with its circuit breaker and recent latencies.
+    """
+
+    def __init__(self, name: str, model: Model, breaker: CircuitBreaker):
+        self.name = name
+        self.model = model
+        self.breaker = breaker
+        self.latencies: deque[float] = deque(maxlen=200)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Latency percentile after which a request to this endpoint is hedged."""
+        if len(self.latencies) < PROVIDER_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * PROVIDER_HEDGE_PERCENTILE))]
+
+
+class FailoverModel(Model):
+    """
+    Model that serves each request from the first healthy endpoint of a role's chain.
+    """
+
+    def __init__(self, role: ModelRole, endpoints: list[Endpoint]):
+        self.role = role
+        self.endpoints = endpoints
+
+    def update_config(self, **model_config: Any) -> None:
+        for endpoint in self.endpoints:
+            endpoint.model.update_config(**model_config)
+
+    def get_config(self) -> Any:
+        return self.endpoints[0].model.get_config()
+
+    async def stream(
+        self, messages, tool_specs=None, system_prompt=None, **kwargs
+    ) -> AsyncGenerator[Any, None]:
+        async for event in self._failover(
+            lambda model: model.stream(messages, tool_specs, system_prompt, **kwargs)
+        ):
+            yield event
+
+    async def structured_output(
+        self, output_model, prompt, system_prompt=None, **kwargs
+    ) -> AsyncGenerator[Any, None]:
+        async for event in self._failover(
+            lambda model: model.structured_output(
+                output_model, prompt, system_prompt=system_prompt, **kwargs
+            )
+        ):
+            yield event
+
+    async def _failover(
+        self, call: Callable[[Model], AsyncIterator]
+    ) -> AsyncGenerator[Any, None]:
+        endpoint, iterator, first = await self._first_event(call)
+        yield first
+        try:
+            async for event in iterator:
+                yield event
+        except Exception:
+            endpoint.breaker.record_failure()
+            raise
+
+    async def _first_event(
+        self, call: Callable[[Model], AsyncIterator]
+    ) -> tuple[Endpoint, AsyncIterator, Any]:
+        """
+        Start the request on the first healthy endpoint, hedge it when it is slow and
+        fail over on errors, until an endpoint produces its first event.
+        """
+        queue = [endpoint for endpoint in self.endpoints if endpoint.breaker.can_try()]
+
+        pending: dict[asyncio.Task, tuple[Endpoint, AsyncIterator, float]] = {}
+        probes: set[asyncio.Task] = set()  # Requests probing a half-open breaker
+        errors: list[str] = []
+        hedged: Optional[asyncio.Task] = None  # Slow request a duplicate was sent for
+
+        def launch() -> None:
+            """Start the request on the next endpoint whose breaker lets it through."""
+            while queue:
+                endpoint = queue.pop(0)
+                if not endpoint.breaker.acquire():
+                    continue  # Another request is probing it
+                iterator = call(endpoint.model).__aiter__()
+                task = asyncio.create_task(
+                    asyncio.wait_for(anext(iterator), PROVIDER_TIMEOUT)
+                )
+                pending[task] = (endpoint, iterator, time.monotonic())
+                if endpoint.breaker.state == BreakerState.HALF_OPEN:
+                    probes.add(task)
+                return
+
+        launch()
+        if not pending:
+            raise ProviderUnavailable(f"All {self.role.value} providers are unavailable")
+        try:
+            while pending:
+                delay = None
+                if PROVIDER_HEDGING and queue and len(pending) == 1:
+                    delay = next(iter(pending.values()))[0].hedge_delay()
+
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedges.add(role=self.role.value)
+                    hedged = next(iter(pending))
+                    launch()
+                    continue
+
+                for task in done:
+                    endpoint, iterator, started = pending.pop(task)
+                    try:
+                        first = task.result()
+                    except Exception as e:
+                        endpoint.breaker.record_failure()
+                        errors.append(f"{endpoint.name}: {e!r}")
+                        failovers.add(role=self.role.value, endpoint=endpoint.name)
+                        await _close(iterator)
+                        if queue and not pending:
+                            launch()
+                        continue
+
+                    latency = time.monotonic() - started
+                    endpoint.latencies.append(latency)
+                    endpoint.breaker.record_success()
+                    first_event_latency.record(latency, endpoint=endpoint.name)
+                    if hedged is not None and task is not hedged and hedged in pending:
+                        # The duplicate beat the slow request it was sent for
+                        hedge_wins.add(role=self.role.value)
+                    return endpoint, iterator, first
+        finally:
+            # Requests lost to a faster endpoint, or abandoned with the caller
+            for task, (endpoint, iterator, _) in pending.items():
+                task.cancel()
+                if task in probes:
+                    endpoint.breaker.release()
+                asyncio.create_task(_close(iterator))
+
+        raise ProviderUnavailable(
+            f"All {self.role.value} providers failed: {'; '.join(errors)}"
+        )
+
+
+async def _close(iterator: AsyncIterator) -> None:
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
@@ -0,0 +1,196 @@
+"""
+Model Registry for RPA Recovery Framework
+
+Process-wide registry that hands out long-lived LLM models. Models are cached by
+(model_id, base_url, api_key) and every model talking to the same provider host
+shares a single pooled, keep-alive HTTP client, so nested agents and tools reuse
+connections instead of opening a new client (and TLS handshake) on every call.
+"""
+
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+from strands.models.openai import OpenAIModel
+
+from providers.enums import ModelRole, ProviderTier
+from providers.failover import CircuitBreaker, Endpoint, FailoverModel
+from settings import (
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MAX_CONNECTIONS_PER_HOST,
+    LLM_POOL_SIZE,
+    LLM_REQUEST_TIMEOUT,
+    FREE_PROVIDER_API_KEY,
+    OLLAMA_GROUNDING_MODEL,
+    OLLAMA_MODEL,
+    OLLAMA_URL,
+    OLLAMA_VISION_MODEL,
+    OLLAMA_VISION_TOOL_MODEL,
+    PROVIDER_API_BASE,
+    PROVIDER_API_KEY,
+    PROVIDER_FAILOVER,
+    PROVIDER_GROUNDING_MODEL,
+    PROVIDER_MODEL,
+    PROVIDER_VISION_MODEL,
+    PROVIDER_VISION_TOOL_MODEL,
+)
+
+# Model of each role at the remote provider and at the local Ollama server
+ROLE_MODELS = {
+    ModelRole.ROUTING: (PROVIDER_MODEL, OLLAMA_MODEL),
+    ModelRole.PLANNING: (PROVIDER_VISION_MODEL, OLLAMA_VISION_MODEL),
+    ModelRole.VISION_TOOL: (PROVIDER_VISION_TOOL_MODEL, OLLAMA_VISION_TOOL_MODEL),
+    ModelRole.GROUNDING: (PROVIDER_GROUNDING_MODEL, OLLAMA_GROUNDING_MODEL),
+}
+
+
+class PooledAsyncClient(httpx.AsyncClient):
+    """
+    HTTP client shared by every model that talks to the same provider host.
+
+    OpenAI clients close their transport when they are disposed of. The pool is
+    owned by the registry, so closing it is deferred until `close_pool()` is
+    called on application shutdown.
+    """
+
+    async def aclose(self) -> None:
+        return None
+
+    async def close_pool(self) -> None:
+        await super().aclose()
+
+
+class ModelRegistry:
+    """
+    Registry of long-lived models backed by pooled HTTP clients.
+    """
+
+    def __init__(self):
+        self._models: dict[tuple[str, str, str], OpenAIModel] = {}
+        self._clients: dict[str, PooledAsyncClient] = {}
+        self._roles: dict[ModelRole, FailoverModel] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def _client_for(self, base_url: str) -> PooledAsyncClient:
+        """Return the pooled HTTP client for the host of `base_url`."""
+        host = urlsplit(base_url).netloc or base_url
+        client = self._clients.get(host)
+        if client is None:
+            client = PooledAsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS_PER_HOST,
+                    max_keepalive_connections=LLM_POOL_SIZE,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=10.0),
+            )
+            self._clients[host] = client
+        return client
+
+    def get(
+        self, model_id: str, api_key: str, base_url: str = PROVIDER_API_BASE
+    ) -> OpenAIModel:
+        """
+        Return the shared model for the given model id and provider credentials.
+
+        Args:
+            model_id (str): Identifier of the model at the provider
+            api_key (str): API key used to authenticate against the provider
+            base_url (str): Base URL of the OpenAI-compatible provider API
+
+        Returns:
+            OpenAIModel: A model instance reused across agents and requests.
+        """
+        key = (model_id, base_url, api_key)
+        model = self._models.get(key)
+        if model is None:
+            model = OpenAIModel(
+                client_args={
+                    "api_key": api_key,
+                    "base_url": base_url,
+                    "http_client": self._client_for(base_url),
+                },
+                model_id=model_id,
+            )
+            self._models[key] = model
+        return model
+
+    def _endpoint(self, role: ModelRole, tier: ProviderTier) -> Optional[Endpoint]:
+        """Return the endpoint of a role at a provider tier, if it is configured."""
+        remote_model, local_model = ROLE_MODELS[role]
+        if tier == ProviderTier.LOCAL:
+            model_id, api_key, base_url = local_model, "ollama", f"{OLLAMA_URL}/v1"
+        elif tier == ProviderTier.PAID:
+            model_id, api_key, base_url = remote_model, PROVIDER_API_KEY, PROVIDER_API_BASE
+        else:
+            model_id, api_key, base_url = (
+                remote_model,
+                FREE_PROVIDER_API_KEY,
+                PROVIDER_API_BASE,
+            )
+        if not model_id or not api_key:
+            return None
+
+        # Breakers are shared by the roles using the same model and credentials
+        name = f"{tier.value}:{model_id}"
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name)
+        return Endpoint(name, self.get(model_id, api_key, base_url), breaker)
+
+    def for_role(self, role: ModelRole) -> FailoverModel:
+        """
+        Return the model of a role, failing over along its configured provider tiers.
+
+        Args:
+            role (ModelRole): What the model is used for
+
+        Returns:
+            FailoverModel: A model instance reused across agents and requests.
+        """
+        model = self._roles.get(role)
+        if model is None:
+            endpoints = []
+            for tier in PROVIDER_FAILOVER[role.value]:
+                endpoint = self._endpoint(role, ProviderTier(tier.strip()))
+                if endpoint is not None:
+                    endpoints.append(endpoint)
+            if not endpoints:
+                raise ValueError(f"No provider is configured for the {role.value} role")
+            model = self._roles[role] = FailoverModel(role, endpoints)
+        return model
+
+    def breaker_states(self) -> dict[str, str]:
+        """Return the state of the circuit breaker of every endpoint."""
+        return {name: breaker.state.name.lower() for name, breaker in self._breakers.items()}
+
+    def open(self) -> None:
+        """
+        Create the models configured in settings ahead of the first request.
+        """
+        for role in ModelRole:
+            self.for_role(role)
+
+    async def close(self) -> None:
+        """Close every pooled HTTP client and forget the cached models."""
+        clients = list(self._clients.values())
+        self._models.clear()
+        self._roles.clear()
+        self._clients.clear()
+        for client in clients:
+            await client.close_pool()
+
+
+model_registry = ModelRegistry()
+
+
+def get_model(
+    model_id: str, api_key: str, base_url: str = PROVIDER_API_BASE
+) -> OpenAIModel:
+    """Shortcut for `model_registry.get()`."""
+    return model_registry.get(model_id, api_key, base_url)
+
+
+def get_role_model(role: ModelRole) -> FailoverModel:
+    """Shortcut for `model_registry.for_role()`."""
+    return model_registry.for_role(role)
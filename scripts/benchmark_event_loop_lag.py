@@ -0,0 +1,126 @@
+"""
+Benchmark the event loop lag caused by database access (see database.general).
+
+Runs concurrent recovery sessions that each list the recovery modules in a loop,
+once through the blocking engine called from the event loop (how tools used to
+query the database) and once through the async engine, while a probe measures how
+late the event loop wakes it up. Late wake-ups delay every robot connection served
+by the gateway.
+
+Uses POSTGRES_URL and POSTGRES_ASYNC_URL by default; the tables are created if
+needed. SQLite works for a quick run without Postgres:
+
+    python scripts/benchmark_event_loop_lag.py --sessions 50 \\
+        --sync-url sqlite:///bench.db --async-url sqlite+aiosqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent_tools.links import ToolModuleLink  # noqa: E402
+from agent_tools.models import Tool  # noqa: E402
+from gateway.models import Module  # noqa: E402
+from settings import POSTGRES_ASYNC_URL, POSTGRES_URL  # noqa: E402
+
+PROBE_INTERVAL = 0.005  # Seconds between event loop probes
+
+
+def prepare(url: str, modules: int) -> None:
+    """Create the module tables and fill them, if they are empty."""
+    engine = create_engine(url)
+    tables = [Module.__table__, Tool.__table__, ToolModuleLink.__table__]
+    SQLModel.metadata.create_all(engine, tables=tables)
+    with Session(engine) as session:
+        if session.exec(select(Module)).first() is None:
+            session.add_all(
+                Module(name=f"Module {i}", description="Benchmark module", routing_tool=f"module_{i}")
+                for i in range(modules)
+            )
+            session.commit()
+    engine.dispose()
+
+
+async def probe(lags: list[float], stop: asyncio.Event) -> None:
+    """Record how late the event loop runs a task that sleeps for PROBE_INTERVAL."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def run(path: str, url: str, sessions: int, seconds: float) -> dict:
+    lags: list[float] = []
+    queries = 0
+    stop = asyncio.Event()
+
+    if path == "sync":
+        engine = create_engine(url, pool_size=sessions)
+
+        async def session_loop():
+            nonlocal queries
+            while not stop.is_set():
+                with Session(engine) as session:  # Blocks the event loop
+                    session.exec(select(Module)).unique().all()
+                queries += 1
+                await asyncio.sleep(0)
+    else:
+        engine = create_async_engine(url, pool_size=sessions)
+
+        async def session_loop():
+            nonlocal queries
+            while not stop.is_set():
+                async with AsyncSession(engine) as session:
+                    (await session.exec(select(Module))).unique().all()
+                queries += 1
+
+    tasks = [asyncio.create_task(probe(lags, stop))]
+    tasks += [asyncio.create_task(session_loop()) for _ in range(sessions)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    if path == "sync":
+        engine.dispose()
+    else:
+        await engine.dispose()
+
+    lags.sort()
+    return {
+        "queries/s": queries / seconds,
+        "p50": statistics.median(lags),
+        "p99": lags[int(len(lags) * 0.99)],
+        "max": lags[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sync-url", default=POSTGRES_URL)
+    parser.add_argument("--async-url", default=POSTGRES_ASYNC_URL)
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent sessions")
+    parser.add_argument("--modules", type=int, default=20, help="Modules to create")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Per engine")
+    args = parser.parse_args()
+
+    prepare(args.sync_url, args.modules)
+    print(f"{args.sessions} sessions, event loop lag in ms")
+    print(f"{'engine':<7} {'queries/s':>10} {'p50':>8} {'p99':>8} {'max':>8}")
+    for path, url in (("sync", args.sync_url), ("async", args.async_url)):
+        result = asyncio.run(run(path, url, args.sessions, args.seconds))
+        print(
+            f"{path:<7} {result['queries/s']:>10.0f} {result['p50'] * 1000:>8.2f} "
+            f"{result['p99'] * 1000:>8.2f} {result['max'] * 1000:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark the tiered screenshot change detection against full resolution SSIM.
+
+Runs `agent_tools.image.detect_change` and `detect_change_full` on before/after
+screenshot pairs, and reports the latency of both and how often they disagree, by
+the tier that decided. Thresholds are read from the settings, so they can be tuned
+through the environment:
+
+    IMAGE_COMPARE_MAD_CHANGED=10 python scripts/benchmark_image_compare.py corpus/
+
+The corpus is a directory of `<name>.before.<ext>` and `<name>.after.<ext>` pairs,
+or of screenshots taken in sequence (each one paired with the next, by name).
+Without a corpus, a reproducible set of synthetic screen changes is generated.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent_tools.image import detect_change, detect_change_full  # noqa: E402
+
+
+def corpus_pairs(directory: Path) -> list[tuple[str, bytes, bytes]]:
+    """Read the before/after pairs of a corpus directory."""
+    files = sorted(p for p in directory.iterdir() if p.is_file())
+    befores = {p.name.split(".before.")[0]: p for p in files if ".before." in p.name}
+    afters = {p.name.split(".after.")[0]: p for p in files if ".after." in p.name}
+    if befores:
+        return [
+            (name, befores[name].read_bytes(), afters[name].read_bytes())
+            for name in sorted(befores.keys() & afters.keys())
+        ]
+    return [
+        (f"{a.name}->{b.name}", a.read_bytes(), b.read_bytes())
+        for a, b in zip(files, files[1:])
+    ]
+
+
+def synthetic_pairs(count: int, seed: int) -> list[tuple[str, bytes, bytes]]:
+    """Generate screenshots of a desktop-like UI and typical changes between them."""
+    rng = np.random.default_rng(seed)
+
+    def encode(image: np.ndarray, quality: int = 90) -> bytes:
+        return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+    def screen(width: int, height: int) -> np.ndarray:
+        image = np.full((height, width, 3), 235, np.uint8)
+        cv2.rectangle(image, (0, 0), (width, 40), (60, 60, 60), -1)
+        for _ in range(int(rng.integers(10, 30))):
+            x, y = int(rng.integers(0, width - 300)), int(rng.integers(50, height - 60))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(image, (x, y), (x + int(rng.integers(60, 300)), y + 30), color, -1)
+            cv2.putText(image, "Lorem ipsum", (x + 5, y + 22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+        return image
+
+    changes = {
+        "reencoded": lambda img: img,
+        "cursor": lambda img: cv2.line(img.copy(), (400, 300), (400, 318), (0, 0, 0), 2),
+        "typed_text": lambda img: cv2.putText(
+            img.copy(), "invoice 2024-0117", (300, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1
+        ),
+        "menu": lambda img: cv2.rectangle(img.copy(), (100, 40), (350, 400), (250, 250, 250), -1),
+        "dialog": lambda img: cv2.rectangle(
+            img.copy(), (img.shape[1] // 4, img.shape[0] // 4), (img.shape[1] * 3 // 4, img.shape[0] * 3 // 4), (200, 200, 220), -1
+        ),
+        "new_page": lambda img: screen(img.shape[1], img.shape[0]),
+    }
+
+    pairs = []
+    for i in range(count):
+        width, height = [(1920, 1080), (2560, 1440), (1280, 1024)][i % 3]
+        before = screen(width, height)
+        for name, change in changes.items():
+            pairs.append(
+                (
+                    f"{i}:{width}x{height}:{name}",
+                    encode(before),
+                    encode(change(before), quality=int(rng.integers(80, 95))),
+                )
+            )
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("corpus", nargs="?", type=Path, help="Directory of screenshot pairs")
+    parser.add_argument("--synthetic", type=int, default=5, help="Synthetic screens without a corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="List the pairs that disagree")
+    args = parser.parse_args()
+
+    pairs = corpus_pairs(args.corpus) if args.corpus else synthetic_pairs(args.synthetic, args.seed)
+
+    latency = defaultdict(list)
+    decided = defaultdict(int)
+    mismatches = defaultdict(list)
+    for name, before, after in pairs:
+        started = time.perf_counter()
+        changed, tier = detect_change(before, after)
+        latency[tier].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        reference = detect_change_full(before, after)
+        latency["reference"].append(time.perf_counter() - started)
+        decided[tier] += 1
+        if changed != reference:
+            mismatches[tier].append((name, changed, reference))
+
+    print(f"{len(pairs)} pairs")
+    print(f"{'tier':<10} {'pairs':>6} {'mismatches':>10} {'mean ms':>8} {'p95 ms':>8}")
+    for tier in ["exact", "mad", "ssim", "reference"]:
+        times = sorted(latency.get(tier, []))
+        if not times:
+            continue
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        count = decided[tier] if tier != "reference" else len(pairs)
+        print(
+            f"{tier:<10} {count:>6} {len(mismatches[tier]):>10} "
+            f"{statistics.mean(times) * 1000:>8.1f} {p95 * 1000:>8.1f}"
+        )
+    if args.verbose:
+        for tier, items in mismatches.items():
+            for name, changed, reference in items:
+                print(f"{tier}: {name} changed={changed} full_ssim={reference}")
+
+    return 1 if any(mismatches.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
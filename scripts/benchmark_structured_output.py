@@ -0,0 +1,180 @@
+"""
+Benchmark the structured output modes (see agent_tools.invocation.invoke_structured).
+
+Runs a recovery-like agent (it takes a screenshot, checks the UI twice, then
+reports) in each mode, against a scripted model that answers like a real one
+and counts the tokens of every request, screenshots included. Reports the model
+calls and the input and output tokens per agent invocation, as recorded in the
+agent.llm_calls and agent.llm_tokens metrics:
+
+    python scripts/benchmark_structured_output.py --tool-calls 4
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+from strands import Agent, tool
+from strands.models import Model
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent_tools import invocation  # noqa: E402
+from agent_tools.image_prep import ROLE_IMAGE_PROFILES  # noqa: E402
+from agent_tools.invocation import invoke_structured, tool_results  # noqa: E402
+from gateway.enums import StructuredOutputMode  # noqa: E402
+from providers.enums import ModelRole  # noqa: E402
+
+# A 1920x1080 screenshot prepared for the planning models
+SCREENSHOT_TOKENS = ROLE_IMAGE_PROFILES[ModelRole.PLANNING].tokens(1428, 812)
+SCREENSHOT = b"\xff\xd8" + bytes(90_000)
+
+
+class Report(BaseModel):
+    result: str = Field(..., description="Outcome of the recovery.")
+    finish_activity: bool = Field(..., description="Whether the activity completed.")
+
+
+@tool
+def take_screenshot() -> dict:
+    """Take a screenshot of the robot screen."""
+    return {
+        "status": "success",
+        "content": [{"image": {"format": "jpeg", "source": {"bytes": SCREENSHOT}}}],
+    }
+
+
+@tool
+def check_ui(element: str) -> str:
+    """Check whether an element is visible on the robot screen."""
+    return json.dumps({"element": element, "visible": True, "finished": True})
+
+
+def tokens(value) -> int:
+    """Estimate the tokens of a request: 4 characters per token, screenshots by size."""
+    if isinstance(value, dict):
+        if "image" in value:
+            return SCREENSHOT_TOKENS
+        return sum(tokens(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(tokens(item) for item in value)
+    return len(str(value)) // 4
+
+
+class ScriptedModel(Model):
+    """Calls the tools of the script, then answers; fills the report when asked to."""
+
+    def __init__(self, tool_calls: int):
+        self.tool_calls = tool_calls
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        input_tokens = tokens(messages) + tokens(system_prompt or "") + tokens(tool_specs or [])
+        names = {spec["name"] for spec in tool_specs or []}
+        turn = sum(message["role"] == "assistant" for message in messages)
+
+        yield {"messageStart": {"role": "assistant"}}
+        if Report.__name__ in names and (
+            kwargs.get("tool_choice") or turn >= self.tool_calls or "check_ui" not in names
+        ):
+            output = {"result": "The invoice was submitted", "finish_activity": True}
+            events, stop = self._tool_use(Report.__name__, output, turn), "tool_use"
+        elif turn == 0:
+            events, stop = self._tool_use("take_screenshot", {}, turn), "tool_use"
+        elif turn < self.tool_calls:
+            events, stop = self._tool_use("check_ui", {"element": "Submit"}, turn), "tool_use"
+        else:
+            text = "The Submit button is visible again and the invoice was submitted."
+            events, stop = [
+                {"contentBlockDelta": {"delta": {"text": text}}},
+                {"contentBlockStop": {}},
+            ], "end_turn"
+        output_tokens = 0
+        for event in events:
+            output_tokens += tokens(event.get("contentBlockDelta", {}))
+            yield event
+        yield {"messageStop": {"stopReason": stop}}
+        yield {
+            "metadata": {
+                "usage": {
+                    "inputTokens": input_tokens,
+                    "outputTokens": output_tokens,
+                    "totalTokens": input_tokens + output_tokens,
+                },
+                "metrics": {"latencyMs": 0},
+            }
+        }
+
+    @staticmethod
+    def _tool_use(name: str, tool_input: dict, turn: int) -> list[dict]:
+        return [
+            {"contentBlockStart": {"start": {"toolUse": {"name": name, "toolUseId": f"{name}-{turn}"}}}},
+            {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(tool_input)}}}},
+            {"contentBlockStop": {}},
+        ]
+
+
+def assemble(agent: Agent):
+    """Build the report from the last UI check, as local mode does."""
+    for name, content in reversed(tool_results(agent)):
+        if name == "check_ui":
+            check = json.loads(content[0]["text"])
+            return Report(result=f"{check['element']} is visible", finish_activity=check["finished"])
+    return None
+
+
+async def run(mode: StructuredOutputMode, tool_calls: int) -> dict:
+    invocation.STRUCTURED_OUTPUT_MODES["benchmark"] = mode.value
+    agent = Agent(
+        model=ScriptedModel(tool_calls),
+        tools=[take_screenshot, check_ui],
+        system_prompt="You recover UI errors of RPA robots.",
+        callback_handler=None,
+    )
+    report = await invoke_structured(
+        "benchmark",
+        agent,
+        "The robot could not click Submit. Recover the activity.",
+        Report,
+        "Summarize the recovery into the report.",
+        assemble=assemble,
+    )
+    assert isinstance(report, Report), report
+    usage = agent.event_loop_metrics.accumulated_usage
+    return {
+        "calls": agent.event_loop_metrics.cycle_count,
+        "input": usage["inputTokens"],
+        "output": usage["outputTokens"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tool-calls", type=int, default=3, help="Tool calls before the answer")
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'mode':<12} {'calls':>6} {'input tokens':>13} {'output tokens':>14} {'saved':>7}")
+    for mode in StructuredOutputMode:
+        usage = asyncio.run(run(mode, args.tool_calls))
+        baseline = baseline or usage
+        saved = 1 - (usage["input"] + usage["output"]) / (baseline["input"] + baseline["output"])
+        print(
+            f"{mode.value:<12} {usage['calls']:>6} {usage['input']:>13} "
+            f"{usage['output']:>14} {saved:>7.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark the session timeline and per-module history queries on a large dataset.
+
+Fills a scratch Postgres database with synthetic recoveries (exceptions, their
+routing audits and module executions, spread over a year and across modules),
+then times the queries behind session timelines and per-module history, with the
+indexes of the schema (see database/migrations/0001_timestamptz_and_indexes.sql)
+and without them (dropped in a transaction that is rolled back):
+
+    python scripts/benchmark_timeline_queries.py postgresql://localhost/r2_bench \\
+        --exceptions 2000000
+
+The database is filled with synthetic rows: never point it at a real one.
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlmodel import SQLModel, create_engine
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gateway.models import Audit, Module, RobotException  # noqa: E402
+from modules.models import Execution  # noqa: E402
+
+TABLES = [Module, RobotException, Audit, Execution]
+
+# Indexes serving the queries below, dropped for the comparison
+INDEXES = [
+    "ix_robotexception_timestamp",
+    "ix_audit_exception_id_timestamp",
+    "ix_audit_module_id_timestamp",
+    "ix_execution_exception_id_timestamp_start",
+    "ix_execution_module_id_timestamp_start",
+]
+
+QUERIES = {
+    "session timeline": """
+        SELECT e.id, e.timestamp, a.timestamp, a.module_id, x.timestamp_start, x.timestamp_end
+        FROM robotexception e
+        JOIN audit a ON a.exception_id = e.id
+        LEFT JOIN execution x ON x.exception_id = e.id
+        WHERE e.id = :exception_id
+        ORDER BY a.timestamp, x.timestamp_start
+    """,
+    "module audits": """
+        SELECT id, timestamp, exception_id FROM audit
+        WHERE module_id = :module_id ORDER BY timestamp DESC LIMIT 50
+    """,
+    "module executions, last week": """
+        SELECT id, timestamp_start, timestamp_end FROM execution
+        WHERE module_id = :module_id
+          AND timestamp_start >= :until - interval '7 days' AND timestamp_start < :until
+        ORDER BY timestamp_start DESC
+    """,
+    "exceptions, last hour": """
+        SELECT id, timestamp, code FROM robotexception
+        WHERE timestamp >= :until - interval '1 hour' AND timestamp < :until
+        ORDER BY timestamp
+    """,
+}
+
+
+def populate(connection, exceptions: int, modules: int) -> None:
+    """Insert the synthetic recoveries, one audit and one execution per exception."""
+    connection.execute(
+        text(
+            """
+            INSERT INTO module (id, timestamp, name, description, enabled, routing_tool)
+            SELECT gen_random_uuid(), now(), 'Module ' || i, 'Benchmark module', true, 'module_' || i
+            FROM generate_series(1, :modules) AS i
+            """
+        ),
+        {"modules": modules},
+    )
+    connection.execute(
+        text(
+            """
+            CREATE TEMPORARY TABLE bench_module AS
+            SELECT row_number() OVER () AS n, id FROM module
+            """
+        )
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO robotexception (id, timestamp, code, exception_type, message)
+            SELECT gen_random_uuid(),
+                   now() - interval '365 days' * (1 - i::float / :exceptions),
+                   'click(selector=''#submit'')', 'ROBOT_EXCEPTION', 'Element not found'
+            FROM generate_series(1, :exceptions) AS i
+            """
+        ),
+        {"exceptions": exceptions},
+    )
+    for table, time_column, extra in (
+        ("audit", "timestamp", ", reasoning"),
+        ("execution", "timestamp_start", ", timestamp_end"),
+    ):
+        values = ", 'Routed by rule'" if table == "audit" else ", e.timestamp + interval '2 minutes'"
+        connection.execute(
+            text(
+                f"""
+                INSERT INTO {table} (id, {time_column}, exception_id, module_id{extra})
+                SELECT gen_random_uuid(), e.timestamp + interval '1 second', e.id, m.id{values}
+                FROM robotexception e
+                JOIN bench_module m ON m.n = 1 + abs(hashtext(e.id::text)) % :modules
+                """
+            ),
+            {"modules": modules},
+        )
+    connection.execute(text("ANALYZE"))
+
+
+def time_queries(connection, runs: int) -> dict[str, float]:
+    """Return the median time of each query, in milliseconds, with random parameters."""
+    modules = [row[0] for row in connection.execute(text("SELECT id FROM module"))]
+    exceptions = [
+        row[0]
+        for row in connection.execute(
+            text("SELECT id FROM robotexception TABLESAMPLE SYSTEM (1) LIMIT :runs"),
+            {"runs": runs},
+        )
+    ]
+    newest = connection.execute(text("SELECT max(timestamp) FROM robotexception")).scalar()
+    results = {}
+    for name, query in QUERIES.items():
+        times = []
+        for run in range(runs):
+            parameters = {
+                "exception_id": exceptions[run % len(exceptions)],
+                "module_id": random.choice(modules),
+                "until": newest - timedelta(days=random.uniform(0, 330)),
+            }
+            started = time.perf_counter()
+            connection.execute(text(query), parameters).fetchall()
+            times.append(time.perf_counter() - started)
+        results[name] = statistics.median(times) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("url", help="SQLAlchemy URL of a scratch Postgres database")
+    parser.add_argument("--exceptions", type=int, default=1_000_000)
+    parser.add_argument("--modules", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=20, help="Runs per query")
+    parser.add_argument("--reuse", action="store_true", help="Keep the rows of a previous run")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    tables = [model.__table__ for model in TABLES]
+    if not args.reuse:
+        SQLModel.metadata.drop_all(engine, tables=tables)
+    SQLModel.metadata.create_all(engine, tables=tables)
+
+    with engine.begin() as connection:
+        if not connection.execute(text("SELECT EXISTS (SELECT FROM robotexception)")).scalar():
+            started = time.perf_counter()
+            populate(connection, args.exceptions, args.modules)
+            print(f"Inserted {3 * args.exceptions:,} rows in {time.perf_counter() - started:.0f}s")
+
+    with engine.connect() as connection:
+        indexed = time_queries(connection, args.runs)
+        with connection.begin() as transaction:
+            for index in INDEXES:
+                connection.execute(text(f"DROP INDEX {index}"))
+            unindexed = time_queries(connection, args.runs)
+            transaction.rollback()
+
+    print(f"{'query':<30} {'indexed ms':>11} {'no index ms':>12}")
+    for name in QUERIES:
+        print(f"{name:<30} {indexed[name]:>11.2f} {unindexed[name]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark the robot wire protocols (see gateway.framing).
+
+Runs typical recovery traffic through each codec in memory: messages from the
+robot (an exception, action acks, screenshots) are decoded and validated into their
+models, messages to the robot (action commands) are encoded. Reports the messages
+per second and the bytes on the wire, raw and with permessage-deflate (approximated
+with zlib, as negotiated by uvicorn):
+
+    python scripts/benchmark_wire_protocols.py --screenshot-kb 400 --seconds 2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gateway.enums import WireProtocol  # noqa: E402
+from gateway.framing import CODECS, WireCodec  # noqa: E402
+from gateway.models import (  # noqa: E402
+    ActionAck,
+    ActionCommand,
+    CommandType,
+    RobotExceptionRequest,
+)
+
+
+class Wire:
+    """In-memory websocket collecting what a codec sends, as ASGI messages."""
+
+    def __init__(self):
+        self.messages: list[dict] = []
+
+    async def send_text(self, text: str) -> None:
+        self.messages.append({"type": "websocket.receive", "text": text})
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.messages.append({"type": "websocket.receive", "bytes": data})
+
+
+def traffic(screenshot: bytes) -> list[tuple[str, str, dict, Optional[type]]]:
+    """Messages of a recovery: kind, direction, message and the model it is validated into."""
+    command = ActionCommand(action=CommandType.CLICK, x=960.5, y=540.0)
+    exception = {
+        "code": "click(selector='#submit')",
+        "variables": {"invoice": "INV-2024-0117", "amount": 1299.5},
+        "details": {"stack": "Traceback (most recent call last): ..." * 8},
+        "message": "Element #submit not found",
+    }
+    return [
+        ("exception", "from_robot", {"type": "exception", "correlation_id": "7f1c2a", "content": exception}, RobotExceptionRequest),
+        ("action", "to_robot", {"type": "action", "correlation_id": "7f1c2a", "content": command.to_message()}, None),
+        ("action_done", "from_robot", {"type": "action_done", "correlation_id": "7f1c2a", "content": {"id": command.id, "duration": 0.31}}, ActionAck),
+        ("screenshot", "from_robot", {"type": "screenshot", "correlation_id": "7f1c2a", "content": screenshot}, None),
+    ]
+
+
+def encode(codec: WireCodec, message: dict, wire: Wire) -> None:
+    """Encode a message as the ASGI messages the receiving side gets."""
+    if codec.protocol == WireProtocol.JSON and message["type"] == "screenshot":
+        # Announced by a text message, followed by the binary frame
+        header = {key: value for key, value in message.items() if key != "content"}
+        asyncio.run(codec.send(wire, header))
+        wire.messages.append({"type": "websocket.receive", "bytes": message["content"]})
+    else:
+        asyncio.run(codec.send(wire, message))
+
+
+def measure(protocol: WireProtocol, direction: str, message: dict, model, seconds: float):
+    codec = CODECS[protocol]("session")
+    wire = Wire()
+    encode(codec, message, wire)
+    received = list(wire.messages)
+    sizes = [message.get("bytes") or message["text"].encode() for message in received]
+
+    loop = asyncio.new_event_loop()
+    count, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        if direction == "to_robot":
+            wire.messages.clear()
+            loop.run_until_complete(codec.send(wire, message))
+        else:
+            for asgi in received:
+                frame = codec.decode(asgi)
+                if frame is not None and model is not None:
+                    frame.validate(model)
+        count += 1
+    elapsed = time.perf_counter() - started
+    loop.close()
+    return (
+        count / elapsed,
+        sum(len(data) for data in sizes),
+        sum(len(zlib.compress(data)) for data in sizes),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--screenshot-kb", type=int, default=300)
+    parser.add_argument("--seconds", type=float, default=1.0, help="Per message and protocol")
+    args = parser.parse_args()
+
+    screenshot = os.urandom(args.screenshot_kb * 1024)  # Compressed data, like a JPEG
+    print(f"{'message':<12} {'protocol':<14} {'msg/s':>10} {'bytes':>9} {'deflated':>9}")
+    for kind, direction, message, model in traffic(screenshot):
+        for protocol in CODECS:
+            rate, size, deflated = measure(protocol, direction, message, model, args.seconds)
+            print(f"{kind:<12} {protocol.value:<14} {rate:>10.0f} {size:>9} {deflated:>9}")
+
+
+if __name__ == "__main__":
+    main()
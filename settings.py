@@ -10,7 +10,17 @@ POSTGRES_DB = os.getenv("POSTGRES_DB", "gateway")
 POSTGRES_USER = os.getenv("POSTGRES_USER", "user")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 
-POSTGRES_URL = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+POSTGRES_URL = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"  # Schema and migrations only
+POSTGRES_ASYNC_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+# Connection pool of the async engine (see database.general)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # Seconds to get a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "5000"))  # Milliseconds, 0 disables it
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))  # Seconds
 
 PROVIDER = os.getenv("PROVIDER", "")
 PROVIDER_API_KEY = os.getenv("PROVIDER_API_KEY", "")
@@ -21,6 +31,134 @@ PROVIDER_VISION_MODEL = os.getenv("PROVIDER_VISION_MODEL", "")
 PROVIDER_VISION_TOOL_MODEL = os.getenv("PROVIDER_VISION_TOOL_MODEL", "")
 PROVIDER_GROUNDING_MODEL = os.getenv("PROVIDER_GROUNDING_MODEL", "")
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "")
+OLLAMA_VISION_MODEL = os.getenv("OLLAMA_VISION_MODEL", "")
+OLLAMA_VISION_TOOL_MODEL = os.getenv("OLLAMA_VISION_TOOL_MODEL", "")
+OLLAMA_GROUNDING_MODEL = os.getenv("OLLAMA_GROUNDING_MODEL", "")
+
+# Provider failover chain of each model role (see providers.failover): comma
+# separated tiers among paid (PROVIDER_API_KEY), free (FREE_PROVIDER_API_KEY) and
+# local (Ollama). Tiers without credentials or model are skipped.
+PROVIDER_FAILOVER = {
+    role: os.getenv(f"PROVIDER_FAILOVER_{role.upper()}", default).lower().split(",")
+    for role, default in (
+        ("routing", "free,paid,local"),
+        ("planning", "free,paid,local"),
+        ("vision_tool", "free,paid,local"),
+        ("grounding", "paid,free,local"),
+    )
+}
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "30"))  # Seconds to first event
+PROVIDER_HEDGING = os.getenv("PROVIDER_HEDGING", "true").lower() == "true"
+PROVIDER_HEDGE_PERCENTILE = float(os.getenv("PROVIDER_HEDGE_PERCENTILE", "0.95"))
+PROVIDER_HEDGE_MIN_SAMPLES = int(os.getenv("PROVIDER_HEDGE_MIN_SAMPLES", "20"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Pooled HTTP clients shared by every LLM model (see providers.registry)
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))  # Keep-alive connections per host
+LLM_MAX_CONNECTIONS_PER_HOST = int(os.getenv("LLM_MAX_CONNECTIONS_PER_HOST", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
 
 UI_ERROR_PLANNING = os.getenv("UI_ERROR_PLANNING", "false").lower() == "true"
 UI_MID_AGENT = os.getenv("UI_MID_AGENT", "false").lower() == "true"
+
+# Structured output mode of each agent: two_pass, single_pass or local (see
+# gateway.enums.StructuredOutputMode). STRUCTURED_OUTPUT_MODE_<AGENT> overrides the default.
+STRUCTURED_OUTPUT_MODE = os.getenv("STRUCTURED_OUTPUT_MODE", "two_pass").lower()
+STRUCTURED_OUTPUT_MODES = {
+    agent: os.getenv(
+        f"STRUCTURED_OUTPUT_MODE_{agent.upper()}", STRUCTURED_OUTPUT_MODE
+    ).lower()
+    for agent in (
+        "gateway",
+        "ui_exception_handler",
+        "recovery_agent",
+        "recovery_plan_generator",
+        "step_execution_handler",
+    )
+}
+
+# Error intake queue (see gateway.intake)
+INTAKE_WORKERS = int(os.getenv("INTAKE_WORKERS", "4"))
+INTAKE_QUEUE_SIZE = int(os.getenv("INTAKE_QUEUE_SIZE", "1000"))
+INTAKE_DEFAULT_PRIORITY = int(os.getenv("INTAKE_DEFAULT_PRIORITY", "5"))
+INTAKE_JOB_RETENTION = int(os.getenv("INTAKE_JOB_RETENTION", "10000"))
+
+# Multiplexed robot connections (see gateway.sessions)
+ROBOT_SESSION_MAX_CONCURRENCY = int(os.getenv("ROBOT_SESSION_MAX_CONCURRENCY", "4"))
+ROBOT_HEARTBEAT_INTERVAL = float(os.getenv("ROBOT_HEARTBEAT_INTERVAL", "15"))
+ROBOT_HEARTBEAT_TIMEOUT = float(os.getenv("ROBOT_HEARTBEAT_TIMEOUT", "45"))
+ROBOT_ACTION_TIMEOUT = float(os.getenv("ROBOT_ACTION_TIMEOUT", "30"))  # Seconds to wait for an action ack
+
+# Coalescing of identical concurrent exceptions (see gateway.coalescing)
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+COALESCING_TTL = float(os.getenv("COALESCING_TTL", "30"))
+
+# Deadline and token budget of a recovery session (see gateway.budget)
+RECOVERY_DEADLINE = float(os.getenv("RECOVERY_DEADLINE", "300"))  # Seconds from intake
+RECOVERY_TOKEN_BUDGET = int(os.getenv("RECOVERY_TOKEN_BUDGET", "0"))  # 0 is unlimited
+
+# In-memory module registry (see gateway.module_registry)
+MODULE_REGISTRY_NOTIFY = os.getenv("MODULE_REGISTRY_NOTIFY", "true").lower() == "true"  # Postgres LISTEN/NOTIFY
+MODULE_REGISTRY_POLL_INTERVAL = float(os.getenv("MODULE_REGISTRY_POLL_INTERVAL", "60"))  # Seconds
+
+# Write-behind recorder of the recovery trace (see gateway.trace)
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "500"))  # Rows that trigger a flush
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "1.0"))  # Seconds
+TRACE_MAX_BUFFER = int(os.getenv("TRACE_MAX_BUFFER", "10000"))  # Rows
+TRACE_BACKPRESSURE_TIMEOUT = float(os.getenv("TRACE_BACKPRESSURE_TIMEOUT", "0.5"))  # Seconds
+
+# Content-addressed screenshot store (see agent_tools.screenshot_store)
+SCREENSHOT_STORE_ENABLED = os.getenv("SCREENSHOT_STORE_ENABLED", "true").lower() == "true"
+SCREENSHOT_STORE_PATH = os.getenv("SCREENSHOT_STORE_PATH", "screenshots")
+SCREENSHOT_STORE_MAX_BYTES = int(os.getenv("SCREENSHOT_STORE_MAX_BYTES", str(2 * 1024**3)))  # 0 is unlimited
+SCREENSHOT_STORE_RETENTION_DAYS = float(os.getenv("SCREENSHOT_STORE_RETENTION_DAYS", "30"))  # 0 keeps them forever
+SCREENSHOT_NEAR_DUPLICATE_DISTANCE = int(os.getenv("SCREENSHOT_NEAR_DUPLICATE_DISTANCE", "3"))  # dHash bits, 0 disables
+
+# Screenshot change detection (see agent_tools.image.detect_change)
+IMAGE_SIMILARITY_THRESHOLD = float(os.getenv("IMAGE_SIMILARITY_THRESHOLD", "0.95"))  # SSIM under which the UI changed
+IMAGE_COMPARE_MAD_UNCHANGED = float(os.getenv("IMAGE_COMPARE_MAD_UNCHANGED", "0.5"))  # Gray levels, thumbnail difference with no change
+IMAGE_COMPARE_MAD_CHANGED = float(os.getenv("IMAGE_COMPARE_MAD_CHANGED", "12"))  # Gray levels, thumbnail difference that is a change
+IMAGE_COMPARE_SSIM_REDUCTION = int(os.getenv("IMAGE_COMPARE_SSIM_REDUCTION", "4"))  # 1, 2, 4 or 8
+# Share of comparisons also checked with full resolution SSIM to check the tiers agree
+IMAGE_COMPARE_SHADOW_RATE = float(os.getenv("IMAGE_COMPARE_SHADOW_RATE", "0.01"))  # 0 disables
+
+# Worker pool for CPU-bound image work (see agent_tools.image_service)
+IMAGE_EXECUTOR = os.getenv("IMAGE_EXECUTOR", "thread")  # thread or process
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMAGE_MAX_QUEUE = int(os.getenv("IMAGE_MAX_QUEUE", "32"))  # Operations queued or running
+IMAGE_QUEUE_TIMEOUT = float(os.getenv("IMAGE_QUEUE_TIMEOUT", "5"))  # Seconds required work waits for a slot
+
+# Screenshot preparation of each model role (see agent_tools.image_prep): pixel
+# budget, codec (jpeg, png or webp), quality and pixels per image token of its
+# models. IMAGE_<SETTING>_<ROLE> overrides the role default.
+IMAGE_PROFILES = {
+    role: {
+        "max_pixels": int(os.getenv(f"IMAGE_MAX_PIXELS_{role.upper()}", max_pixels)),
+        "format": os.getenv(f"IMAGE_FORMAT_{role.upper()}", codec).lower(),
+        "quality": int(os.getenv(f"IMAGE_QUALITY_{role.upper()}", quality)),
+        "pixels_per_token": int(
+            os.getenv(f"IMAGE_PIXELS_PER_TOKEN_{role.upper()}", pixels_per_token)
+        ),
+    }
+    for role, max_pixels, codec, quality, pixels_per_token in (
+        ("planning", "1150000", "jpeg", "75", "750"),
+        ("vision_tool", "1150000", "jpeg", "80", "750"),
+        ("grounding", str(16384 * 28 * 28), "jpeg", "90", "784"),  # UI-TARS native budget
+    )
+}
+
+# Screenshots reused until the robot runs an action (see agent_tools.frame_cache)
+SCREENSHOT_CACHE_MAX_AGE = float(os.getenv("SCREENSHOT_CACHE_MAX_AGE", "2"))  # Seconds, 0 disables
+# Seconds to wait for the screenshot a robot pushes after an action, before pulling one
+SCREENSHOT_PUSH_WAIT = float(os.getenv("SCREENSHOT_PUSH_WAIT", "1.0"))
+
+# Share of UI-TARS responses also parsed by the reference parser to check they agree
+UITARS_PARSER_SHADOW_RATE = float(os.getenv("UITARS_PARSER_SHADOW_RATE", "0.01"))  # 0 disables
+# Dispatch grounded actions as soon as they are complete in the streamed response
+GROUNDING_EARLY_DISPATCH = os.getenv("GROUNDING_EARLY_DISPATCH", "true").lower() == "true"
+# Run every action of a grounding response, instead of only the first one
+GROUNDING_BATCH_ACTIONS = os.getenv("GROUNDING_BATCH_ACTIONS", "true").lower() == "true"
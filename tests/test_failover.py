@@ -0,0 +1,71 @@
+"""Provider failover: hedged requests and the requests they hedge."""
+
+import asyncio
+
+import pytest
+
+from providers import failover
+from providers.enums import ModelRole
+from providers.failover import CircuitBreaker, Endpoint, FailoverModel
+
+
+class FakeModel:
+    """Answers its name after a delay, or fails."""
+
+    def __init__(self, name: str, delay: float, fail: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+
+    async def stream(self, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(self.name)
+        yield self.name
+
+
+def chain(*models: FakeModel) -> FailoverModel:
+    endpoints = []
+    for model in models:
+        endpoint = Endpoint(model.name, model, CircuitBreaker(model.name))
+        endpoint.latencies.extend([0.01] * 50)  # Hedged after 10ms
+        endpoints.append(endpoint)
+    return FailoverModel(ModelRole.GROUNDING, endpoints)
+
+
+async def answer(model: FailoverModel) -> list:
+    return [event async for event in model.stream([])]
+
+
+@pytest.mark.parametrize(
+    "models,answered_by,wins",
+    [
+        # The duplicate answers before the slow request
+        ([FakeModel("a", 0.3), FakeModel("b", 0.02)], "b", 1),
+        # The slow request still answers first
+        ([FakeModel("a", 0.05), FakeModel("b", 0.3)], "a", 0),
+        # The slow request fails: the duplicate answers as a failover, not a win
+        ([FakeModel("a", 0.03, fail=True), FakeModel("b", 0.1)], "b", 0),
+    ],
+    ids=["duplicate_wins", "original_wins", "original_fails"],
+)
+def test_hedge_wins(monkeypatch, models, answered_by, wins):
+    monkeypatch.setattr(failover, "PROVIDER_HEDGING", True)
+    hedges = failover.hedges.value(role="grounding")
+    hedge_wins = failover.hedge_wins.value(role="grounding")
+
+    assert asyncio.run(answer(chain(*models))) == [answered_by]
+    assert failover.hedges.value(role="grounding") == hedges + 1
+    assert failover.hedge_wins.value(role="grounding") == hedge_wins + wins
+
+
+def test_hedge_of_a_failover_endpoint(monkeypatch):
+    monkeypatch.setattr(failover, "PROVIDER_HEDGING", True)
+    model = chain(FakeModel("a", 0), FakeModel("b", 0.05), FakeModel("c", 0.3))
+    for _ in range(model.endpoints[0].breaker.failure_threshold):  # Open a
+        model.endpoints[0].breaker.record_failure()
+    hedge_wins = failover.hedge_wins.value(role="grounding")
+
+    # b is hedged with c, and answers first
+    assert asyncio.run(answer(model)) == ["b"]
+    assert failover.hedge_wins.value(role="grounding") == hedge_wins
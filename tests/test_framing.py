@@ -0,0 +1,76 @@
+"""Robot wire protocols: messages and screenshots survive both codecs."""
+
+import asyncio
+
+import pytest
+
+from gateway.enums import WireProtocol
+from gateway.framing import CODECS, Frame, FrameError, JsonCodec, WireCodec
+from gateway.models import RobotExceptionRequest
+
+
+class Wire:
+    """Collects what a codec sends, as ASGI messages."""
+
+    def __init__(self):
+        self.messages: list[dict] = []
+
+    async def send_text(self, text: str) -> None:
+        self.messages.append({"type": "websocket.receive", "text": text})
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.messages.append({"type": "websocket.receive", "bytes": data})
+
+
+def transmit(codec: WireCodec, *messages: dict) -> list[Frame]:
+    wire = Wire()
+    for message in messages:
+        asyncio.run(codec.send(wire, message))
+    decoded = [codec.decode(message) for message in wire.messages]
+    return [frame for frame in decoded if frame is not None]
+
+
+@pytest.mark.parametrize("protocol", list(CODECS))
+def test_message_round_trip(protocol):
+    message = {
+        "type": "exception",
+        "correlation_id": "job-1",
+        "content": {"code": "click()", "variables": {"a": 1}, "details": None},
+    }
+    (frame,) = transmit(CODECS[protocol]("session"), message)
+    assert frame.type == "exception"
+    assert frame.correlation_id == "job-1"
+    assert frame.to_message() == message
+    assert frame.validate(RobotExceptionRequest).variables == {"a": 1}
+
+
+@pytest.mark.parametrize("protocol", list(CODECS))
+def test_screenshot_round_trip(protocol):
+    codec = CODECS[protocol]("session")
+    image = bytes(range(256)) * 64
+    if protocol == WireProtocol.JSON:
+        # Announced by a text message, followed by the binary frame
+        messages = [{"type": "screenshot", "correlation_id": "job-1"}]
+        frames = transmit(codec, *messages) + [
+            codec.decode({"type": "websocket.receive", "bytes": image})
+        ]
+    else:
+        frames = transmit(
+            codec, {"type": "screenshot", "correlation_id": "job-1", "content": image}
+        )
+    (frame,) = frames
+    assert frame.type == "screenshot"
+    assert frame.correlation_id == "job-1"
+    assert frame.payload == image
+
+
+def test_malformed_frames_are_rejected():
+    with pytest.raises(FrameError):
+        Frame.decode(b"\xc1not msgpack")
+    with pytest.raises(FrameError):
+        JsonCodec().decode({"type": "websocket.receive", "text": "[1]"})
+
+
+def test_wire_codec_is_abstract():
+    with pytest.raises(TypeError):
+        WireCodec()
@@ -0,0 +1,181 @@
+"""Streamed grounding: actions are dispatched as soon as they are complete, in batches."""
+
+import asyncio
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from agent_tools.image_prep import ROLE_IMAGE_PROFILES, prepare_image
+from modules.uierror import grounding
+from gateway.models import ActionAck
+from modules.uierror.grounding import send_actions, stream_grounding
+from modules.uierror.uitars import parse_actions
+from providers.enums import ModelRole
+
+CHUNK_DELAY = 0.02
+
+
+class StreamingAgent:
+    """Streams a response in chunks, like the grounding model."""
+
+    def __init__(self, chunks: list[str]):
+        self.chunks = chunks
+        self.finished_at = None
+
+    async def stream_async(self, prompt):
+        for chunk in self.chunks:
+            await asyncio.sleep(CHUNK_DELAY)
+            yield {"data": chunk}
+        self.finished_at = time.perf_counter()
+        message = {"content": [{"text": "".join(self.chunks)}]}
+        yield {"result": SimpleNamespace(message=message)}
+
+
+def screenshot():
+    buffer = BytesIO()
+    Image.new("RGB", (1920, 1080), (240, 240, 240)).save(buffer, format="PNG")
+    return prepare_image(buffer.getvalue(), ROLE_IMAGE_PROFILES[ModelRole.GROUNDING])
+
+
+def ground(chunks: list[str]):
+    """Run a grounding request, returning its outcome, the dispatches and the agent."""
+    agent = StreamingAgent(chunks)
+    dispatched = []
+
+    async def dispatch(actions, code):
+        dispatched.append((time.perf_counter(), [a.action_type.value for a in actions]))
+
+    grounded = asyncio.run(
+        stream_grounding(agent, "prompt", screenshot(), dispatch, (1080, 1920))
+    )
+    return grounded, dispatched, agent
+
+
+def count(histogram, **labels) -> int:
+    key = ",".join(f"{key}={value}" for key, value in sorted(labels.items()))
+    return histogram.snapshot().get(key, {}).get("count", 0)
+
+
+# The action completes halfway through the stream, the rest is trailing output
+CLICK = [
+    "Thought: Open the ",
+    "File menu.\nAction: click(",
+    "start_box='(120,",
+    "40)')",
+    "\n",
+    "\n",
+    "\n",
+    "\n",
+]
+
+
+def test_action_is_dispatched_before_the_response_ends():
+    early = count(grounding.time_to_action, path="early")
+    leads = count(grounding.early_lead)
+
+    grounded, dispatched, agent = ground(CLICK)
+
+    assert grounded.early and grounded.error is None
+    assert [types for _, types in dispatched] == [["click"]]
+    assert dispatched[0][0] < agent.finished_at - 3 * CHUNK_DELAY
+    assert count(grounding.time_to_action, path="early") == early + 1
+    assert count(grounding.early_lead) == leads + 1
+
+
+def test_without_early_dispatch_the_action_waits_for_the_response(monkeypatch):
+    monkeypatch.setattr(grounding, "GROUNDING_EARLY_DISPATCH", False)
+    full = count(grounding.time_to_action, path="full")
+
+    grounded, dispatched, agent = ground(CLICK)
+
+    assert not grounded.early
+    assert dispatched[0][0] >= agent.finished_at
+    assert count(grounding.time_to_action, path="full") == full + 1
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "type(content='Total (net)')",
+        "type(content='He said \"hi\" (twice)')",
+    ],
+)
+def test_free_text_waits_for_the_response(text):
+    chunks = ["Thought: Type it.\nAction: ", text[:12], text[12:], "\n", "\n"]
+
+    grounded, dispatched, agent = ground(chunks)
+
+    assert not grounded.early
+    assert [types for _, types in dispatched] == [["type"]]
+    assert dispatched[0][0] >= agent.finished_at
+
+
+# Click a field, then type its value: one grounding call instead of two
+CLICK_AND_TYPE = [
+    "Thought: Fill the invoice number.\nAction: click(start_box='(300,",
+    "210)')\n\n",
+    "type(content='INV-2024-0117')",
+    "\n",
+]
+
+
+def test_every_action_of_a_response_runs_from_one_call():
+    saved = grounding.calls_saved.total()
+    batches = count(grounding.batch_size)
+
+    grounded, dispatched, _ = ground(CLICK_AND_TYPE)
+
+    assert grounded.error is None
+    assert [types for _, types in dispatched] == [["click"], ["type"]]
+    assert [action.action_type.value for action in grounded.actions] == ["click", "type"]
+    assert grounding.calls_saved.total() == saved + 1
+    assert count(grounding.batch_size) == batches + 1
+
+
+def test_without_batches_only_the_first_action_runs(monkeypatch):
+    monkeypatch.setattr(grounding, "GROUNDING_BATCH_ACTIONS", False)
+    saved = grounding.calls_saved.total()
+
+    grounded, dispatched, _ = ground(CLICK_AND_TYPE)
+
+    assert [types for _, types in dispatched] == [["click"]]
+    assert grounding.calls_saved.total() == saved
+
+
+class NativeChannel:
+    """Robot running native actions, failing the actions listed in `fail`."""
+
+    native_actions = True
+
+    def __init__(self, fail: set[int] = frozenset()):
+        self.fail = fail
+        self.batches = []
+
+    async def run_actions(self, commands, timeout):
+        self.batches.append([command.action.value for command in commands])
+        acks = []
+        for index, command in enumerate(commands):
+            acks.append(ActionAck(id=command.id, ok=index not in self.fail))
+            if index in self.fail:
+                break  # The robot skips the rest of the batch
+        return acks
+
+
+def batch():
+    text = "".join(CLICK_AND_TYPE).strip() + "\n\nhotkey(key='enter')"
+    return parse_actions(text, 1080, 1920)
+
+
+def test_native_batch_is_sent_in_one_message():
+    channel = NativeChannel()
+    asyncio.run(send_actions(channel, batch(), "code", (1080, 1920)))
+    assert channel.batches == [["click", "type", "hotkey"]]
+
+
+def test_native_batch_stops_at_the_first_failed_action():
+    channel = NativeChannel(fail={1})
+    with pytest.raises(RuntimeError, match="action 2 of 3"):
+        asyncio.run(send_actions(channel, batch(), "code", (1080, 1920)))
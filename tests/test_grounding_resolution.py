@@ -0,0 +1,102 @@
+"""Grounded clicks land on the robot screen, whatever its resolution and scaling."""
+
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from agent_tools.image_prep import ROLE_IMAGE_PROFILES, ImageProfile, prepare_image
+from gateway.models import CommandType, ScreenInfo
+from gateway.sessions import RobotChannel
+from modules.uierror.grounding import screen_size
+from modules.uierror.uitars import action_command, parse_actions, resize_geometry
+from providers.enums import ModelRole
+
+# (screenshot width, screenshot height, display scale)
+RESOLUTIONS = [
+    (1920, 1080, 1.0),
+    (2560, 1440, 1.0),
+    (2880, 1800, 2.0),
+    (3840, 2160, 1.0),
+    (1280, 1024, 1.0),
+]
+
+PROFILES = {
+    "grounding": ROLE_IMAGE_PROFILES[ModelRole.GROUNDING],
+    "downscaled": ImageProfile(max_pixels=1150000),
+}
+
+
+class Channel(RobotChannel):
+    """Robot channel that only reports its screen."""
+
+    def __init__(self, screen=None):
+        super().__init__()
+        self.screen = screen
+
+    async def _send_json(self, data: dict) -> None:
+        pass
+
+    async def receive_bytes(self) -> bytes:
+        return b""
+
+    async def receive_json(self) -> dict:
+        return {}
+
+
+def screenshot(width: int, height: int) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (240, 240, 240)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("profile", PROFILES.values(), ids=PROFILES.keys())
+@pytest.mark.parametrize(
+    "width,height,scale", RESOLUTIONS, ids=[f"{w}x{h}@{s:g}" for w, h, s in RESOLUTIONS]
+)
+def test_click_lands_on_logical_target(width, height, scale, profile):
+    image = prepare_image(screenshot(width, height), profile)
+    assert (image.height, image.width) == resize_geometry(
+        height, width, profile.factor, profile.min_pixels, profile.max_pixels
+    )
+    assert image.width % profile.factor == 0 and image.height % profile.factor == 0
+    assert image.width * image.height <= profile.max_pixels
+
+    # A button at 3/4 of the logical screen, seen by the model in the resized image
+    logical_width, logical_height = round(width / scale), round(height / scale)
+    target_x, target_y = logical_width * 0.75, logical_height * 0.25
+    model_x = round(target_x * scale * image.width / width)
+    model_y = round(target_y * scale * image.height / height)
+
+    actions = parse_actions(
+        f"Thought: Click the button.\nAction: click(start_box='({model_x},{model_y})')",
+        **image.parse_kwargs(),
+    )
+    screen = screen_size(Channel(ScreenInfo(scale=scale)), image)
+    assert screen == (logical_height, logical_width)
+
+    command = action_command(actions[0], *screen)
+    assert command.action == CommandType.CLICK
+    # Within the rounding of the model coordinates to resized pixels
+    tolerance = width / image.width / scale
+    assert command.x == pytest.approx(target_x, abs=tolerance)
+    assert command.y == pytest.approx(target_y, abs=tolerance)
+
+
+@pytest.mark.parametrize(
+    "width,height,scale", RESOLUTIONS, ids=[f"{w}x{h}@{s:g}" for w, h, s in RESOLUTIONS]
+)
+def test_screen_size(width, height, scale):
+    logical = (round(height / scale), round(width / scale))
+    # Reported scale, reported logical size, or nothing reported (unscaled screenshots)
+    assert Channel(ScreenInfo(scale=scale)).screen_size(width, height) == logical
+    reported = ScreenInfo(width=logical[1], height=logical[0], scale=scale)
+    assert Channel(reported).screen_size(width, height) == logical
+    assert Channel().screen_size(width, height) == (height, width)
+
+
+def test_resize_geometry_is_cached():
+    resize_geometry.cache_clear()
+    for _ in range(3):
+        resize_geometry(1080, 1920)
+    assert resize_geometry.cache_info().hits == 2
@@ -0,0 +1,114 @@
+"""Module registry: enabling or disabling a module applies without a restart."""
+
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from agent_tools.links import ToolModuleLink
+from agent_tools.models import Tool
+from database.general import get_session
+from gateway.models import Module, RoutingRule
+from gateway.module_registry import ModuleRegistry
+from gateway.router import router
+
+TABLES = [
+    Module.__table__,
+    RoutingRule.__table__,
+    Tool.__table__,
+    ToolModuleLink.__table__,
+]
+
+
+async def create_modules(engine) -> tuple[Module, Module]:
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all, tables=TABLES)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        ui = Module(name="UI", description="UI errors", routing_tool="ui_error")
+        data = Module(name="Data", description="Data errors", routing_tool="data_error")
+        session.add_all([ui, data])
+        await session.commit()
+    return ui, data
+
+
+def test_disabling_a_module_through_the_api_applies_without_restart(
+    tmp_path, monkeypatch
+):
+    async def run():
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'modules.db'}", poolclass=NullPool
+        )
+        ui, data = await create_modules(engine)
+
+        registry = ModuleRegistry(notify=False, poll_interval=3600)
+        monkeypatch.setattr("gateway.router.module_registry", registry)
+        await registry.start(engine)
+
+        async def session_override():
+            async with AsyncSession(engine) as session:
+                yield session
+
+        app = FastAPI()
+        app.include_router(router)
+        app.dependency_overrides[get_session] = session_override
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://gateway"
+            ) as client:
+                assert registry.is_enabled("ui_error")
+                modules = (await client.get("/api/v1/modules")).json()
+                assert {module["name"] for module in modules} == {"UI", "Data"}
+
+                response = await client.patch(
+                    f"/api/v1/modules/{ui.id}", json={"enabled": False}
+                )
+                assert response.status_code == 200
+                assert response.json()["enabled"] is False
+
+                assert not registry.is_enabled("ui_error")
+                assert registry.is_enabled("data_error")
+                assert registry.module_id("ui_error") is None
+                assert registry.routing_tools() == frozenset({"data_error"})
+                modules = (await client.get("/api/v1/modules")).json()
+                assert [module["name"] for module in modules] == ["Data"]
+
+                await client.patch(f"/api/v1/modules/{ui.id}", json={"enabled": True})
+                assert registry.is_enabled("ui_error")
+        finally:
+            await registry.stop()
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_changes_written_elsewhere_apply_on_refresh(tmp_path):
+    async def run():
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'modules.db'}", poolclass=NullPool
+        )
+        ui, _ = await create_modules(engine)
+
+        registry = ModuleRegistry(notify=False, poll_interval=3600)
+        await registry.start(engine)
+        try:
+            # Another gateway disables the module
+            async with AsyncSession(engine) as session:
+                module = await session.get(Module, ui.id)
+                module.enabled = False
+                session.add(module)
+                await session.commit()
+            assert registry.is_enabled("ui_error")  # Until notified or polled
+
+            await registry.refresh("notify")
+            assert not registry.is_enabled("ui_error")
+            assert [module["name"] for module in await registry.modules()] == ["Data"]
+        finally:
+            await registry.stop()
+            await engine.dispose()
+
+    asyncio.run(run())
@@ -0,0 +1,43 @@
+"""Screenshot store: concurrent puts of the same screenshot store it once, as a duplicate."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from agent_tools import screenshot_store as store_module
+from agent_tools.screenshot_store import ScreenshotStore
+
+
+def screenshot() -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (320, 200), (30, 90, 200)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_concurrent_duplicates_are_stored_once(tmp_path, monkeypatch):
+    store = ScreenshotStore(root=str(tmp_path), near_duplicate_distance=3)
+    # Both puts hash the screenshot, outside the lock, before either one stores it
+    barrier = threading.Barrier(2)
+    dhash = store_module.dhash
+
+    def synchronized_dhash(data):
+        barrier.wait(timeout=5)
+        return dhash(data)
+
+    monkeypatch.setattr(store_module, "dhash", synchronized_dhash)
+
+    data = screenshot()
+    duplicates = store_module.stored.value(result="duplicate")
+    near_duplicates = store_module.stored.value(result="near_duplicate")
+    with ThreadPoolExecutor(2) as executor:
+        refs = list(executor.map(store._put, [data, data]))
+
+    assert refs[0] == refs[1]
+    assert len(store._entries) == 1
+    assert store._size == len(data)
+    assert len(list(tmp_path.rglob("*.tmp"))) == 0
+    # Found by its digest, without comparing hashes
+    assert store_module.stored.value(result="duplicate") == duplicates + 1
+    assert store_module.stored.value(result="near_duplicate") == near_duplicates
@@ -0,0 +1,113 @@
+"""Multiplexed robot sessions: exceptions are queued without blocking the reader."""
+
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from gateway import sessions
+from gateway.sessions import RobotChannel, RobotSession
+
+
+class FakeWebSocket:
+    """ASGI websocket fed by the test."""
+
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent: list[dict] = []
+        self.message_sent = asyncio.Event()
+
+    def receive_from_robot(self, message: dict) -> None:
+        self.incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+
+    def disconnect(self) -> None:
+        self.incoming.put_nowait({"type": "websocket.disconnect"})
+
+    async def receive(self) -> dict:
+        return await self.incoming.get()
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(json.loads(text))
+        self.message_sent.set()
+
+    async def close(self) -> None:
+        self.disconnect()
+
+    async def wait_for(self, type: str, correlation_id: str) -> dict:
+        while True:
+            for message in self.sent:
+                if message["type"] == type and message.get("correlation_id") == correlation_id:
+                    return message
+            self.message_sent.clear()
+            await asyncio.wait_for(self.message_sent.wait(), 1)
+
+
+class FakeJob:
+    def __init__(self):
+        self.id = uuid.uuid4()
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    async def wait(self) -> dict:
+        return await self.result
+
+
+def exception(correlation_id: str) -> dict:
+    return {
+        "type": "exception",
+        "correlation_id": correlation_id,
+        "content": {"code": "click()", "variables": None, "details": None},
+    }
+
+
+def test_slow_submit_does_not_block_other_recoveries(monkeypatch):
+    async def run():
+        committed = asyncio.Event()  # The database commit of the slow exception
+        submit_cancelled = asyncio.Event()
+        jobs: dict[str, FakeJob] = {}
+        cancelled_jobs = []
+
+        async def submit(request, websocket=None):
+            if websocket.correlation_id == "slow":
+                try:
+                    await committed.wait()
+                except asyncio.CancelledError:
+                    submit_cancelled.set()
+                    raise
+            jobs[websocket.correlation_id] = FakeJob()
+            return jobs[websocket.correlation_id]
+
+        monkeypatch.setattr(sessions.intake_queue, "submit", submit)
+        monkeypatch.setattr(
+            sessions.intake_queue,
+            "cancel",
+            lambda job_id, reason: cancelled_jobs.append(job_id),
+        )
+
+        websocket = FakeWebSocket()
+        session = RobotSession(websocket, heartbeat_interval=60, heartbeat_timeout=60)
+        reader = asyncio.create_task(session.run())
+
+        websocket.receive_from_robot(exception("slow"))
+        websocket.receive_from_robot(exception("fast"))
+        accepted = await websocket.wait_for("accepted", "fast")
+        assert accepted["content"]["id"] == str(jobs["fast"].id)
+        assert "slow" not in jobs and set(session.channels) == {"slow", "fast"}
+
+        # Results are delivered while the slow exception is still being written
+        jobs["fast"].result.set_result({"status": "ok"})
+        done = await websocket.wait_for("done", "fast")
+        assert done["content"] == {"status": "ok"}
+
+        websocket.disconnect()
+        await asyncio.wait_for(reader, 1)
+        await asyncio.wait_for(submit_cancelled.wait(), 1)
+        assert cancelled_jobs == []  # The slow exception was never queued
+        assert session.channels == {}
+
+    asyncio.run(run())
+
+
+def test_robot_channel_is_abstract():
+    with pytest.raises(TypeError):
+        RobotChannel()
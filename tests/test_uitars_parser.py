@@ -0,0 +1,32 @@
+"""The UI-TARS parser agrees with the reference parser on a corpus of responses."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from modules.uierror.uitars import parse_action_to_structure_output, parse_actions
+
+CORPUS = json.loads((Path(__file__).parent / "data" / "uitars_responses.json").read_text())
+
+# qwen25vl answers in absolute coordinates of the resized screenshot, other
+# models in coordinates relative to the factor
+MODEL_TYPES = ["qwen25vl", "doubao"]
+
+
+def parse(parser, text: str, model_type: str):
+    try:
+        return parser(text, 1080, 1920, model_type=model_type)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("model_type", MODEL_TYPES)
+@pytest.mark.parametrize("text", CORPUS)
+def test_matches_reference_parser(text, model_type):
+    expected = parse(parse_action_to_structure_output, text, model_type)
+    actions = parse(parse_actions, text, model_type)
+    if isinstance(expected, type):
+        assert isinstance(actions, type), "the reference parser rejects the response"
+    else:
+        assert [action.to_dict(legacy=True) for action in actions] == expected